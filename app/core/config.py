@@ -11,10 +11,34 @@ class CharacterConfig(BaseModel):
     active_card_id: Optional[int] = None
     active_lorebook: str = "Default" # V2 Lorebook
 
+class LLMBackendConfig(BaseModel):
+    base_url: str
+    api_key: str = "none"
+    model: Optional[str] = None # Defaults to llm.model
+    max_concurrency: int = 1
+
+class ResponseCacheConfig(BaseModel):
+    enabled: bool = False
+    max_bytes: int = 8 * 1024 * 1024
+    ttl_seconds: float = 600.0
+
 class LLMConfig(BaseModel):
     base_url: str
     api_key: str
     model: str
+    max_concurrency: int = 1 # In-flight requests allowed on base_url
+    backends: list[LLMBackendConfig] = [] # Extra servers pooled with base_url
+    eject_after_failures: int = 3 # Consecutive failures before a backend is taken out
+    eject_seconds: float = 30.0
+    response_cache: ResponseCacheConfig = ResponseCacheConfig()
+    max_prompt_tokens: int = 4096 # Assembled prompts are trimmed to fit
+    tokenizer: str = "heuristic" # "heuristic" or "tiktoken" (optional package)
+    connect_timeout: float = 5.0 # Seconds
+    read_timeout: float = 120.0 # Seconds without a byte from the backend
+    max_retries: int = 2 # Extra attempts on connection errors / timeouts / 5xx
+    retry_base_delay: float = 0.5 # Backoff base, jittered
+    breaker_failure_threshold: int = 5 # Failed generations in a row before failing fast
+    breaker_reset_seconds: float = 30.0 # How long to fail fast before trying again
 
 class NgrokConfig(BaseModel):
     authtoken: str | None = None
@@ -30,14 +54,51 @@ class RoomConfig(BaseModel):
     discovery_api_url: str | None = None
     auto_announce: bool = False
     allow_guest_lore_updates: bool = True
+    max_concurrent_generations: Optional[int] = None # None = total LLM backend capacity
 
 class SecurityConfig(BaseModel):
     ngrok_basic_auth: str | None = None
     api_key: str | None = None
 
+class TranslationCacheConfig(BaseModel):
+    enabled: bool = True
+    memory_entries: int = 2048 # In-process LRU size
+    max_db_entries: int = 50000 # Oldest (by last use) are pruned beyond this
+
+class TranslationBackendConfig(BaseModel):
+    name: str # "google", "offline" or "stub"
+    timeout: float = 5.0 # Seconds per call before failing over
+    max_concurrency: int = 4
+    breaker_failure_threshold: int = 3 # Failures in a row before the backend is skipped
+    breaker_reset_seconds: float = 60.0
+
 class TranslationConfig(BaseModel):
     enabled: bool = False
     target_lang: str = "ja"
+    cache: TranslationCacheConfig = TranslationCacheConfig()
+    max_concurrency: int = 4 # Parallel requests to the translation service
+    backends: list[TranslationBackendConfig] = [TranslationBackendConfig(name="google")] # Tried in order
+
+class LoreConfig(BaseModel):
+    token_budget: int = 1024 # Max tokens of lore per turn (0 = unlimited)
+    scan_depth: int = 2 # Keyword passes: the message, then the content of matched entries
+    semantic: bool = False # Also pick entries by embedding similarity (needs numpy)
+    semantic_top_k: int = 3
+    semantic_min_score: float = 0.25 # Cosine similarity
+    embedding_dim: int = 512
+
+class DatabaseConfig(BaseModel):
+    # SQLite pragmas, applied to every new connection
+    journal_mode: str = "wal" # Readers don't block the writer; "delete" is SQLite's old default. Stored in logs.sqlite itself; back up its -wal/-shm files too (see README)
+    synchronous: str = "normal" # With WAL: no fsync per commit, a power cut may lose the last ones
+    cache_size_kb: int = 16384 # Page cache per connection
+    mmap_size_mb: int = 128 # Memory-mapped reads, 0 = off
+    busy_timeout_ms: int = 5000 # Wait this long for a lock before "database is locked"
+    temp_store: str = "memory" # Temp tables and sort spill files
+    # Connection pool
+    pool_size: int = 5 # Connections kept open
+    max_overflow: int = 10 # Extra connections under load, closed when returned
+    pool_timeout: float = 30.0 # Seconds to wait for a free connection
 
 class DashboardConfig(BaseModel):
     language: str = "en"
@@ -52,6 +113,8 @@ class Config(BaseModel):
     ngrok: NgrokConfig = None
     security: SecurityConfig = None
     translation: TranslationConfig = TranslationConfig()
+    lore: LoreConfig = LoreConfig()
+    database: DatabaseConfig = DatabaseConfig()
     dashboard: DashboardConfig = DashboardConfig()
     cloudflare: CloudflareConfig = CloudflareConfig()
     room: RoomConfig = RoomConfig()
@@ -1,6 +1,8 @@
 from typing import Optional, List
 from sqlmodel import Field, Session, SQLModel, create_engine, select
+from sqlalchemy import event, inspect
 import datetime
+from app.core.config import config, DatabaseConfig
 
 # --- Models ---
 
@@ -38,6 +40,8 @@ class LoreEntry(SQLModel, table=True):
     secondary_keys: Optional[str] = None # Comma-separated alias
     constant: bool = Field(default=False) # Always active
     enabled: bool = Field(default=True)
+    priority: int = Field(default=0) # Higher wins when the lore budget is tight
+    insertion_order: int = Field(default=0) # Tie-breaker within a priority, lower first
     content_en: Optional[str] = None # Auto-translated description
     source: str = Field(default="host") # "host" or "visitor"
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
@@ -57,6 +61,26 @@ class CharacterCard(SQLModel, table=True):
     character_version: Optional[str] = None
     image_path: Optional[str] = None # Path to avatar image (filename in static/cards/)
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    updated_at: Optional[datetime.datetime] = Field(
+        default_factory=datetime.datetime.utcnow,
+        sa_column_kwargs={"onupdate": datetime.datetime.utcnow} # Bumped on any ORM update (prompt cache key)
+    )
+
+class TranslationCacheEntry(SQLModel, table=True):
+    """Second tier of the translation cache (see translator.TranslationCache)."""
+    text_hash: str = Field(primary_key=True) # sha256 of the source text
+    source: str = Field(primary_key=True) # "auto" unless the source language was given
+    target: str = Field(primary_key=True)
+    translated: str
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    last_used: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, index=True)
+
+class LoreEmbedding(SQLModel, table=True):
+    """Persisted lore entry vectors (see lore_embeddings.LoreEmbeddings)."""
+    keyword: str = Field(primary_key=True) # LoreEntry.keyword
+    encoder: str # Encoder signature; vectors from another setup are recomputed
+    text_hash: str # sha256 of the embedded text
+    vector: bytes # float32, little-endian
 
 # --- Database Connection ---
 
@@ -64,10 +88,166 @@ sqlite_file_name = "logs.sqlite"
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
 connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, connect_args=connect_args)
+db_config = config.database if config else DatabaseConfig()
+
+# Allowed values for the pragmas that take a keyword (they can't be bound parameters)
+PRAGMA_CHOICES = {
+    "journal_mode": {"delete", "truncate", "persist", "memory", "wal", "off"},
+    "synchronous": {"off", "normal", "full", "extra"},
+    "temp_store": {"default", "file", "memory"},
+}
+
+def _pragmas(db: DatabaseConfig) -> dict:
+    pragmas = {
+        "journal_mode": db.journal_mode.lower(),
+        "synchronous": db.synchronous.lower(),
+        "cache_size": -db.cache_size_kb, # Negative = KiB rather than pages
+        "mmap_size": db.mmap_size_mb * 1024 * 1024,
+        "busy_timeout": db.busy_timeout_ms,
+        "temp_store": db.temp_store.lower(),
+    }
+    for name, choices in PRAGMA_CHOICES.items():
+        if pragmas[name] not in choices:
+            print(f"[DB] Ignoring database.{name}='{pragmas[name]}' (expected one of {sorted(choices)})")
+            del pragmas[name]
+    return pragmas
+
+PRAGMAS = _pragmas(db_config)
+
+engine = create_engine(
+    sqlite_url, connect_args=connect_args,
+    pool_size=db_config.pool_size, max_overflow=db_config.max_overflow, pool_timeout=db_config.pool_timeout
+)
+
+@event.listens_for(engine, "connect")
+def _apply_pragmas(dbapi_connection, connection_record):
+    # Most pragmas are per connection, so every pooled connection gets them
+    cursor = dbapi_connection.cursor()
+    for name, value in PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+# SQLite reports these as numbers
+PRAGMA_NAMES = {
+    "synchronous": ["off", "normal", "full", "extra"],
+    "temp_store": ["default", "file", "memory"],
+}
+
+def pragma_report() -> dict:
+    """The pragmas as SQLite actually applied them (journal_mode can silently stay put)."""
+    with engine.connect() as conn:
+        active = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in PRAGMAS}
+    for name, names in PRAGMA_NAMES.items():
+        if isinstance(active.get(name), int) and active[name] < len(names):
+            active[name] = names[active[name]]
+    return active
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    active = pragma_report()
+    print(f"[DB] {sqlite_file_name}: " + ", ".join(f"{k}={v}" for k, v in active.items())
+          + f"; pool {db_config.pool_size}+{db_config.max_overflow}")
+    if "journal_mode" in PRAGMAS and str(active["journal_mode"]).lower() != PRAGMAS["journal_mode"]:
+        print(f"[DB] Warning: journal_mode is {active['journal_mode']}, not {PRAGMAS['journal_mode']} (filesystem without shared memory?)")
+    _add_missing_columns()
+    _create_search_tables()
+
+def _sql_literal(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _add_missing_columns():
+    """
+    Adds columns introduced after a table was first created.
+    create_all() never alters existing tables, so older logs.sqlite files
+    would otherwise break on new model fields (see migrate_*.py for the old manual way).
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"
+                # Scalar Python defaults become SQL defaults so existing rows get a value
+                if column.default is not None and column.default.is_scalar:
+                    ddl += f" DEFAULT {_sql_literal(column.default.arg)}"
+                print(f"[DB] Adding column {table.name}.{column.name}")
+                conn.exec_driver_sql(ddl)
+
+# --- Full-text search ---
+# External-content FTS5 indexes over lore entries and conversation logs, kept
+# in sync by triggers (see app/core/search.py for the queries). The trigram
+# tokenizer finds substrings, which also works for Japanese text without spaces.
+
+LORE_FTS_COLUMNS = ["keyword", "secondary_keys", "content", "keyword_en", "content_en"]
+# Log messages are stored HTML-escaped (room_manager.sanitize). They are indexed,
+# matched and snippeted unescaped, through this view, so "don't" finds don&#x27;t
+LOG_TEXT_VIEW = "conversationlog_text"
+FTS_TABLES = {
+    # fts table: (source table, content table or view, rowid column, indexed columns, unindexed columns, html-escaped columns)
+    "lore_fts": ("loreentry", "loreentry", "rowid", LORE_FTS_COLUMNS, ["book"], []),
+    "log_fts": ("conversationlog", LOG_TEXT_VIEW, "id", ["message"], [], ["message"]),
+}
+fts_available = False
+
+def _unescape_sql(column: str) -> str:
+    """SQL undoing html.escape() (quote=True) on a column; &amp; goes last, like html.unescape would."""
+    expr = column
+    for entity, char in (("&lt;", "<"), ("&gt;", ">"), ("&quot;", '"'), ("&#x27;", "''"), ("&amp;", "&")):
+        expr = f"replace({expr}, '{entity}', '{char}')"
+    return expr
+
+def _create_search_tables():
+    global fts_available
+    with engine.begin() as conn:
+        existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        try:
+            for fts, (source, content, rowid, columns, unindexed, escaped) in FTS_TABLES.items():
+                all_columns = columns + unindexed
+                if content != source:
+                    # Recreated every start, so it picks up columns added since
+                    source_columns = [c.name for c in SQLModel.metadata.tables[source].columns]
+                    view_columns = ", ".join(f"{_unescape_sql(c)} AS {c}" if c in escaped else c for c in source_columns)
+                    conn.exec_driver_sql(f"DROP VIEW IF EXISTS {content}")
+                    conn.exec_driver_sql(f"CREATE VIEW {content} AS SELECT {view_columns} FROM {source}")
+                if fts in existing:
+                    created = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = ?", (fts,)).scalar()
+                    if f"content='{content}'" not in created:
+                        # Built over another content table (escaped logs): start over
+                        conn.exec_driver_sql(f"DROP TABLE {fts}")
+                        for trigger in ("insert", "delete", "update"):
+                            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {source}_fts_{trigger}")
+                        existing.discard(fts)
+                if fts not in existing:
+                    column_defs = ", ".join(columns + [f"{c} UNINDEXED" for c in unindexed])
+                    conn.exec_driver_sql(
+                        f"CREATE VIRTUAL TABLE {fts} USING fts5({column_defs}, "
+                        f"content='{content}', content_rowid='{rowid}', tokenize='trigram')"
+                    )
+                new_values = ", ".join(_unescape_sql(f"new.{c}") if c in escaped else f"new.{c}" for c in all_columns)
+                old_values = ", ".join(_unescape_sql(f"old.{c}") if c in escaped else f"old.{c}" for c in all_columns)
+                names = ", ".join(all_columns)
+                insert_new = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.{rowid}, {new_values});"
+                delete_old = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.{rowid}, {old_values});"
+                conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {source}_fts_insert AFTER INSERT ON {source} BEGIN {insert_new} END")
+                conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {source}_fts_delete AFTER DELETE ON {source} BEGIN {delete_old} END")
+                conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {source}_fts_update AFTER UPDATE ON {source} BEGIN {delete_old} {insert_new} END")
+                # loreentry's rowid isn't a declared column, so VACUUM may renumber it;
+                # the lore index is small, rebuild it every start. Logs only when new.
+                if fts not in existing or rowid == "rowid":
+                    conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+            fts_available = True
+        except Exception as e:
+            # SQLite built without FTS5 (or older than 3.34, no trigram tokenizer)
+            print(f"[DB] Full-text search unavailable: {e}")
 
 def get_session():
     with Session(engine) as session:
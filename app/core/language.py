@@ -0,0 +1,87 @@
+import re
+from typing import Optional
+
+try:
+    # Optional n-gram model for Latin-script languages
+    from langdetect import DetectorFactory, detect_langs
+    DetectorFactory.seed = 0 # Deterministic results
+    HAS_LANGDETECT = True
+except ImportError:
+    HAS_LANGDETECT = False
+
+# Scripts that (nearly) pin down the language on their own
+_KANA_RE = re.compile(r"[\u3040-\u30ff\uff66-\uff9f]")
+_HANGUL_RE = re.compile(r"[\uac00-\ud7af\u1100-\u11ff]")
+_HAN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]")
+_THAI_RE = re.compile(r"[\u0e00-\u0e7f]")
+_ARABIC_RE = re.compile(r"[\u0600-\u06ff]")
+_HEBREW_RE = re.compile(r"[\u0590-\u05ff]")
+_GREEK_RE = re.compile(r"[\u0370-\u03ff]")
+_CYRILLIC_RE = re.compile(r"[\u0400-\u04ff]")
+_LATIN_RE = re.compile(r"[A-Za-z\u00c0-\u024f]")
+_ACCENTED_RE = re.compile(r"[\u00c0-\u024f]")
+_WORD_RE = re.compile(r"[a-z']+")
+
+# Frequent English function words. Words that are just as common in other
+# Latin-script languages ("a", "me", "no", "in", "was", ...) are left out.
+_ENGLISH_WORDS = {
+    "the", "and", "or", "but", "is", "are", "were", "be", "been",
+    "you", "she", "it", "we", "they", "my", "your", "his", "her",
+    "this", "that", "these", "those", "what", "who", "how", "why", "where", "when",
+    "to", "of", "at", "with", "from", "about", "does", "did",
+    "have", "had", "not", "yes", "can", "would", "should",
+    "hello", "hi", "thanks", "please", "there", "here", "i'm", "it's", "don't",
+}
+# Share of all words that must be English function words; typical English
+# prose is well above this, a stray English word in Spanish or German is not
+MIN_ENGLISH_SHARE = 0.25
+
+def normalize_lang(code: str) -> str:
+    """'zh-CN' -> 'zh', 'EN' -> 'en'; detection and translation targets are compared on the base code."""
+    return (code or "").split("-")[0].split("_")[0].lower()
+
+def _detect_by_script(text: str) -> Optional[str]:
+    latin = len(_LATIN_RE.findall(text))
+    han = len(_HAN_RE.findall(text))
+    # A Japanese name inside an English sentence doesn't make it Japanese, so weigh the scripts
+    kana = len(_KANA_RE.findall(text))
+    if kana and kana + han >= latin:
+        return "ja"
+    hangul = len(_HANGUL_RE.findall(text))
+    if hangul and hangul + han >= latin:
+        return "ko"
+    for pattern, lang in ((_THAI_RE, "th"), (_ARABIC_RE, "ar"), (_HEBREW_RE, "he"), (_GREEK_RE, "el")):
+        count = len(pattern.findall(text))
+        if count and count >= latin:
+            return lang
+
+    if latin and latin >= han + kana + hangul + len(_CYRILLIC_RE.findall(text)):
+        # Accented letters rule out English; otherwise look for its function words
+        if _ACCENTED_RE.search(text):
+            return None
+        words = _WORD_RE.findall(text.lower())
+        if not words:
+            return None
+        hits = sum(1 for w in words if w in _ENGLISH_WORDS)
+        if (hits >= 2 or (len(words) <= 3 and hits >= 1)) and hits / len(words) >= MIN_ENGLISH_SHARE:
+            return "en"
+    # Han without kana could be Chinese or kanji-only Japanese; Cyrillic covers many languages
+    return None
+
+def detect_language(text: str) -> Optional[str]:
+    """
+    Best-effort language of `text` as a base code ('ja', 'en', ...), or None if unsure.
+    Script heuristics first, then langdetect when it is installed.
+    Meant for skipping no-op translations, so it prefers None over a wrong guess.
+    """
+    if not text or not text.strip():
+        return None
+    lang = _detect_by_script(text)
+    if lang or not HAS_LANGDETECT:
+        return lang
+    try:
+        best = detect_langs(text)[0]
+    except Exception:
+        return None
+    # Short texts make the n-gram model guess; only trust confident answers
+    return normalize_lang(best.lang) if best.prob >= 0.9 else None
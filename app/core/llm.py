@@ -1,24 +1,237 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+import openai
 from openai import OpenAI
 from app.core.config import config
+from app.core.llm_pool import build_pool, build_timeout, is_outage
+from app.core.prompt_budget import ContextBudget, get_tokenizer
+from app.core.resilience import CircuitBreaker, CircuitOpenError, backoff_delay
+
+class LLMUnavailableError(CircuitOpenError):
+    """The LLM backend is failing; request handlers answer 503 with Retry-After."""
+
+class PromptPrefixStats:
+    """
+    Tracks how stable the prompt prefix is between consecutive requests.
+    Local backends (llama.cpp, Ollama, LM Studio) can only reuse their KV cache
+    for the part of the prompt that is byte-identical to the previous one.
+    """
+    def __init__(self):
+        self.requests = 0
+        self.system_prefix_chars = 0
+        self.system_prefix_repeats = 0
+        self.shared_prefix_chars = 0
+        self.total_prompt_chars = 0
+        self._last_system_hash = None
+        self._last_rendered = ""
+
+        # Reported by the backend, when available
+        self.backend_prompt_tokens = 0
+        self.backend_cached_tokens = 0
+
+    def record_prompt(self, messages: list[dict]):
+        system = messages[0]["content"] if messages else ""
+        system_hash = hashlib.sha1(system.encode("utf-8")).hexdigest()
+        rendered = "".join(f"{m['role']}\n{m['content']}\n" for m in messages)
+
+        if self.requests and system_hash == self._last_system_hash:
+            self.system_prefix_repeats += 1
+        if self._last_rendered:
+            self.shared_prefix_chars += len(os.path.commonprefix([self._last_rendered, rendered]))
+
+        self.requests += 1
+        self.system_prefix_chars = len(system)
+        self.total_prompt_chars += len(rendered)
+        self._last_system_hash = system_hash
+        self._last_rendered = rendered
+
+    def record_usage(self, response):
+        """Picks up prompt-cache counters from an OpenAI-style response (or final stream chunk)."""
+        usage = getattr(response, "usage", None)
+        if usage:
+            self.backend_prompt_tokens += usage.prompt_tokens or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = getattr(details, "cached_tokens", None) if details else None
+            if cached:
+                self.backend_cached_tokens += cached
+                return
+
+        # llama.cpp server reports its own timings block instead
+        extra = getattr(response, "model_extra", None) or {}
+        timings = extra.get("timings") or {}
+        if timings.get("cache_n"):
+            self.backend_cached_tokens += timings["cache_n"]
+
+    def snapshot(self) -> dict:
+        comparisons = max(self.requests - 1, 0)
+        return {
+            "requests": self.requests,
+            "system_prefix_chars": self.system_prefix_chars,
+            # How often consecutive requests had an identical system prefix
+            "system_prefix_reuse_rate": round(self.system_prefix_repeats / comparisons, 3) if comparisons else None,
+            # Share of all prompt bytes that matched the previous prompt's prefix
+            "shared_prefix_ratio": round(self.shared_prefix_chars / self.total_prompt_chars, 3) if self.total_prompt_chars else None,
+            "backend_prompt_tokens": self.backend_prompt_tokens,
+            "backend_cached_tokens": self.backend_cached_tokens,
+            "backend_cache_hit_rate": round(self.backend_cached_tokens / self.backend_prompt_tokens, 3) if self.backend_prompt_tokens else None,
+        }
+
+class ResponseCache:
+    """
+    Exact-match cache of completions, keyed on the assembled messages,
+    models and temperature. LRU-evicted by total size in bytes, with a TTL.
+    """
+    def __init__(self, cache_config):
+        self._entries: OrderedDict = OrderedDict() # key -> (expires_at, text, size)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.configure(cache_config)
+
+    def configure(self, cache_config):
+        self.enabled = cache_config.enabled
+        self.max_bytes = cache_config.max_bytes
+        self.ttl_seconds = cache_config.ttl_seconds
+        if not self.enabled:
+            self.clear()
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    @staticmethod
+    def make_key(messages: list[dict], models: tuple, temperature: float) -> str:
+        """`models`: every model the request could be routed to (sorted), see LLMClient._cache_lookup."""
+        payload = json.dumps({"messages": messages, "models": list(models), "temperature": temperature}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, text, size = entry
+        if time.monotonic() >= expires_at:
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return text
+
+    def put(self, key: str, text: str):
+        size = len(key) + len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, text, size)
+        self.bytes += size
+        self._evict()
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+        }
 
 class LLMClient:
     def __init__(self):
         if not config:
             raise RuntimeError("Configuration not loaded.")
-        
+
+        self.reload()
+        self.character = config.character
+        # {"key", "prompt"} for the compiled static system prompt
+        self._compiled_prompt = None
+        self.prefix_stats = PromptPrefixStats()
+        # Per-request token usage by prompt section (most recent last)
+        self.budget_reports = deque(maxlen=20)
+
+    def reload(self):
+        """(Re)creates the clients from config.llm, e.g. after the dashboard saves new settings."""
+        # Sync client is kept for scripts / CLI usage only and talks to base_url.
+        # Request handlers go through the async backend pool so a slow backend
+        # doesn't freeze the whole event loop.
         self.client = OpenAI(
             base_url=config.llm.base_url,
-            api_key=config.llm.api_key
+            api_key=config.llm.api_key,
+            timeout=build_timeout(config.llm),
+            max_retries=config.llm.max_retries
+        )
+        self.pool = build_pool(config.llm)
+        # Fresh breaker: the old one's failures were against the old settings
+        old_breaker = getattr(self, "breaker", None)
+        if old_breaker:
+            old_breaker.reset()
+        self.breaker = CircuitBreaker(
+            "LLM backend",
+            failure_threshold=config.llm.breaker_failure_threshold,
+            reset_seconds=config.llm.breaker_reset_seconds,
+            probe=self._probe_backends
         )
         self.model = config.llm.model
-        self.character = config.character
+        self.temperature = 0.7
+        self.tokenizer = get_tokenizer(config.llm.tokenizer)
+        if getattr(self, "response_cache", None):
+            self.response_cache.configure(config.llm.response_cache)
+        else:
+            self.response_cache = ResponseCache(config.llm.response_cache)
+
+    def invalidate_prompt_cache(self):
+        """
+        Drops the compiled system prompt. The card endpoints and update_config
+        call this; anything else that writes the active card (scripts, another
+        process) has to call it too, since cache hits don't look at the DB.
+        """
+        self._compiled_prompt = None
 
-    def generate_response(self, visitor_name: str, message: str, context: list[dict] = None, relationship_context: str = None) -> str:
+    def _prompt_cache_key(self) -> tuple:
+        """(card id, persona, system_prompt, name): in-memory only, no DB round trip per turn."""
+        char = self.character
+        return (char.active_card_id, char.persona, char.system_prompt, char.name)
+
+    def compile_system_prompt(self) -> str:
         """
-        Generates a response from the host character.
+        Returns the static part of the system prompt (card + persona + rules).
+        Compiled once per _prompt_cache_key() and reused until the key changes
+        or invalidate_prompt_cache() is called, so the hot path doesn't load
+        the card and rebuild the prompt on every generation.
         """
+        key = self._prompt_cache_key()
+        cached = self._compiled_prompt
+        if cached and cached["key"] == key:
+            return cached["prompt"]
+
         system_prompt = ""
-        
+        cacheable = True
+
         # Check for Active Card
         if self.character.active_card_id:
             try:
@@ -37,14 +250,15 @@ class LLMClient:
                          )
                          if self.character.persona:
                              system_prompt += f"\n[Additional Instructions]\n{self.character.persona}\n"
-                         
+
                          # Keep global system prompt as well? Maybe usually redundant if card has one.
                          # But let's append it as "System Rules"
                          if self.character.system_prompt:
                               system_prompt += f"\n[System Rules]\n{self.character.system_prompt}\n"
             except Exception as e:
                 print(f"Error loading card: {e}")
-        
+                cacheable = False # Retry on the next call
+
         if not system_prompt:
             # Fallback or No Card
             system_prompt = (
@@ -53,29 +267,229 @@ class LLMClient:
                 f"{self.character.system_prompt}\n"
             )
 
-        system_prompt += f"You are currently talking to a visitor named {visitor_name}.\n"
-        
-        if relationship_context:
-            system_prompt += f"\n[Relationship Context]\n{relationship_context}\n"
+        if cacheable:
+            self._compiled_prompt = {"key": key, "prompt": system_prompt}
+        return system_prompt
+
+    def build_messages(self, visitor_name: str, message: str, context: list[dict] = None, relationship_context: str = None,
+                       lore_context: str = None, scene_context: str = None) -> list[dict]:
+        """
+        Assembles the chat message list.
+
+        Layout is KV-cache friendly: the system message holds only the static
+        prompt (byte-identical across turns), followed by the conversation
+        context. Everything that changes per turn (visitor name, affinity,
+        lore, scene) goes into the final user message, so local backends can
+        reuse their cached prompt prefix.
+
+        The result is fitted to llm.max_prompt_tokens; optional sections are
+        trimmed in priority order (relationship, lore, scene, history).
+        """
+        system_prompt = self.compile_system_prompt()
+        situation = f"[Current Situation]\nYou are currently talking to a visitor named {visitor_name}.\n"
+
+        budget = ContextBudget(config.llm.max_prompt_tokens, self.tokenizer)
+        message, sections, context, report = budget.fit(
+            system=system_prompt + situation,
+            message=message,
+            sections=[
+                ("relationship", relationship_context, "start"),
+                ("lore", lore_context, "start"),
+                ("scene", scene_context, "end"), # Newest room lines matter most
+            ],
+            history=context,
+        )
+        self._record_budget(visitor_name, report)
 
         messages = [{"role": "system", "content": system_prompt}]
-        
+
         if context:
             messages.extend(context)
-        
+
+        volatile = situation
+        if "relationship" in sections:
+            volatile += f"\n[Relationship Context]\n{sections['relationship']}\n"
+        if "lore" in sections:
+            volatile += f"\n{sections['lore']}\n"
+        if "scene" in sections:
+            volatile += f"\n{sections['scene']}\n"
+
         # Add the latest message
-        messages.append({"role": "user", "content": message})
+        messages.append({"role": "user", "content": f"{volatile}\n[{visitor_name}]\n{message}"})
+        self.prefix_stats.record_prompt(messages)
+        return messages
+
+    def _record_budget(self, visitor_name: str, report: dict):
+        report["visitor"] = visitor_name
+        report["timestamp"] = time.time()
+        self.budget_reports.append(report)
+        trimmed = [name for name, sec in report["sections"].items() if sec["trimmed"]]
+        if trimmed:
+            print(f"[PromptBudget] {report['total']}/{report['budget']} tokens, trimmed: {', '.join(trimmed)}")
+
+    def generate_response(self, visitor_name: str, message: str, context: list[dict] = None, relationship_context: str = None, lore_context: str = None, scene_context: str = None) -> str:
+        """
+        Generates a response from the host character (blocking).
+        Only for scripts; async code should use agenerate_response.
+        """
+        messages = self.build_messages(visitor_name, message, context, relationship_context, lore_context, scene_context)
 
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
-                temperature=0.7,
+                temperature=self.temperature,
             )
+            self.prefix_stats.record_usage(response)
             return response.choices[0].message.content
         except Exception as e:
             print(f"Error generating response: {e}")
             return "..."
 
+    def check_available(self):
+        """Raises LLMUnavailableError while the breaker is open, before any work is queued."""
+        try:
+            self.breaker.check()
+        except CircuitOpenError as e:
+            raise LLMUnavailableError(e.name, e.retry_after) from None
+
+    def _begin_call(self):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            raise LLMUnavailableError(e.name, e.retry_after) from None
+
+    @staticmethod
+    def _retryable(e: Exception) -> bool:
+        # Same rule the pool uses to eject backends
+        return is_outage(e)
+
+    def _record_error(self, e: Exception):
+        # A 4xx means the server is up and answering; only count outages against it
+        if self._retryable(e):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    async def _retry_pause(self, attempt: int, e: Exception):
+        delay = backoff_delay(attempt, config.llm.retry_base_delay)
+        print(f"[LLM] {type(e).__name__}, retry {attempt + 1}/{config.llm.max_retries} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    async def _probe_backends(self):
+        """Background health check used by the breaker while it is open."""
+        last_error = None
+        for backend in self.pool.backends:
+            try:
+                await backend.client.models.list(timeout=config.llm.connect_timeout)
+                return
+            except openai.APIStatusError:
+                # Answered, even if it doesn't implement /models
+                return
+            except Exception as e:
+                last_error = e
+        raise last_error or RuntimeError("no backends")
+
+    def _cache_lookup(self, messages: list[dict], use_cache: bool):
+        """Returns (cache key or None, cached text or None)."""
+        if not self.response_cache.enabled:
+            return None, None
+        if not use_cache:
+            self.response_cache.bypassed += 1
+            return None, None
+        # Looked up before a backend is leased (a hit shouldn't wait for one), so the
+        # key covers every model in the pool rather than config.llm.model: replies
+        # are only reused while the same set of models serves the room
+        models = tuple(sorted({backend.model for backend in self.pool.backends}))
+        key = ResponseCache.make_key(messages, models, self.temperature)
+        return key, self.response_cache.get(key)
+
+    async def agenerate_response(self, visitor_name: str, message: str, context: list[dict] = None, relationship_context: str = None, lore_context: str = None, scene_context: str = None, use_cache: bool = True) -> str:
+        """
+        Generates a response from the host character without blocking the event loop.
+        Identical prompts are served from the response cache when it is enabled.
+        Transient backend errors are retried; raises LLMUnavailableError while the breaker is open.
+        """
+        messages = self.build_messages(visitor_name, message, context, relationship_context, lore_context, scene_context)
+        cache_key, cached = self._cache_lookup(messages, use_cache)
+        if cached is not None:
+            return cached
+
+        self._begin_call()
+        for attempt in range(config.llm.max_retries + 1):
+            try:
+                async with self.pool.lease() as backend:
+                    response = await backend.client.chat.completions.create(
+                        model=backend.model,
+                        messages=messages,
+                        temperature=self.temperature,
+                    )
+                break
+            except Exception as e:
+                if self._retryable(e) and attempt < config.llm.max_retries:
+                    await self._retry_pause(attempt, e)
+                    continue
+                print(f"Error generating response: {e}")
+                self._record_error(e)
+                return "..."
+
+        self.breaker.record_success()
+        self.prefix_stats.record_usage(response)
+        text = response.choices[0].message.content
+        if cache_key and text:
+            self.response_cache.put(cache_key, text)
+        return text
+
+    async def astream_response(self, visitor_name: str, message: str, context: list[dict] = None, relationship_context: str = None, lore_context: str = None, scene_context: str = None, use_cache: bool = True):
+        """
+        Streams the host character's response as text deltas.
+        Yields "..." once if the backend fails before producing anything.
+        A cached response is yielded as a single delta.
+        Raises LLMUnavailableError (before yielding) while the breaker is open.
+        """
+        messages = self.build_messages(visitor_name, message, context, relationship_context, lore_context, scene_context)
+        cache_key, cached = self._cache_lookup(messages, use_cache)
+        if cached is not None:
+            yield cached
+            return
+
+        self._begin_call()
+        produced = []
+        for attempt in range(config.llm.max_retries + 1):
+            try:
+                async with self.pool.lease() as backend:
+                    stream = await backend.client.chat.completions.create(
+                        model=backend.model,
+                        messages=messages,
+                        temperature=self.temperature,
+                        stream=True,
+                    )
+                    async for chunk in stream:
+                        # Backends that send usage on the final chunk
+                        if getattr(chunk, "usage", None):
+                            self.prefix_stats.record_usage(chunk)
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            produced.append(delta)
+                            yield delta
+                break
+            except Exception as e:
+                # Once text went out a retry would repeat it, so only retry clean failures
+                if not produced and self._retryable(e) and attempt < config.llm.max_retries:
+                    await self._retry_pause(attempt, e)
+                    continue
+                print(f"Error streaming response: {e}")
+                self._record_error(e)
+                if not produced:
+                    yield "..."
+                return
+
+        self.breaker.record_success()
+        # Only complete streams are cached
+        if cache_key and produced:
+            self.response_cache.put(cache_key, "".join(produced))
+
 # Global LLM Client instance
 llm_client = LLMClient()
@@ -0,0 +1,136 @@
+import asyncio
+import httpx
+import openai
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from openai import AsyncOpenAI
+
+def is_outage(e: Exception) -> bool:
+    """
+    Whether an error says the backend is down or overloaded (connection errors,
+    timeouts, 429, 5xx). Anything else, e.g. a 400 for an oversized prompt,
+    came from a server that is up and answering.
+    """
+    # APITimeoutError is a subclass of APIConnectionError
+    if isinstance(e, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(e, openai.APIStatusError) and e.status_code >= 500
+
+class LLMBackend:
+    """One OpenAI-compatible server (Ollama, LM Studio, llama.cpp, ...)."""
+    def __init__(self, base_url: str, api_key: str, model: str, max_concurrency: int = 1, timeout: Optional[httpx.Timeout] = None):
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        # Retries are done by LLMClient so they can move to another backend
+        self.client = AsyncOpenAI(base_url=base_url, api_key=api_key, timeout=timeout, max_retries=0)
+
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.in_flight < self.max_concurrency
+
+    def status(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "model": self.model,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "healthy": self.healthy,
+            "consecutive_failures": self.consecutive_failures,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+        }
+
+class BackendPool:
+    """
+    Routes each generation to the healthy backend with the fewest in-flight
+    requests, honouring per-backend concurrency caps. Backends that fail
+    repeatedly are ejected for a cooldown period.
+    """
+    def __init__(self, backends: List[LLMBackend], eject_after_failures: int = 3, eject_seconds: float = 30.0):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        self.backends = backends
+        self.eject_after_failures = eject_after_failures
+        self.eject_seconds = eject_seconds
+        # Replaced on every release so waiters wake up and re-pick
+        self._changed = asyncio.Event()
+
+    def _pick(self) -> Optional[LLMBackend]:
+        healthy = [b for b in self.backends if b.healthy]
+        if not healthy:
+            # Everything is ejected: rather than refuse, try the one that recovers first
+            healthy = [min(self.backends, key=lambda b: b.ejected_until)]
+        available = [b for b in healthy if b.has_capacity]
+        if not available:
+            return None
+        return min(available, key=lambda b: b.in_flight)
+
+    async def acquire(self) -> LLMBackend:
+        while True:
+            backend = self._pick()
+            if backend:
+                backend.in_flight += 1
+                backend.total_requests += 1
+                return backend
+            changed = self._changed
+            try:
+                # Re-check periodically in case an ejection expires
+                await asyncio.wait_for(changed.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, backend: LLMBackend, ok: bool):
+        backend.in_flight -= 1
+        if ok:
+            backend.consecutive_failures = 0
+        else:
+            backend.total_failures += 1
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.eject_after_failures:
+                backend.ejected_until = time.monotonic() + self.eject_seconds
+                print(f"[LLMPool] Ejecting {backend.base_url} for {self.eject_seconds}s after {backend.consecutive_failures} failures")
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        Holds a slot on the chosen backend for the duration of the block.
+        Only outages (see is_outage) raised in the block count against it;
+        cancellation and request errors release it as healthy.
+        """
+        backend = await self.acquire()
+        failed = False
+        try:
+            yield backend
+        except Exception as e:
+            failed = is_outage(e)
+            raise
+        finally:
+            self.release(backend, ok=not failed)
+
+    def status(self) -> List[dict]:
+        return [b.status() for b in self.backends]
+
+def build_timeout(llm_config) -> httpx.Timeout:
+    return httpx.Timeout(llm_config.read_timeout, connect=llm_config.connect_timeout)
+
+def build_pool(llm_config) -> BackendPool:
+    """Creates the pool from LLMConfig: base_url first, then any extra backends."""
+    timeout = build_timeout(llm_config)
+    backends = [LLMBackend(llm_config.base_url, llm_config.api_key, llm_config.model, llm_config.max_concurrency, timeout)]
+    for b in llm_config.backends:
+        backends.append(LLMBackend(b.base_url, b.api_key, b.model or llm_config.model, b.max_concurrency, timeout))
+    return BackendPool(backends, llm_config.eject_after_failures, llm_config.eject_seconds)
@@ -0,0 +1,80 @@
+import datetime
+from typing import List, Optional, Set, Tuple
+from sqlalchemy import case, delete, func, insert, literal, select, update
+from app.core.database import engine, LoreEntry, LoreEmbedding
+
+# Whole-book and multi-entry lore edits, each one SQL statement (plus the
+# lookups it needs) in a single transaction. Callers invalidate the lore
+# caches once for the books returned.
+
+def rename_book(old_name: str, new_name: str) -> int:
+    """Renaming onto an existing book merges into it."""
+    with engine.begin() as conn:
+        return conn.execute(update(LoreEntry).where(LoreEntry.book == old_name).values(book=new_name)).rowcount
+
+def merge_books(sources: List[str], target: str) -> int:
+    sources = [s for s in sources if s != target]
+    if not sources:
+        return 0
+    with engine.begin() as conn:
+        return conn.execute(update(LoreEntry).where(LoreEntry.book.in_(sources)).values(book=target)).rowcount
+
+def copy_book(source: str, target: str, suffix: str) -> Tuple[int, int]:
+    """
+    Keywords are unique across all books, so copies are stored as
+    keyword + suffix, with the original keyword put first in their secondary
+    keys so they still trigger on it. Copies that already exist are skipped.
+    Returns (copied, skipped).
+    """
+    table = LoreEntry.__table__
+    c = table.c
+    secondary = case(
+        ((c.secondary_keys == None) | (c.secondary_keys == ""), c.keyword),
+        else_=c.keyword + "," + c.secondary_keys
+    )
+    copied_columns = {
+        "keyword": c.keyword + suffix,
+        "keyword_en": c.keyword_en,
+        "content": c.content,
+        "book": literal(target),
+        "secondary_keys": secondary,
+        "constant": c.constant,
+        "enabled": c.enabled,
+        "priority": c.priority,
+        "insertion_order": c.insertion_order,
+        "content_en": c.content_en,
+        "source": c.source,
+        "created_at": literal(datetime.datetime.utcnow()),
+    }
+    query = select(*copied_columns.values()).where(c.book == source)
+    with engine.begin() as conn:
+        total = conn.execute(select(func.count()).select_from(table).where(c.book == source)).scalar()
+        copied = conn.execute(
+            insert(table).prefix_with("OR IGNORE").from_select(list(copied_columns), query)
+        ).rowcount
+    return copied, total - copied
+
+def set_enabled(book: str, enabled: bool, keywords: Optional[List[str]] = None) -> int:
+    """Enables/disables a whole book, or just the given keywords in it."""
+    query = update(LoreEntry).where(LoreEntry.book == book)
+    if keywords is not None:
+        query = query.where(LoreEntry.keyword.in_(keywords))
+    with engine.begin() as conn:
+        return conn.execute(query.values(enabled=enabled)).rowcount
+
+def delete_book(book: str) -> int:
+    with engine.begin() as conn:
+        # Embedding syncs don't prune orphans; vectors are only deleted here and in delete_lore_entry
+        conn.execute(delete(LoreEmbedding).where(
+            LoreEmbedding.keyword.in_(select(LoreEntry.keyword).where(LoreEntry.book == book))
+        ))
+        return conn.execute(delete(LoreEntry).where(LoreEntry.book == book)).rowcount
+
+def move_entries(keywords: List[str], target: str) -> Tuple[int, Set[str]]:
+    """Returns (moved, books the entries came from)."""
+    if not keywords:
+        return 0, set()
+    with engine.begin() as conn:
+        sources = set(conn.execute(select(LoreEntry.book).where(LoreEntry.keyword.in_(keywords)).distinct()).scalars())
+        moved = conn.execute(update(LoreEntry).where(LoreEntry.keyword.in_(keywords)).values(book=target)).rowcount
+    return moved, sources
@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlmodel import Session, select
+from app.core.database import engine, LoreEntry, LoreEmbedding
+from app.core.lore_index import ALL_BOOKS
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+class HashedNgramEncoder:
+    """
+    Offline text embedding: character n-grams hashed into a fixed number of
+    buckets, with log-damped counts. Catches inflections, typos and partial
+    words that substring keys miss. Vectors are raw term weights; BookEmbeddings
+    applies IDF and normalizes, since that depends on the rest of the book.
+    It has no notion of meaning across languages; entries are embedded with
+    their English translations too, so English messages reach native entries.
+    """
+    name = "hashed-ngram-v2"
+
+    def __init__(self, dim: int = 512, ngram_sizes: Tuple[int, ...] = (2, 3)):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+
+    @property
+    def signature(self) -> str:
+        """Stored next to each vector; vectors from another encoder setup are recomputed."""
+        return f"{self.name}:{self.dim}:{','.join(map(str, self.ngram_sizes))}"
+
+    def _ngrams(self, text: str) -> List[str]:
+        text = " ".join(unicodedata.normalize("NFKC", text).lower().split())
+        padded = f" {text} "
+        return [padded[i:i + n] for n in self.ngram_sizes for i in range(len(padded) - n + 1)]
+
+    def encode(self, text: str) -> "np.ndarray":
+        vector = np.zeros(self.dim, dtype=np.float32)
+        grams = self._ngrams(text or "")
+        if not grams:
+            return vector
+        hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint32, count=len(grams))
+        np.add.at(vector, hashes % self.dim, 1.0)
+        return np.log1p(vector)
+
+def _unit_rows(matrix: "np.ndarray") -> "np.ndarray":
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+def _entry_text(keyword, keyword_en, secondary_keys, content, content_en) -> str:
+    return "\n".join(part for part in (keyword, keyword_en, secondary_keys, content, content_en) if part)
+
+class BookEmbeddings:
+    """
+    Enabled entries of one lorebook as rows of a float32 matrix, IDF-weighted
+    over the book (n-grams every entry has, like " the", count for little)
+    and normalized to unit length, so a dot product is the cosine similarity.
+    """
+    def __init__(self, book: str, keywords: List[str], vectors: List["np.ndarray"], dim: int):
+        self.book = book
+        self.keywords = keywords
+        raw = np.vstack(vectors) if vectors else np.zeros((0, dim), dtype=np.float32)
+        doc_freq = np.count_nonzero(raw, axis=0)
+        self.idf = (np.log((len(raw) + 1) / (doc_freq + 1)) + 1).astype(np.float32)
+        self.matrix = _unit_rows(raw * self.idf)
+
+    def search(self, query: "np.ndarray", top_k: int, min_score: float) -> List[Tuple[str, float]]:
+        """Top-k entries for a raw query vector: one matrix-vector product."""
+        if not len(self.keywords) or top_k <= 0:
+            return []
+        scores = self.matrix @ _unit_rows(query * self.idf)
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.keywords[i], round(float(scores[i]), 3)) for i in best if scores[i] >= min_score]
+
+class LoreEmbeddings:
+    """
+    Per-book embedding matrices for semantic lore retrieval (needs numpy).
+    Vectors are persisted in LoreEmbedding, keyed by keyword with a hash of
+    the embedded text, so startup only loads them. When a lore write marks a
+    book dirty, the next lookup re-embeds just the entries whose text changed,
+    in a worker thread (asearch) with its own session.
+    """
+    def __init__(self, db_engine=None):
+        self.engine = db_engine or engine
+        self._books: Dict[str, BookEmbeddings] = {}
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        # Bumped by invalidate(), so a build that raced a lore write isn't kept
+        self._generation = 0
+        self.encoder = None
+        self.embedded = 0 # Entries (re)computed
+        self.loaded = 0 # Entries read back from the table
+        self.last_sync_ms = 0.0
+        self._warned = False
+
+    def available(self) -> bool:
+        if not HAS_NUMPY and not self._warned:
+            print("[LoreEmbeddings] lore.semantic is on but numpy is not installed (pip install numpy); "
+                  "lore is matched by keywords only")
+            self._warned = True
+        return HAS_NUMPY
+
+    def invalidate(self, books: Optional[Iterable[str]] = None):
+        """Same contract as LoreIndex.invalidate."""
+        with self._lock:
+            self._generation += 1
+            if books is None:
+                self._books.clear()
+                return
+            for book in books:
+                self._books.pop(book, None)
+            self._books.pop(ALL_BOOKS, None)
+
+    def _encoder(self, dim: int) -> HashedNgramEncoder:
+        if self.encoder is None or self.encoder.dim != dim:
+            self.encoder = HashedNgramEncoder(dim)
+            self._books.clear()
+        return self.encoder
+
+    def ready(self, book: str, dim: int) -> bool:
+        return self.encoder is not None and self.encoder.dim == dim and book in self._books
+
+    def get(self, book: str, dim: int) -> BookEmbeddings:
+        """Thread-safe; concurrent callers wait for one build instead of each syncing the book."""
+        with self._lock:
+            encoder = self._encoder(dim)
+            embeddings = self._books.get(book)
+            if embeddings is not None:
+                return embeddings
+            generation = self._generation
+        # Built outside the lock, so invalidate() never waits on a build
+        with self._build_lock(book):
+            with self._lock:
+                if book in self._books:
+                    return self._books[book]
+            embeddings = self._sync(book, encoder)
+            with self._lock:
+                if generation == self._generation and encoder is self.encoder:
+                    self._books[book] = embeddings
+        return embeddings
+
+    def _build_lock(self, book: str) -> threading.Lock:
+        with self._lock:
+            return self._build_locks.setdefault(book, threading.Lock())
+
+    def _sync(self, book: str, encoder: HashedNgramEncoder) -> BookEmbeddings:
+        started = time.perf_counter()
+        # Own session: this runs in a worker thread, and commits must not pick up a request's pending writes
+        with Session(self.engine) as session:
+            query = select(
+                LoreEntry.keyword, LoreEntry.keyword_en, LoreEntry.secondary_keys,
+                LoreEntry.content, LoreEntry.content_en
+            ).where(LoreEntry.enabled == True)
+            if book != ALL_BOOKS:
+                query = query.where(LoreEntry.book == book)
+            rows = session.exec(query).all()
+
+            stored_query = select(LoreEmbedding).join(LoreEntry, LoreEntry.keyword == LoreEmbedding.keyword)
+            if book != ALL_BOOKS:
+                stored_query = stored_query.where(LoreEntry.book == book)
+            stored = {e.keyword: e for e in session.exec(stored_query).all()}
+
+            keywords, vectors = [], []
+            changed = 0
+            for row in rows:
+                text_hash = hashlib.sha256(_entry_text(*row).encode("utf-8")).hexdigest()
+                entry = stored.get(row[0])
+                if entry and entry.encoder == encoder.signature and entry.text_hash == text_hash:
+                    vector = np.frombuffer(entry.vector, dtype="<f4")
+                    self.loaded += 1
+                else:
+                    vector = encoder.encode(_entry_text(*row))
+                    if entry is None:
+                        entry = LoreEmbedding(keyword=row[0], encoder="", text_hash="", vector=b"")
+                    entry.encoder = encoder.signature
+                    entry.text_hash = text_hash
+                    entry.vector = vector.astype("<f4").tobytes()
+                    session.add(entry)
+                    changed += 1
+                keywords.append(row[0])
+                vectors.append(vector)
+
+            # Only this book's rows are written. Vectors of deleted entries are
+            # removed with the entries (delete_lore_entry, lore_bulk.delete_book)
+            if changed:
+                session.commit()
+        self.embedded += changed
+
+        self.last_sync_ms = round((time.perf_counter() - started) * 1000, 2)
+        print(f"[LoreEmbeddings] '{book}': {len(keywords)} entries ({changed} embedded) in {self.last_sync_ms}ms")
+        return BookEmbeddings(book, keywords, vectors, encoder.dim)
+
+    def search(self, book: str, text: str, lore_config) -> List[Tuple[str, float]]:
+        """[(keyword, score)] of the entries closest to text, best first; [] without numpy."""
+        if not self.available():
+            return []
+        embeddings = self.get(book, lore_config.embedding_dim)
+        return embeddings.search(self.encoder.encode(text), lore_config.semantic_top_k, lore_config.semantic_min_score)
+
+    async def asearch(self, book: str, text: str, lore_config) -> List[Tuple[str, float]]:
+        """search() for request handlers: a book that needs (re)embedding is synced in a worker thread."""
+        if not self.available():
+            return []
+        if not self.ready(book, lore_config.embedding_dim):
+            await asyncio.to_thread(self.get, book, lore_config.embedding_dim)
+        return self.search(book, text, lore_config)
+
+    def stats(self) -> dict:
+        return {
+            "available": HAS_NUMPY,
+            "encoder": self.encoder.signature if self.encoder else None,
+            "books": {name: len(e.keywords) for name, e in self._books.items()},
+            "embedded": self.embedded,
+            "loaded": self.loaded,
+            "last_sync_ms": self.last_sync_ms,
+        }
+
+lore_embeddings = LoreEmbeddings()
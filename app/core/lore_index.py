@@ -0,0 +1,328 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlmodel import Session, select
+from app.core.database import engine, LoreEntry
+
+ALL_BOOKS = "All"
+LORE_HEADER = "[Lorebook Info]\n"
+# Dropped entries listed by name in a selection report (the count is always complete)
+MAX_REPORTED_DROPS = 20
+
+class AhoCorasick:
+    """
+    Multi-pattern substring matcher. Finds every pattern occurring in a text
+    in one pass over the text, independent of how many patterns there are.
+    Each pattern carries a set of values (here: lore entry keywords).
+    """
+    def __init__(self, patterns: Dict[str, Set[str]]):
+        # Node 0 is the root; goto[n] maps a character to the next node
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[Set[str]] = [set()]
+
+        for pattern, values in patterns.items():
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(set())
+                node = nxt
+            self.out[node] |= values
+
+        # Breadth-first: a node's failure link points at its longest proper suffix in the trie
+        queue = list(self.goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                # Matches ending here include those of the suffix
+                self.out[nxt] |= self.out[self.fail[nxt]]
+
+    @property
+    def size(self) -> int:
+        return len(self.goto)
+
+    def find(self, text: str) -> Set[str]:
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found |= out[node]
+        return found
+
+class BookIndex:
+    """
+    Everything get_lore_context needs from one lorebook (or from all of them),
+    so turns don't touch SQLite: the keyword matcher, the constant entries and
+    the entry texts. Texts live in one string per book; entries keep offsets.
+    """
+    def __init__(self, book: str, rows: Iterable):
+        patterns: Dict[str, Set[str]] = {}
+        self.constants: List[str] = []
+        self.entry_count = 0
+        # keyword -> (keyword_en, start, prompt_end, search_end) into self.blob
+        self._spans: Dict[str, Tuple[Optional[str], int, int, int]] = {}
+        # keyword -> sort key within a tier: higher priority first, then insertion_order
+        self._rank: Dict[str, tuple] = {}
+        # Token cost of each entry's prompt line, filled in as entries get matched
+        self._costs: Dict[str, int] = {}
+        self._cost_tokenizer = None
+        parts = []
+        offset = 0
+        for keyword, keyword_en, secondary_keys, constant, content, content_en, priority, insertion_order in rows:
+            self.entry_count += 1
+            self._rank[keyword] = (-(priority or 0), insertion_order or 0, keyword)
+            if constant:
+                self.constants.append(keyword)
+
+            # Prompt text: English content if available, else native.
+            # Nested keywords are searched in both languages.
+            prompt_text = content_en or content or ""
+            extra = f" {content}" if content_en and content else ""
+            parts.append(prompt_text)
+            parts.append(extra)
+            start = offset
+            offset += len(prompt_text)
+            prompt_end = offset
+            offset += len(extra)
+            self._spans[keyword] = (keyword_en, start, prompt_end, offset)
+            keys = [keyword, keyword_en]
+            if secondary_keys:
+                keys.extend(secondary_keys.split(","))
+            for key in keys:
+                key = (key or "").strip().lower()
+                if key:
+                    patterns.setdefault(key, set()).add(keyword)
+        self.book = book
+        self.blob = "".join(parts)
+        self.pattern_count = len(patterns)
+        self.matcher = AhoCorasick(patterns)
+
+    def match(self, text: str) -> Set[str]:
+        """Keywords of the entries whose keys occur in text (case-insensitive substring match)."""
+        return self.matcher.find(text.lower())
+
+    def entry(self, keyword: str) -> Tuple[Optional[str], str]:
+        """(keyword_en, content to show the LLM)."""
+        keyword_en, start, prompt_end, _ = self._spans[keyword]
+        return keyword_en, self.blob[start:prompt_end]
+
+    def search_text(self, keyword: str) -> str:
+        """Text scanned for nested keywords once this entry is included."""
+        _, start, _, search_end = self._spans[keyword]
+        return self.blob[start:search_end]
+
+    def line(self, keyword: str) -> str:
+        keyword_en, content = self.entry(keyword)
+        label = f"{keyword} ({keyword_en})" if keyword_en else keyword
+        return f"- {label}: {content}\n"
+
+    def cost(self, keyword: str, tokenizer) -> int:
+        if self._cost_tokenizer != tokenizer.name:
+            self._costs = {}
+            self._cost_tokenizer = tokenizer.name
+        cost = self._costs.get(keyword)
+        if cost is None:
+            cost = self._costs[keyword] = tokenizer.count(self.line(keyword))
+        return cost
+
+    def select(self, message: str, depth: int, budget: int, tokenizer, semantic: Iterable[str] = ()):
+        """
+        Picks the entries to inject for a message, most valuable first:
+        constants, then entries whose keys are in the message, then the
+        semantic matches (best first), then entries found in the content of
+        included ones (up to depth passes in all).
+        Within a tier, higher priority and then lower insertion_order win.
+        With a token budget (0 = unlimited), entries that don't fit are
+        dropped, and their content isn't scanned for nested keywords.
+        Returns (keywords in injection order, report).
+        """
+        chosen: List[str] = []
+        seen: Set[str] = set()
+        dropped = []
+        remaining = budget - tokenizer.count(LORE_HEADER) if budget else None
+
+        def admit(keywords, tier: str, ranked: bool = False) -> List[str]:
+            nonlocal remaining
+            admitted = []
+            for keyword in (keywords if ranked else sorted(keywords, key=self._rank.__getitem__)):
+                seen.add(keyword)
+                cost = self.cost(keyword, tokenizer)
+                if remaining is not None and cost > remaining:
+                    dropped.append({"keyword": keyword, "tier": tier, "tokens": cost})
+                    continue
+                if remaining is not None:
+                    remaining -= cost
+                chosen.append(keyword)
+                admitted.append(keyword)
+            return admitted
+
+        admit(self.constants, "constant")
+        search_text = message
+        for depth_pass in range(depth):
+            hits = self.match(search_text) - seen
+            if depth_pass == 0:
+                admitted = admit(hits, "direct")
+                # Already ordered by similarity
+                admitted += admit([k for k in semantic if k in self._rank and k not in seen], "semantic", ranked=True)
+            elif hits:
+                admitted = admit(hits, "recursive")
+            else:
+                break
+            search_text = " ".join(self.search_text(k) for k in admitted)
+
+        report = {
+            "book": self.book,
+            "budget": budget,
+            "tokens": tokenizer.count(LORE_HEADER) + sum(self._costs[k] for k in chosen) if chosen else 0,
+            "included": len(chosen),
+            "dropped_count": len(dropped),
+            "dropped": dropped[:MAX_REPORTED_DROPS],
+        }
+        return chosen, report
+
+    def render(self, keywords: List[str]) -> str:
+        if not keywords:
+            return ""
+        return LORE_HEADER + "".join(self.line(k) for k in keywords)
+
+class LoreIndex:
+    """
+    Process-level lorebook cache for get_lore_context, one BookIndex per book.
+    Lore writes only mark the affected books dirty. aget() keeps serving a
+    dirty book's previous index while a worker thread rebuilds it from SQLite
+    (one build per book at a time), and swaps the new one in when it is done;
+    only a book that was never built is waited for. Unchanged books never hit the DB.
+    """
+    def __init__(self, db_engine=None):
+        self.engine = db_engine or engine
+        self._books: Dict[str, BookIndex] = {}
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        # invalidate() bumps the generation and stamps the books it dirtied with it;
+        # an index is current if it was built at or after its book's stamp
+        self._generation = 0
+        self._dirty: Dict[str, int] = {}
+        self._all_dirty = 0 # Stamp of the last invalidate() of every book
+        self._built_at: Dict[str, int] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.builds = 0
+        self.hits = 0
+        self.stale_hits = 0 # Lookups served from a dirty book's previous index
+        self.last_build_ms = 0.0
+        # Latest selection reports, to see what a lore budget cut
+        self.selections = deque(maxlen=20)
+
+    def invalidate(self, books: Optional[Iterable[str]] = None):
+        """Marks books dirty (all of them if books is None). The "All" view always depends on every book."""
+        with self._lock:
+            self._generation += 1
+            if books is None:
+                self._all_dirty = self._generation
+                return
+            for book in list(books) + [ALL_BOOKS]:
+                self._dirty[book] = self._generation
+
+    def _current(self, book: str) -> bool:
+        return self._built_at.get(book, -1) >= max(self._dirty.get(book, 0), self._all_dirty)
+
+    def _build_lock(self, book: str) -> threading.Lock:
+        with self._lock:
+            return self._build_locks.setdefault(book, threading.Lock())
+
+    def get(self, book: str) -> BookIndex:
+        """The book's current index, built (in the calling thread) if it is missing or dirty."""
+        with self._lock:
+            index = self._books.get(book)
+            if index is not None and self._current(book):
+                self.hits += 1
+                return index
+        return self._build(book)
+
+    async def aget(self, book: str) -> BookIndex:
+        """get() for request handlers: builds run in a worker thread, and a dirty book is served stale meanwhile."""
+        with self._lock:
+            index = self._books.get(book)
+            current = index is not None and self._current(book)
+            if current:
+                self.hits += 1
+            elif index is not None:
+                self.stale_hits += 1
+        if current:
+            return index
+        if index is None:
+            return await asyncio.to_thread(self._build, book)
+        if book not in self._refreshing:
+            task = asyncio.create_task(asyncio.to_thread(self._build, book))
+            self._refreshing[book] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(book, None))
+        return index
+
+    def _build(self, book: str) -> BookIndex:
+        # One build per book at a time; whoever waited on it reuses the result
+        with self._build_lock(book):
+            with self._lock:
+                if book in self._books and self._current(book):
+                    return self._books[book]
+                generation = self._generation
+            started = time.perf_counter()
+            query = select(
+                LoreEntry.keyword, LoreEntry.keyword_en, LoreEntry.secondary_keys,
+                LoreEntry.constant, LoreEntry.content, LoreEntry.content_en,
+                LoreEntry.priority, LoreEntry.insertion_order
+            ).where(LoreEntry.enabled == True)
+            if book != ALL_BOOKS:
+                query = query.where(LoreEntry.book == book)
+            with Session(self.engine) as session:
+                rows = session.exec(query).all()
+            index = BookIndex(book, rows)
+            with self._lock:
+                # A write that landed during the build leaves the book dirty, so the next lookup rebuilds again
+                self._books[book] = index
+                self._built_at[book] = generation
+                self.builds += 1
+                self.last_build_ms = round((time.perf_counter() - started) * 1000, 2)
+        print(f"[LoreIndex] Built '{book}': {index.entry_count} entries, {index.pattern_count} keys in {self.last_build_ms}ms")
+        return index
+
+    def record_selection(self, report: dict):
+        report["timestamp"] = time.time()
+        self.selections.append(report)
+        if report["dropped_count"]:
+            print(f"[LoreIndex] Lore budget {report['budget']}: kept {report['included']} entries, dropped {report['dropped_count']}")
+
+    def stats(self) -> dict:
+        return {
+            "books": {
+                name: {"entries": idx.entry_count, "keys": idx.pattern_count, "nodes": idx.matcher.size, "text_chars": len(idx.blob)}
+                for name, idx in self._books.items()
+            },
+            "dirty": sorted(name for name in self._books if not self._current(name)),
+            "builds": self.builds,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "last_build_ms": self.last_build_ms,
+            "selections": list(self.selections),
+        }
+
+lore_index = LoreIndex()
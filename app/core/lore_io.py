@@ -0,0 +1,381 @@
+import asyncio
+import codecs
+import datetime
+import json
+from typing import Callable, Iterator, List, Optional
+from sqlalchemy import case, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+from app.core.database import engine, LoreEntry
+
+# SillyTavern World Info files keep their entries under one of these keys
+# ("entries" in V2/V3 exports, "data" in V1); a bare top-level list works too
+ENTRY_CONTAINERS = ("entries", "data")
+# An entry that still doesn't parse after this much buffered input is treated as broken
+MAX_PENDING_CHARS = 16 * 1024 * 1024
+IMPORT_BATCH_SIZE = 500
+EXPORT_PAGE_SIZE = 500
+
+_WS = " \t\r\n"
+
+class WorldInfoParseError(ValueError):
+    pass
+
+class WorldInfoParser:
+    """
+    Incremental parser for World Info JSON: feed() it raw chunks as they
+    arrive and it returns the entries completed so far, one dict each,
+    without ever holding more than the entry being read in memory.
+    close() checks the file ended properly.
+    """
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8-sig")()
+        self.buffer = ""
+        self.consumed = 0 # Characters before the buffer, for error offsets
+        # "start" -> top-level object/list -> "container" items -> "done"
+        self._state = "start"
+        self._keyed = False # Container is an object ({"0": {...}}) rather than a list
+        self.count = 0 # Entries returned so far
+        self._error = None # Raised on the next call, after the entries before it were returned
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        self.buffer += self._text.decode(chunk)
+        return self._drain(final=False)
+
+    def close(self) -> List[dict]:
+        self.buffer += self._text.decode(b"", final=True)
+        entries = self._drain(final=True)
+        if self._state == "start":
+            raise WorldInfoParseError("no World Info entries found")
+        if self._state != "done":
+            raise WorldInfoParseError(f"unexpected end of file at offset {self.consumed + len(self.buffer)}")
+        return entries
+
+    def _skip(self, pos: int, chars: str = _WS) -> int:
+        while pos < len(self.buffer) and self.buffer[pos] in chars:
+            pos += 1
+        return pos
+
+    def _decode(self, pos: int, final: bool):
+        """(value, end) of the JSON value at pos, or None if more input is needed."""
+        try:
+            value, end = self._decoder.raw_decode(self.buffer, pos)
+        except json.JSONDecodeError as e:
+            if final or len(self.buffer) - pos > MAX_PENDING_CHARS:
+                raise WorldInfoParseError(f"invalid JSON at offset {self.consumed + e.pos}: {e.msg}")
+            return None
+        # A number at the very end of the buffer may still be missing digits
+        if end >= len(self.buffer) and not final:
+            return None
+        return value, end
+
+    def _member(self, pos: int, keyed: bool, final: bool):
+        """
+        Next item of an object (key, value) or list (None, value) starting at pos.
+        Returns (key, value, end), "close" at the closing bracket, or None if more input is needed.
+        """
+        pos = self._skip(pos, _WS + ",")
+        if pos >= len(self.buffer):
+            return None
+        if self.buffer[pos] in "}]":
+            return "close"
+        key = None
+        if keyed:
+            decoded = self._decode(pos, final)
+            if decoded is None:
+                return None
+            key, pos = decoded
+            pos = self._skip(pos)
+            if pos >= len(self.buffer):
+                return None
+            if self.buffer[pos] != ":":
+                raise WorldInfoParseError(f"expected ':' at offset {self.consumed + pos}")
+            pos += 1
+        decoded = self._decode(self._skip(pos), final)
+        if decoded is None:
+            return None
+        value, end = decoded
+        return key, value, end
+
+    def _drain(self, final: bool) -> List[dict]:
+        if self._error:
+            raise self._error
+        entries = []
+        try:
+            self._parse(entries, final)
+        except WorldInfoParseError as e:
+            if not entries:
+                raise
+            self._error = e
+        self.count += len(entries)
+        return entries
+
+    def _parse(self, entries: List[dict], final: bool):
+        pos = 0
+        while self._state != "done":
+            if self._state == "start":
+                pos = self._skip(pos)
+                if pos >= len(self.buffer):
+                    break
+                opener = self.buffer[pos]
+                if opener not in "{[":
+                    raise WorldInfoParseError("not a World Info file (expected an object or a list)")
+                pos += 1
+                if opener == "[":
+                    self._state, self._keyed = "container", False
+                else:
+                    self._state = "top"
+            elif self._state == "top":
+                # Looking for the entries container among the top-level keys
+                pos = self._skip(pos, _WS + ",")
+                if pos >= len(self.buffer):
+                    break
+                if self.buffer[pos] == "}":
+                    # Top-level object without a container: nothing to import
+                    self._state = "done"
+                    break
+                decoded = self._decode(pos, final)
+                if decoded is None:
+                    break
+                key, after = decoded
+                colon = self._skip(after)
+                if colon >= len(self.buffer):
+                    break
+                if self.buffer[colon] != ":":
+                    raise WorldInfoParseError(f"expected ':' at offset {self.consumed + colon}")
+                value_pos = self._skip(colon + 1)
+                if key in ENTRY_CONTAINERS and value_pos < len(self.buffer) and self.buffer[value_pos] in "{[":
+                    self._keyed = self.buffer[value_pos] == "{"
+                    self._state = "container"
+                    pos = value_pos + 1
+                    continue
+                # Some other top-level field (name, description, ...): skip its value
+                decoded = self._decode(value_pos, final)
+                if decoded is None:
+                    break
+                pos = decoded[1]
+            elif self._state == "container":
+                member = self._member(pos, self._keyed, final)
+                if member is None:
+                    break
+                if member == "close":
+                    # Anything after the entries (other top-level keys) is ignored
+                    self._state = "done"
+                    pos = len(self.buffer)
+                    break
+                key, value, pos = member
+                if isinstance(value, dict):
+                    entries.append(value)
+                else:
+                    index = key if key is not None else self.count + len(entries)
+                    entries.append({"_invalid": f"entry {index} is not an object"})
+
+        # Only the unparsed tail stays buffered
+        self.consumed += pos
+        self.buffer = self.buffer[pos:]
+
+def _as_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    return bool(value)
+
+def _as_int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+def _key_list(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [str(k).strip() for k in value if str(k).strip()]
+
+def entry_from_world_info(raw: dict, book: str) -> dict:
+    """
+    Maps a SillyTavern World Info entry (or one of our exports) to LoreEntry
+    columns. The first primary key becomes the keyword; any further primary
+    keys join the secondary keys. Raises ValueError for unusable entries.
+    """
+    if "_invalid" in raw:
+        raise ValueError(raw["_invalid"])
+    keys = _key_list(raw.get("key", raw.get("keys", raw.get("keyword"))))
+    if not keys:
+        raise ValueError("entry has no key")
+    secondary = keys[1:] + _key_list(raw.get("keysecondary", raw.get("secondary_keys")))
+    content = raw.get("content")
+    if content is not None and not isinstance(content, str):
+        raise ValueError("content is not a string")
+
+    enabled = not _as_bool(raw.get("disable", False))
+    if "enabled" in raw:
+        enabled = enabled and _as_bool(raw["enabled"])
+    extensions = raw.get("extensions") if isinstance(raw.get("extensions"), dict) else {}
+    return {
+        "keyword": keys[0],
+        "content": content or "",
+        "book": book,
+        "secondary_keys": ",".join(dict.fromkeys(secondary)) or None,
+        "constant": _as_bool(raw.get("constant", False)),
+        "enabled": enabled,
+        "priority": _as_int(raw.get("priority", extensions.get("priority"))),
+        "insertion_order": _as_int(raw.get("insertion_order", raw.get("order"))),
+        "keyword_en": raw.get("keyword_en", extensions.get("keyword_en")) or None,
+        "content_en": raw.get("content_en", extensions.get("content_en")) or None,
+        "source": "host",
+    }
+
+def upsert_entries(rows: List[dict]) -> int:
+    """
+    Inserts or updates a batch of entries in one transaction.
+    Stored translations are kept unless the file brings its own, and
+    content_en is cleared when the content changed, so backfill redoes it.
+    """
+    # One statement can't touch the same key twice; the last one in the file wins
+    rows = list({row["keyword"]: row for row in rows}.values())
+    if not rows:
+        return 0
+    now = datetime.datetime.utcnow()
+    for row in rows:
+        row.setdefault("created_at", now)
+    table = LoreEntry.__table__
+    stmt = sqlite_insert(table).values(rows)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.keyword],
+        set_={
+            "content": excluded.content,
+            "book": excluded.book,
+            "secondary_keys": excluded.secondary_keys,
+            "constant": excluded.constant,
+            "enabled": excluded.enabled,
+            "priority": excluded.priority,
+            "insertion_order": excluded.insertion_order,
+            "source": excluded.source,
+            "keyword_en": func.coalesce(excluded.keyword_en, table.c.keyword_en),
+            "content_en": func.coalesce(
+                excluded.content_en,
+                case((table.c.content == excluded.content, table.c.content_en), else_=None)
+            ),
+        },
+    )
+    with engine.begin() as conn:
+        conn.execute(stmt)
+    return len(rows)
+
+def entry_to_world_info(entry: LoreEntry, uid: int) -> dict:
+    """SillyTavern-compatible entry; fields ST doesn't know go under extensions."""
+    return {
+        "uid": uid,
+        "key": [entry.keyword],
+        "keysecondary": _key_list(entry.secondary_keys),
+        "comment": entry.keyword_en or "",
+        "content": entry.content,
+        "constant": entry.constant,
+        "disable": not entry.enabled,
+        "order": entry.insertion_order,
+        "extensions": {
+            "priority": entry.priority,
+            "keyword_en": entry.keyword_en,
+            "content_en": entry.content_en,
+        },
+    }
+
+def export_world_info(book: Optional[str]) -> Iterator[str]:
+    """
+    Yields a World Info file for one book (all books if None) piece by piece,
+    reading the table a page at a time (keyset pagination on keyword).
+    """
+    yield '{"entries": {'
+    uid = 0
+    last_keyword = None
+    with Session(engine) as session:
+        while True:
+            query = select(LoreEntry).order_by(LoreEntry.keyword).limit(EXPORT_PAGE_SIZE)
+            if book:
+                query = query.where(LoreEntry.book == book)
+            if last_keyword is not None:
+                query = query.where(LoreEntry.keyword > last_keyword)
+            page = session.exec(query).all()
+            if not page:
+                break
+            parts = []
+            for entry in page:
+                data = json.dumps(entry_to_world_info(entry, uid), ensure_ascii=False)
+                parts.append(f'{"," if uid else ""}\n"{uid}": {data}')
+                uid += 1
+            last_keyword = page[-1].keyword
+            # Don't keep the page's objects around in the identity map
+            session.expunge_all()
+            yield "".join(parts)
+    yield "\n}}\n"
+
+class TranslationBackfill:
+    """
+    Fills in missing keyword_en/content_en for imported entries in the
+    background, a batch at a time, so imports never wait on translation.
+    """
+    BATCH_SIZE = 50
+
+    def __init__(self):
+        self.jobs = {} # book -> progress
+        self._tasks = {} # book -> asyncio.Task
+
+    def start(self, book: str, translator, on_done: Callable[[str], None]):
+        """Starts a backfill for the book, or has the running one go over the book again."""
+        task = self._tasks.get(book)
+        if task and not task.done():
+            self.jobs[book]["rerun"] = True
+            return
+        self._tasks[book] = asyncio.create_task(self._run(book, translator, on_done))
+
+    async def _run(self, book: str, translator, on_done: Callable[[str], None]):
+        job = {"status": "running", "translated": 0, "started": datetime.datetime.utcnow().isoformat()}
+        self.jobs[book] = job
+        last_keyword = ""
+        try:
+            while True:
+                with Session(engine) as session:
+                    batch = session.exec(
+                        select(LoreEntry.keyword, LoreEntry.content, LoreEntry.keyword_en, LoreEntry.content_en)
+                        .where(LoreEntry.book == book, LoreEntry.keyword > last_keyword)
+                        .where((LoreEntry.keyword_en == None) | ((LoreEntry.content_en == None) & (LoreEntry.content != "")))
+                        .order_by(LoreEntry.keyword)
+                        .limit(self.BATCH_SIZE)
+                    ).all()
+                if not batch:
+                    # Entries imported while we were running may sort before last_keyword
+                    if not job.pop("rerun", False):
+                        break
+                    last_keyword = ""
+                    continue
+                last_keyword = batch[-1][0]
+
+                items = []
+                for keyword, content, keyword_en, content_en in batch:
+                    items.append((keyword if not keyword_en else "", "en"))
+                    items.append((content if not content_en else "", "en"))
+                translated = await translator.translate_many(items)
+
+                with Session(engine) as session:
+                    for i, (keyword, _, keyword_en, content_en) in enumerate(batch):
+                        entry = session.get(LoreEntry, keyword)
+                        if not entry:
+                            continue
+                        entry.keyword_en = entry.keyword_en or translated[2 * i] or None
+                        entry.content_en = entry.content_en or translated[2 * i + 1] or None
+                        session.add(entry)
+                    session.commit()
+                job["translated"] += len(batch)
+            job["status"] = "done"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            print(f"[LoreIO] Translation backfill for '{book}' failed: {e}")
+        finally:
+            job["finished"] = datetime.datetime.utcnow().isoformat()
+            on_done(book)
+
+translation_backfill = TranslationBackfill()
@@ -0,0 +1,156 @@
+import math
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Chat templates add a few tokens per message (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Scripts where one character is roughly one token
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff66-\uff9f]")
+
+class HeuristicTokenizer:
+    """
+    Fast, dependency-free estimate: one token per CJK character,
+    about four characters per token for everything else.
+    """
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        cjk = len(_CJK_RE.findall(text))
+        rest = len(text) - cjk
+        return cjk + math.ceil(rest / 4)
+
+class TiktokenTokenizer:
+    """Exact counts for OpenAI-style BPE vocabularies (needs the optional tiktoken package)."""
+    name = "tiktoken"
+
+    def __init__(self, encoding: str = "cl100k_base"):
+        import tiktoken
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+TOKENIZERS: Dict[str, Callable[[], object]] = {
+    "heuristic": HeuristicTokenizer,
+    "tiktoken": TiktokenTokenizer,
+}
+
+def register_tokenizer(name: str, factory: Callable[[], object]):
+    """Adds a tokenizer (any object with count(text) -> int) selectable via llm.tokenizer."""
+    TOKENIZERS[name] = factory
+
+def get_tokenizer(name: str):
+    """Returns the named tokenizer, falling back to the heuristic one if it can't be loaded."""
+    factory = TOKENIZERS.get(name, HeuristicTokenizer)
+    try:
+        return factory()
+    except Exception as e:
+        print(f"[PromptBudget] Tokenizer '{name}' unavailable ({e}), using heuristic")
+        return HeuristicTokenizer()
+
+def _trim_lines(tokenizer, text: str, budget: int, keep: str) -> str:
+    """
+    Cuts whole lines until text fits in budget. The first line is treated
+    as the section header and kept. keep="start" drops lines from the end,
+    keep="end" drops the oldest lines after the header.
+    """
+    if budget <= 0:
+        return ""
+    lines = text.split("\n")
+    header, body = lines[0], lines[1:]
+    if tokenizer.count(header) > budget:
+        return ""
+    # Per-line counts (+1 for the newline) avoid re-counting the whole text per cut
+    costs = [tokenizer.count(line) + 1 for line in body]
+    total = tokenizer.count(header) + sum(costs)
+    while body and total > budget:
+        if keep == "end":
+            body.pop(0)
+            total -= costs.pop(0)
+        else:
+            body.pop()
+            total -= costs.pop()
+    # A header with nothing under it is just noise
+    return "\n".join([header] + body) if body else ""
+
+def _truncate_chars(tokenizer, text: str, budget: int) -> str:
+    """Hard cut for text that must be sent (e.g. the visitor's message)."""
+    if tokenizer.count(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if tokenizer.count(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+class ContextBudget:
+    """
+    Fits an assembled prompt into max_prompt_tokens.
+
+    The system prompt and the latest message are always sent (the message is
+    cut only if it alone overflows). Optional sections are then admitted in
+    priority order and trimmed by lines, and the conversation history keeps
+    its newest messages that still fit.
+    """
+    def __init__(self, max_tokens: int, tokenizer):
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer
+
+    def fit(self, system: str, message: str, sections: List[Tuple[str, Optional[str], str]], history: List[dict]):
+        """
+        sections: (name, text, keep) in priority order; keep is "start" or "end".
+        Returns (message, {name: text}, history, report).
+        """
+        count = self.tokenizer.count
+        report = {"budget": self.max_tokens, "tokenizer": self.tokenizer.name, "sections": {}}
+
+        def note(name: str, original: int, used: int):
+            report["sections"][name] = {"tokens": used, "requested": original, "trimmed": used < original}
+
+        system_tokens = count(system) + MESSAGE_OVERHEAD_TOKENS
+        note("system", system_tokens, system_tokens)
+        remaining = self.max_tokens - system_tokens
+
+        message_tokens = count(message) + MESSAGE_OVERHEAD_TOKENS
+        if message_tokens > remaining:
+            message = _truncate_chars(self.tokenizer, message, max(remaining - MESSAGE_OVERHEAD_TOKENS, 0))
+        used = count(message) + MESSAGE_OVERHEAD_TOKENS
+        note("message", message_tokens, used)
+        remaining -= used
+
+        fitted = {}
+        for name, text, keep in sections:
+            if not text:
+                continue
+            original = count(text)
+            if original > remaining:
+                text = _trim_lines(self.tokenizer, text, remaining, keep)
+            used = count(text) if text else 0
+            note(name, original, used)
+            remaining -= used
+            if text:
+                fitted[name] = text
+
+        kept = []
+        history = history or []
+        history_tokens = [count(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in history]
+        for msg, tokens in zip(reversed(history), reversed(history_tokens)):
+            if tokens > remaining:
+                break
+            kept.append(msg)
+            remaining -= tokens
+        kept.reverse()
+        if history:
+            note("history", sum(history_tokens), sum(history_tokens[len(history) - len(kept):]))
+            report["sections"]["history"]["messages_dropped"] = len(history) - len(kept)
+
+        report["total"] = self.max_tokens - remaining
+        return message, fitted, kept, report
@@ -0,0 +1,133 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+def backoff_delay(attempt: int, base: float, cap: float = 10.0) -> float:
+    """Exponential backoff with full jitter, so retrying callers don't stampede together."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    closed    -> calls go through, consecutive failures are counted
+    open      -> calls fail fast with CircuitOpenError until reset_seconds pass
+                 (or a background probe succeeds)
+    half_open -> one trial call is let through; success closes, failure re-opens
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 probe: Optional[Callable[[], Awaitable[None]]] = None, probe_interval: float = 5.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.probe = probe
+        self.probe_interval = probe_interval
+
+        self.consecutive_failures = 0
+        self.opened_until = 0.0
+        self._is_open = False
+        # A trial that never reports back (e.g. cancelled) doesn't block the next one forever
+        self._trial_until = 0.0
+        self._probe_task: Optional[asyncio.Task] = None
+
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if not self._is_open:
+            return self.CLOSED
+        if time.monotonic() >= self.opened_until:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def retry_after(self) -> float:
+        return max(self.opened_until - time.monotonic(), 1.0)
+
+    def check(self):
+        """Like before_call, but doesn't use up the half-open trial (for early admission checks)."""
+        if self.state == self.OPEN:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call should not be attempted right now."""
+        state = self.state
+        if state == self.CLOSED:
+            return
+        now = time.monotonic()
+        if state == self.HALF_OPEN and now >= self._trial_until:
+            self._trial_until = now + self.reset_seconds
+            return
+        self.rejected += 1
+        raise CircuitOpenError(self.name, self.retry_after())
+
+    def record_success(self):
+        if self._is_open:
+            print(f"[CircuitBreaker] {self.name} recovered, closing circuit")
+        self.consecutive_failures = 0
+        self._is_open = False
+        self._trial_until = 0.0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._trial_until = 0.0
+        if self._is_open or self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        if not self._is_open:
+            self.times_opened += 1
+            print(f"[CircuitBreaker] {self.name} opened after {self.consecutive_failures} failures")
+        self._is_open = True
+        self.opened_until = time.monotonic() + self.reset_seconds
+        self._start_probe()
+
+    def _start_probe(self):
+        if not self.probe or (self._probe_task and not self._probe_task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Sync callers just wait for half-open
+            return
+        self._probe_task = loop.create_task(self._probe_loop())
+
+    async def _probe_loop(self):
+        while self._is_open:
+            await asyncio.sleep(self.probe_interval)
+            if not self._is_open:
+                return
+            try:
+                await self.probe()
+            except Exception:
+                continue
+            self.record_success()
+
+    def reset(self):
+        """Forgets all failures (e.g. after the dependency was reconfigured)."""
+        if self._probe_task and not self._probe_task.done():
+            self._probe_task.cancel()
+        self.consecutive_failures = 0
+        self._is_open = False
+        self._trial_until = 0.0
+
+    def snapshot(self) -> dict:
+        state = self.state
+        return {
+            "state": state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after": round(self.retry_after(), 1) if state == self.OPEN else None,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
@@ -1,10 +1,131 @@
 from typing import Dict, List, Optional
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 import html
 from app.core.config import config
 import time
 import asyncio
+import json
 import httpx
-from app.core.llm import llm_client
+from app.core.llm import llm_client, LLMUnavailableError
+
+class GenerationScheduler:
+    """
+    Admits LLM generations up to a concurrency limit.
+
+    Waiters are queued per visitor (FIFO within a visitor) and visitors are
+    served round-robin, so one chatty visitor can't starve the others.
+    Lower priority values are served first; host messages jump the queue.
+    """
+    PRIORITY_HOST = 0
+    PRIORITY_VISITOR = 1
+
+    def __init__(self, max_concurrent: int = 1):
+        self.max_concurrent = max(1, max_concurrent)
+        self.active = 0
+        # priority -> OrderedDict(visitor_id -> deque of [future, enqueued_at])
+        self._queues: Dict[int, OrderedDict] = {}
+
+        self.admitted = 0
+        self.max_wait = 0.0
+        self._recent_waits = deque(maxlen=100)
+
+    def set_max_concurrent(self, max_concurrent: int):
+        self.max_concurrent = max(1, max_concurrent)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, visitor_id: str, priority: int = PRIORITY_VISITOR):
+        """Waits for a generation slot and holds it for the duration of the block."""
+        await self._acquire(visitor_id, priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, visitor_id: str, priority: int):
+        enqueued_at = time.monotonic()
+        if self.active < self.max_concurrent and not self.queue_depth():
+            self.active += 1
+            self._record_wait(0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [future, enqueued_at]
+        visitors = self._queues.setdefault(priority, OrderedDict())
+        visitors.setdefault(visitor_id, deque()).append(entry)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was handed to us just as we got cancelled; pass it on
+                self._release()
+            else:
+                self._discard(priority, visitor_id, entry)
+            raise
+        self._record_wait(time.monotonic() - enqueued_at)
+
+    def _release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.active < self.max_concurrent:
+            entry = self._next_waiter()
+            if entry is None:
+                break
+            self.active += 1
+            entry[0].set_result(None)
+
+    def _next_waiter(self):
+        for priority in sorted(self._queues):
+            visitors = self._queues[priority]
+            while visitors:
+                visitor_id, queue = next(iter(visitors.items()))
+                # Round-robin: the served visitor goes to the back of the line
+                visitors.move_to_end(visitor_id)
+                entry = queue.popleft()
+                if not queue:
+                    del visitors[visitor_id]
+                if not entry[0].done():
+                    return entry
+        return None
+
+    def _discard(self, priority: int, visitor_id: str, entry: list):
+        visitors = self._queues.get(priority, {})
+        queue = visitors.get(visitor_id)
+        if queue and entry in queue:
+            queue.remove(entry)
+            if not queue:
+                del visitors[visitor_id]
+
+    def _record_wait(self, waited: float):
+        self.admitted += 1
+        self.max_wait = max(self.max_wait, waited)
+        self._recent_waits.append(waited)
+
+    def queue_depth(self) -> int:
+        return sum(len(q) for visitors in self._queues.values() for q in visitors.values())
+
+    def stats(self) -> dict:
+        waiting_visitors = {}
+        for visitors in self._queues.values():
+            for visitor_id, queue in visitors.items():
+                waiting_visitors[visitor_id] = waiting_visitors.get(visitor_id, 0) + len(queue)
+        now = time.monotonic()
+        oldest = [now - q[0][1] for visitors in self._queues.values() for q in visitors.values() if q]
+        recent = list(self._recent_waits)
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": self.queue_depth(),
+            "waiting_visitors": waiting_visitors,
+            "oldest_wait_seconds": round(max(oldest), 3) if oldest else 0.0,
+            "avg_wait_seconds": round(sum(recent) / len(recent), 3) if recent else 0.0,
+            "max_wait_seconds": round(self.max_wait, 3),
+            "admitted": self.admitted,
+        }
 
 class RoomManager:
     def __init__(self):
@@ -12,15 +133,32 @@ class RoomManager:
         self.active_visitors: Dict[str, dict] = {}
         # List of { timestamp, sender_id, sender_name, message }
         self.chat_history: List[dict] = []
+        self._message_seq = 0
         self._max_capacity = config.room.max_visitors
         
-        # New Feature: Room Status & Locking
+        # New Feature: Room Status & Scheduling
         self.is_open = True
-        self.processing_lock = asyncio.Lock()
+        self.scheduler = GenerationScheduler(self._generation_limit())
         
         # Track outgoing agents: target_url -> task
         self.active_agents: Dict[str, asyncio.Task] = {}
 
+        # In-flight generations per visitor, so leaving/expiry can cancel them
+        self.generation_tasks: Dict[str, set] = {}
+        # reason ("leave", "expired", "disconnect") -> count
+        self.cancelled_generations: Dict[str, int] = {}
+
+    def _generation_limit(self) -> int:
+        """Configured concurrency, or the total capacity of the LLM backend pool."""
+        if config.room.max_concurrent_generations:
+            return config.room.max_concurrent_generations
+        return sum(b.max_concurrency for b in llm_client.pool.backends)
+
+    def apply_config(self):
+        """Picks up room settings changed from the dashboard."""
+        self._max_capacity = config.room.max_visitors
+        self.scheduler.set_max_concurrent(self._generation_limit())
+
     def can_accept_visitor(self, visitor_id: str) -> bool:
         if not self.is_open:
             return False
@@ -43,10 +181,52 @@ class RoomManager:
             "model": model
         }
 
+    def touch_visitor(self, visitor_id: str):
+        """Refreshes last_seen so visitors who keep chatting don't expire mid-conversation."""
+        if visitor_id in self.active_visitors:
+            self.active_visitors[visitor_id]["last_seen"] = time.time()
+
     def remove_visitor(self, visitor_id: str):
-        """Explicitly removes a visitor."""
+        """Explicitly removes a visitor and cancels whatever is still being generated for them."""
         if visitor_id in self.active_visitors:
             del self.active_visitors[visitor_id]
+        self.cancel_generations(visitor_id, "leave")
+
+    def track_generation(self, visitor_id: str, task: asyncio.Task):
+        self.generation_tasks.setdefault(visitor_id, set()).add(task)
+
+    def untrack_generation(self, visitor_id: str, task: asyncio.Task):
+        tasks = self.generation_tasks.get(visitor_id)
+        if tasks:
+            tasks.discard(task)
+            if not tasks:
+                del self.generation_tasks[visitor_id]
+
+    def cancel_generations(self, visitor_id: str, reason: str, task: asyncio.Task = None) -> int:
+        """
+        Cancels a visitor's in-flight generations (or just `task`).
+        Cancellation frees their scheduler slot and aborts the upstream request.
+        Cancelled tasks are untracked right away, so they are only counted once
+        even if the visitor leaves again before the task has unwound.
+        """
+        tracked = self.generation_tasks.get(visitor_id, set())
+        tasks = list(tracked) if task is None else list({task} & tracked)
+        cancelled = 0
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+                self.untrack_generation(visitor_id, t)
+                cancelled += 1
+        if cancelled:
+            self.cancelled_generations[reason] = self.cancelled_generations.get(reason, 0) + cancelled
+            print(f"[RoomManager] Cancelled {cancelled} generation(s) for {visitor_id} ({reason})")
+        return cancelled
+
+    def generation_stats(self) -> dict:
+        return {
+            "in_flight": sum(len(tasks) for tasks in self.generation_tasks.values()),
+            "cancelled": dict(self.cancelled_generations),
+        }
 
     def sanitize(self, text: str) -> str:
         """
@@ -57,11 +237,16 @@ class RoomManager:
             return ""
         return html.escape(str(text))
 
-    def add_message(self, sender_id: str, sender_name: str, content: str, is_human: bool = False, model: str = None):
+    def add_message(self, sender_id: str, sender_name: str, content: str, is_human: bool = False, model: str = None) -> str:
+        """Appends a message to the room and returns its id (for update_message)."""
         safe_content = self.sanitize(content)
+        now = time.time()
+        self._message_seq += 1
+        message_id = f"{now}-{self._message_seq}" # Simple ID, unique even within one clock tick
         self.chat_history.append({
-            "id": str(time.time()), # Simple ID
-            "timestamp": time.time(),
+            "id": message_id,
+            "timestamp": now,
+            "updated_at": now, # Bumped by update_message so pollers pick up edits
             "sender_id": sender_id,
             "sender_name": self.sanitize(sender_name),
             "content": safe_content,
@@ -71,6 +256,16 @@ class RoomManager:
         # Keep history manageable
         if len(self.chat_history) > 100:
             self.chat_history.pop(0)
+        return message_id
+
+    def update_message(self, message_id: str, content: str) -> bool:
+        """Replaces a message's content (e.g. once its translation arrives). False if it already scrolled out."""
+        for msg in reversed(self.chat_history):
+            if msg["id"] == message_id:
+                msg["content"] = self.sanitize(content)
+                msg["updated_at"] = time.time()
+                return True
+        return False
 
     def _cleanup_inactive(self):
         """Removes visitors who haven't been seen in the last 10 minutes."""
@@ -78,6 +273,7 @@ class RoomManager:
         expired = [vid for vid, data in self.active_visitors.items() if now - data["last_seen"] > 600]
         for vid in expired:
             del self.active_visitors[vid]
+            self.cancel_generations(vid, "expired")
 
     def get_active_visitor_count(self) -> int:
         self._cleanup_inactive()
@@ -109,6 +305,44 @@ class RoomManager:
             
         return context_str
 
+    async def _post_turn(self, client: httpx.AsyncClient, url: str, payload: dict, timeout: float) -> dict:
+        """
+        Sends a /visit or /chat turn, preferring the remote room's SSE stream.
+        Falls back to the plain JSON endpoint for rooms without streaming.
+        Returns the final response body either way.
+        """
+        headers = {"Accept": "text/event-stream"}
+        async with client.stream("POST", f"{url}/stream", json=payload, headers=headers, timeout=timeout) as resp:
+            if resp.status_code not in (404, 405):
+                resp.raise_for_status()
+                if resp.headers.get("content-type", "").startswith("text/event-stream"):
+                    return await self._read_sse_result(resp)
+                # Early replies (e.g. !learn) come back as plain JSON
+                await resp.aread()
+                return resp.json()
+
+        resp = await client.post(url, json=payload, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def _read_sse_result(self, resp: httpx.Response) -> dict:
+        """Consumes an SSE reply and returns the payload of its 'done' event."""
+        event = None
+        tokens = []
+        async for line in resp.aiter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):].strip())
+                if event == "token":
+                    tokens.append(data.get("text", ""))
+                elif event == "done":
+                    return data
+            elif not line:
+                event = None
+        # Stream ended without a 'done' event; use what we received
+        return {"response": "".join(tokens)}
+
     async def start_agent_visit(self, target_url: str):
         """Starts a background task to visit another room."""
         if target_url in self.active_agents:
@@ -137,9 +371,7 @@ class RoomManager:
                 }
                 
                 try:
-                    resp = await client.post(f"{target_url.rstrip('/')}/visit", json=payload, timeout=10.0)
-                    resp.raise_for_status()
-                    data = resp.json()
+                    data = await self._post_turn(client, f"{target_url.rstrip('/')}/visit", payload, timeout=10.0)
                     
                     # Session ID from their room
                     their_session_id = data.get("session_id")
@@ -162,12 +394,17 @@ class RoomManager:
                     
                     # 2. My Turn (Generate Response)
                     # We reuse log_visit logic conceptually or just generate
-                    my_reply = llm_client.generate_response(
-                        visitor_name=their_host_name,
-                        message=their_reply,
-                        context=[], 
-                        relationship_context=f"You are visiting {target_url}. Be polite and curious."
-                    )
+                    try:
+                        async with self.scheduler.slot(f"AGENT:{target_url}"):
+                            my_reply = await llm_client.agenerate_response(
+                                visitor_name=their_host_name,
+                                message=their_reply,
+                                context=[], 
+                                relationship_context=f"You are visiting {target_url}. Be polite and curious."
+                            )
+                    except LLMUnavailableError as e:
+                        self.add_message("SYSTEM", "System", f"⚠️ {e}. Ending visit.")
+                        break
                     
                     # Log My Reply (Monitor)
                     self.add_message("AGENT", f"{my_name} (Agent)", my_reply)
@@ -186,9 +423,7 @@ class RoomManager:
                     }
                     
                     try:
-                        c_resp = await client.post(f"{target_url.rstrip('/')}/chat", json=chat_payload, timeout=30.0)
-                        c_resp.raise_for_status()
-                        c_data = c_resp.json()
+                        c_data = await self._post_turn(client, f"{target_url.rstrip('/')}/chat", chat_payload, timeout=30.0)
                         
                         their_reply = c_data.get("response", "")
                         self.add_message("REMOTE", f"{their_host_name} (Remote)", their_reply, model=c_data.get("model"))
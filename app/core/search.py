@@ -0,0 +1,106 @@
+import html
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from app.core import database
+
+# The trigram tokenizer can't match terms shorter than this; those fall back to LIKE
+MIN_TERM_CHARS = 3
+# snippet() markers, swapped for <mark> after the text around them is HTML-escaped
+_OPEN, _CLOSE = "\x02", "\x03"
+SNIPPET_TOKENS = 16
+# bm25 column weights for lore_fts: keyword hits rank above content hits
+LORE_WEIGHTS = {"keyword": 10.0, "secondary_keys": 5.0, "content": 1.0, "keyword_en": 5.0, "content_en": 1.0}
+
+class SearchUnavailable(Exception):
+    pass
+
+def parse_query(query: str) -> Tuple[str, List[str]]:
+    """
+    Turns free text into an FTS5 expression that matches all terms as literal
+    substrings (no operator syntax leaks through). Returns the expression and
+    the terms too short for the trigram index.
+    """
+    terms = query.split()
+    phrases = ['"' + t.replace('"', '""') + '"' for t in terms if len(t) >= MIN_TERM_CHARS]
+    short = [t for t in terms if len(t) < MIN_TERM_CHARS]
+    return " ".join(phrases), short
+
+def highlight(snippet: str) -> str:
+    return html.escape(snippet or "").replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+def _like(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def _search(fts: str, source: str, rowid: str, select_columns: str, columns: List[str], preview: str,
+            query: str, filters: List[Tuple[str, object]], limit: int, offset: int, weights: Optional[List[float]] = None,
+            order: str = "rank"):
+    if not database.fts_available:
+        raise SearchUnavailable("full-text search needs SQLite with FTS5 (3.34+)")
+    expression, short = parse_query(query)
+    if not expression and not short:
+        return 0, []
+
+    params = {"limit": limit, "offset": offset}
+    where = []
+    for i, (column, value) in enumerate(filters):
+        where.append(f"s.{column} = :f{i}")
+        params[f"f{i}"] = value
+    # Short terms: substring match on the source row, in any searched column
+    for i, term in enumerate(short):
+        where.append("(" + " OR ".join(f"s.{c} LIKE :s{i} ESCAPE '\\'" for c in columns) + ")")
+        params[f"s{i}"] = _like(term)
+
+    if expression:
+        params["match"] = expression
+        bm25 = f"bm25({fts}{''.join(f', {w}' for w in weights or [])})"
+        base = f"FROM {fts} JOIN {source} s ON s.{rowid} = {fts}.rowid WHERE {fts} MATCH :match"
+        snippet = f"snippet({fts}, -1, '{_OPEN}', '{_CLOSE}', '…', {SNIPPET_TOKENS})"
+        score = bm25
+    else:
+        base = f"FROM {source} s WHERE 1"
+        # Nothing for snippet() to work with; show the start of the text
+        snippet = f"substr(s.{preview}, 1, 200)"
+        score = "0.0"
+    if where:
+        base += " AND " + " AND ".join(where)
+
+    order_by = f"s.{rowid} DESC" if order == "recent" or not expression else "score"
+    with database.engine.connect() as conn:
+        total = conn.execute(text(f"SELECT count(*) {base}"), params).scalar()
+        rows = conn.execute(text(
+            f"SELECT {select_columns}, {snippet} AS snippet, {score} AS score {base} "
+            f"ORDER BY {order_by} LIMIT :limit OFFSET :offset"
+        ), params).mappings().all()
+
+    results = []
+    for row in rows:
+        result = dict(row)
+        result["snippet"] = highlight(result["snippet"]) if expression else html.escape(result["snippet"] or "")
+        # bm25() is lower-is-better; flip it so bigger means more relevant
+        result["score"] = round(-result["score"], 4) if expression else None
+        results.append(result)
+    return total, results
+
+def search_lore(query: str, book: Optional[str] = None, limit: int = 20, offset: int = 0):
+    filters = [("book", book)] if book else []
+    total, results = _search(
+        "lore_fts", "loreentry", "rowid",
+        "s.keyword, s.keyword_en, s.book, s.enabled, s.constant",
+        database.LORE_FTS_COLUMNS, "content", query, filters, limit, offset,
+        weights=list(LORE_WEIGHTS.values()),
+    )
+    for result in results:
+        # Raw SQL hands back SQLite's 0/1
+        result["enabled"] = bool(result["enabled"])
+        result["constant"] = bool(result["constant"])
+    return total, results
+
+def search_logs(query: str, visitor_id: Optional[str] = None, sender: Optional[str] = None,
+                limit: int = 20, offset: int = 0, order: str = "rank"):
+    filters = [(c, v) for c, v in (("visitor_id", visitor_id), ("sender", sender)) if v]
+    return _search(
+        # The view holds the messages unescaped (see database.LOG_TEXT_VIEW)
+        "log_fts", database.LOG_TEXT_VIEW, "id",
+        "s.id, s.timestamp, s.session_id, s.visitor_id, s.sender",
+        ["message"], "message", query, filters, limit, offset, order=order,
+    )
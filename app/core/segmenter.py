@@ -0,0 +1,118 @@
+from typing import List
+
+# Full-width terminators end a sentence on their own, no space follows them
+CJK_TERMINATORS = "。！？"
+# ASCII terminators only count when followed by whitespace ("3.14", "e.g.x" stay whole)
+TERMINATORS = ".!?…"
+# Closing quotes/brackets belong to the sentence they close
+CLOSERS = "\"'”’」』）)]】》"
+
+_BOUNDARY_CHARS = frozenset(CJK_TERMINATORS + TERMINATORS + "\n")
+
+_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "vs", "etc", "e.g", "i.e", "jr", "sr", "prof"}
+
+class SentenceSegmenter:
+    """
+    Cuts text into sentences as it streams in.
+    feed() returns the sentences completed so far, flush() the remainder.
+    Segments keep their surrounding whitespace, so "".join(segments) == the input.
+    """
+    def __init__(self):
+        self.buffer = ""
+        # Deltas not yet joined onto buffer: joining on every delta would copy
+        # the whole unfinished sentence each time
+        self._pending = []
+        self._size = 0
+        # Everything before this offset is known to hold no boundary, so each
+        # scan only covers the new text (plus an unfinished terminator run)
+        self._scan = 0
+
+    def feed(self, text: str) -> List[str]:
+        self._pending.append(text)
+        fully_scanned = self._scan == self._size
+        self._size += len(text)
+        if fully_scanned and _BOUNDARY_CHARS.isdisjoint(text):
+            # Nothing in here can end a sentence
+            self._scan = self._size
+            return []
+        self._join()
+        return self._drain(final=False)
+
+    def _join(self):
+        if self._pending:
+            self.buffer += "".join(self._pending)
+            self._pending = []
+
+    def flush(self) -> List[str]:
+        self._join()
+        segments = self._drain(final=True)
+        if self.buffer:
+            segments.append(self.buffer)
+            self.buffer = ""
+        self._size = self._scan = 0
+        return segments
+
+    def _drain(self, final: bool) -> List[str]:
+        segments = []
+        while True:
+            cut = self._boundary(final)
+            if cut is None:
+                return segments
+            segments.append(self.buffer[:cut])
+            self.buffer = self.buffer[cut:]
+            self._size = len(self.buffer)
+            self._scan = 0
+
+    def _boundary(self, final: bool):
+        """End index of the first complete sentence in the buffer, or None if there isn't one yet."""
+        buf = self.buffer
+        n = len(buf)
+        i = self._scan
+        while i < n:
+            ch = buf[i]
+            if ch == "\n":
+                return self._skip_space(i, i, final)
+            if ch in CJK_TERMINATORS or ch in TERMINATORS:
+                j = i + 1
+                while j < n and (buf[j] in CJK_TERMINATORS or buf[j] in TERMINATORS or buf[j] in CLOSERS):
+                    j += 1
+                if j == n and not final:
+                    # A closer or more punctuation may still arrive; look at this run again then
+                    self._scan = i
+                    return None
+                if ch in CJK_TERMINATORS:
+                    return self._skip_space(i, j, final)
+                if j == n or buf[j].isspace():
+                    if ch == "." and self._is_abbreviation(buf, i):
+                        i = j
+                        continue
+                    return self._skip_space(i, j, final)
+                i = j
+                continue
+            i += 1
+        self._scan = n
+        return None
+
+    def _skip_space(self, start: int, j: int, final: bool):
+        # Trailing whitespace (including the newline itself) stays with the sentence,
+        # so the cut waits until something else follows it
+        buf = self.buffer
+        while j < len(buf) and buf[j].isspace():
+            j += 1
+        if j == len(buf) and not final:
+            self._scan = start
+            return None
+        return j
+
+    @staticmethod
+    def _is_abbreviation(buf: str, end: int) -> bool:
+        """Whether the word ending at buf[end] (the period) is a known abbreviation."""
+        start = end
+        while start > 0 and (buf[start - 1] == "." or (buf[start - 1].isascii() and buf[start - 1].isalpha())):
+            start -= 1
+        return buf[start:end].lower() in _ABBREVIATIONS
+
+def split_sentences(text: str) -> List[str]:
+    """Non-streaming form: the same cuts SentenceSegmenter makes on a stream."""
+    segmenter = SentenceSegmenter()
+    return segmenter.feed(text) + segmenter.flush()
@@ -0,0 +1,219 @@
+from abc import ABC, abstractmethod
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional
+from sqlmodel import Session, select
+from app.core.database import engine, LoreEntry
+from app.core.language import detect_language, normalize_lang
+from app.core.resilience import CircuitBreaker, CircuitOpenError
+
+try:
+    import argostranslate.translate as argos_translate
+    HAS_ARGOS = True
+except ImportError:
+    HAS_ARGOS = False
+
+class TranslationUnavailable(Exception):
+    """A backend can't translate this text (busy, broken, or no model for the pair)."""
+
+class TranslationBackend(ABC):
+    name = "base"
+    # Whether results may go into the translation cache (memory and SQLite).
+    # Stand-ins (stub, offline) stay out, so a cached entry is always the real
+    # backend's answer and a fallback is retried on the next call
+    cacheable = True
+
+    @abstractmethod
+    def translate(self, text: str, source: str, target: str) -> str:
+        pass
+
+class GoogleBackend(TranslationBackend):
+    """Google Translate via deep_translator (needs network access)."""
+    name = "google"
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        from deep_translator import GoogleTranslator
+        return GoogleTranslator(source=source, target=target).translate(text)
+
+class OfflineBackend(TranslationBackend):
+    """
+    Works without network access. Uses Argos Translate when it is installed
+    (and a model for the language pair is present); otherwise falls back to
+    a glossary of the keyword/content translations stored in the lorebook.
+    Not cached: it is the fallback for when the online backend is down, and
+    the glossary changes with the lorebook.
+    """
+    name = "offline"
+    cacheable = False
+
+    def __init__(self):
+        self._glossary: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Forget the glossary (e.g. after lore edits)."""
+        self._glossary = None
+
+    def _load_glossary(self) -> Dict[str, str]:
+        with self._lock:
+            if self._glossary is None:
+                glossary = {}
+                with Session(engine) as session:
+                    for entry in session.exec(select(LoreEntry)).all():
+                        if entry.keyword_en:
+                            glossary[entry.keyword] = entry.keyword_en
+                        if entry.content_en:
+                            glossary[entry.content] = entry.content_en
+                self._glossary = glossary
+            return self._glossary
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        if source == "auto":
+            source = detect_language(text)
+        if HAS_ARGOS and source:
+            try:
+                return argos_translate.translate(text, normalize_lang(source), normalize_lang(target))
+            except Exception as e:
+                print(f"[Translation] Argos failed ({e}), trying glossary")
+        # Lorebook translations only go to English
+        if normalize_lang(target) == "en":
+            translated = self._load_glossary().get(text.strip())
+            if translated:
+                return translated
+        raise TranslationUnavailable(f"no offline translation for {source or 'unknown'} -> {target}")
+
+class StubBackend(TranslationBackend):
+    """Deterministic fake for tests and demos: '[ja] text'."""
+    name = "stub"
+    cacheable = False
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        return f"[{target}] {text}"
+
+BACKENDS: Dict[str, Callable[[], TranslationBackend]] = {
+    "google": GoogleBackend,
+    "offline": OfflineBackend,
+    "stub": StubBackend,
+}
+
+def register_backend(name: str, factory: Callable[[], TranslationBackend]):
+    """Adds a backend selectable in translation.backends."""
+    BACKENDS[name] = factory
+
+# Shared by all backends; a call that overruns its timeout keeps its thread
+# (and its concurrency slot) until the underlying request returns
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="translate")
+
+class GuardedBackend:
+    """One configured backend with its own timeout, concurrency cap and circuit breaker."""
+    def __init__(self, backend: TranslationBackend, backend_config):
+        self.backend = backend
+        self.timeout = backend_config.timeout
+        self.max_concurrency = max(1, backend_config.max_concurrency)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self.breaker = CircuitBreaker(
+            f"translation backend '{backend.name}'",
+            failure_threshold=backend_config.breaker_failure_threshold,
+            reset_seconds=backend_config.breaker_reset_seconds
+        )
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    @property
+    def name(self) -> str:
+        return self.backend.name
+
+    def _run(self, text: str, source: str, target: str) -> str:
+        try:
+            return self.backend.translate(text, source, target)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        """Raises TranslationUnavailable (or the backend's error) so the caller can fail over."""
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            raise TranslationUnavailable(str(e))
+        # Don't queue behind a saturated backend; the next one may be free
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TranslationUnavailable(f"{self.name} is at its concurrency limit")
+
+        with self._lock:
+            self.in_flight += 1
+            self.calls += 1
+        future = _executor.submit(self._run, text, source, target)
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.timeouts += 1
+            self.failures += 1
+            self.breaker.record_failure()
+            raise TranslationUnavailable(f"{self.name} timed out after {self.timeout}s")
+        except TranslationUnavailable:
+            # Answered, just can't do this pair
+            self.breaker.record_success()
+            raise
+        except Exception:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        if not result:
+            raise TranslationUnavailable(f"{self.name} returned nothing")
+        return result
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "timeout": self.timeout,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "breaker": self.breaker.snapshot(),
+        }
+
+class BackendChain:
+    """Tries the configured backends in order until one of them translates the text."""
+    def __init__(self, backends: List[GuardedBackend]):
+        self.backends = backends
+        self.all_failed = 0
+
+    def translate(self, text: str, source: str, target: str):
+        """Returns (translated text, backend that produced it). Raises TranslationUnavailable if all failed."""
+        errors = []
+        for guarded in self.backends:
+            try:
+                return guarded.translate(text, source, target), guarded.backend
+            except Exception as e:
+                errors.append(f"{guarded.name}: {e}")
+        self.all_failed += 1
+        raise TranslationUnavailable("; ".join(errors) or "no translation backends configured")
+
+    def invalidate(self):
+        for guarded in self.backends:
+            if hasattr(guarded.backend, "invalidate"):
+                guarded.backend.invalidate()
+
+    def status(self) -> dict:
+        return {
+            "backends": [b.status() for b in self.backends],
+            "all_failed": self.all_failed,
+        }
+
+def build_chain(translation_config) -> BackendChain:
+    backends = []
+    for backend_config in translation_config.backends:
+        factory = BACKENDS.get(backend_config.name)
+        if not factory:
+            print(f"[Translation] Unknown backend '{backend_config.name}', skipping")
+            continue
+        backends.append(GuardedBackend(factory(), backend_config))
+    return BackendChain(backends)
@@ -1,24 +1,347 @@
-from deep_translator import GoogleTranslator
+import asyncio
+import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select, func, delete
 from app.core.config import config
+from app.core.database import engine, TranslationCacheEntry, LoreEntry
+from app.core.language import detect_language, normalize_lang, HAS_LANGDETECT
+from app.core.translation_backends import build_chain
+from app.core.segmenter import SentenceSegmenter
+
+class TranslationCache:
+    """
+    Two tiers: an in-process LRU in front of the TranslationCacheEntry table,
+    so translations survive restarts. Keyed by (sha256(text), source, target).
+    Thread-safe, since translations may run in worker threads.
+    Hits only bump last_used in memory; those touches are written back in one
+    batch every so often (and before pruning), not with a commit per hit.
+    """
+    # Pruning the table is a COUNT + DELETE, so only check every so often
+    PRUNE_EVERY_WRITES = 256
+    # Pending last_used touches are flushed once there are this many, or this old
+    FLUSH_EVERY_TOUCHES = 64
+    FLUSH_INTERVAL_SECONDS = 60.0
+
+    def __init__(self, cache_config):
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._touched = {} # key -> last_used not yet written to the table
+        self._last_flush = time.monotonic()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.pruned = 0
+        self.configure(cache_config)
+
+    def configure(self, cache_config):
+        self.enabled = cache_config.enabled
+        self.memory_entries = cache_config.memory_entries
+        self.max_db_entries = cache_config.max_db_entries
+        with self._lock:
+            self._trim_memory()
+
+    @staticmethod
+    def make_key(text: str, source: str, target: str) -> tuple:
+        return (hashlib.sha256(text.encode("utf-8")).hexdigest(), source, target)
+
+    def _trim_memory(self):
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _remember(self, key: tuple, translated: str):
+        with self._lock:
+            self._memory[key] = translated
+            self._memory.move_to_end(key)
+            self._trim_memory()
+
+    def get(self, text: str, source: str, target: str):
+        if not self.enabled:
+            return None
+        key = self.make_key(text, source, target)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                translated = self._memory[key]
+            else:
+                translated = None
+
+        if translated is None:
+            try:
+                with Session(engine) as session:
+                    translated = session.exec(
+                        select(TranslationCacheEntry.translated).where(
+                            TranslationCacheEntry.text_hash == key[0],
+                            TranslationCacheEntry.source == key[1],
+                            TranslationCacheEntry.target == key[2],
+                        )
+                    ).first()
+            except Exception as e:
+                print(f"[TranslationCache] Lookup failed: {e}")
+            if translated is None:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+            self._remember(key, translated)
+
+        with self._lock:
+            self._touched[key] = datetime.datetime.utcnow()
+            due = (len(self._touched) >= self.FLUSH_EVERY_TOUCHES
+                   or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL_SECONDS)
+        if due:
+            self.flush()
+        return translated
+
+    def put(self, text: str, source: str, target: str, translated: str, persist: bool = True):
+        """persist=False keeps the translation in the memory tier only."""
+        if not self.enabled:
+            return
+        key = self.make_key(text, source, target)
+        self._remember(key, translated)
+        if not persist:
+            return
+        with self._lock:
+            self._touched.pop(key, None) # The upsert sets last_used itself
+        try:
+            with Session(engine) as session:
+                self._upsert(session, key, translated)
+                session.commit()
+            self.writes += 1
+            if self.writes % self.PRUNE_EVERY_WRITES == 0:
+                self.prune()
+        except Exception as e:
+            print(f"[TranslationCache] Write failed: {e}")
+
+    @staticmethod
+    def _upsert(session: Session, key: tuple, translated: str):
+        entry = session.get(TranslationCacheEntry, key)
+        if entry:
+            entry.translated = translated
+            entry.last_used = datetime.datetime.utcnow()
+        else:
+            entry = TranslationCacheEntry(text_hash=key[0], source=key[1], target=key[2], translated=translated)
+        session.add(entry)
+
+    def flush(self) -> int:
+        """Writes the pending last_used touches back in one batch."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._last_flush = time.monotonic()
+        if not touched:
+            return 0
+        table = TranslationCacheEntry.__table__
+        stmt = (
+            update(table)
+            .where(table.c.text_hash == bindparam("key_hash"),
+                   table.c.source == bindparam("key_source"),
+                   table.c.target == bindparam("key_target"))
+            .values(last_used=bindparam("used"))
+        )
+        rows = [{"key_hash": h, "key_source": src, "key_target": tgt, "used": used}
+                for (h, src, tgt), used in touched.items()]
+        try:
+            with engine.begin() as conn:
+                conn.execute(stmt, rows)
+        except Exception as e:
+            print(f"[TranslationCache] Flushing hits failed: {e}")
+            return 0
+        return len(rows)
+
+    def prune(self) -> int:
+        """Deletes the least recently used rows beyond max_db_entries."""
+        self.flush() # So recent hits count
+        with Session(engine) as session:
+            total = session.exec(select(func.count()).select_from(TranslationCacheEntry)).one()
+            excess = total - self.max_db_entries
+            if excess <= 0:
+                return 0
+            cutoff = session.exec(
+                select(TranslationCacheEntry.last_used)
+                .order_by(TranslationCacheEntry.last_used)
+                .offset(excess - 1).limit(1)
+            ).one()
+            result = session.exec(delete(TranslationCacheEntry).where(TranslationCacheEntry.last_used <= cutoff))
+            session.commit()
+        self.pruned += result.rowcount
+        print(f"[TranslationCache] Pruned {result.rowcount} old entries")
+        return result.rowcount
+
+    def warm_from_lore(self) -> int:
+        """
+        Seeds the cache with the keyword/content -> English pairs already stored
+        on lore entries, so saving or re-importing them doesn't hit the network.
+        """
+        if not self.enabled:
+            return 0
+        with Session(engine) as session:
+            pairs = session.exec(select(
+                LoreEntry.keyword, LoreEntry.keyword_en, LoreEntry.content, LoreEntry.content_en
+            )).all()
+        # One upsert for the whole lorebook; a key can only appear once in it
+        seeded = {}
+        for keyword, keyword_en, content, content_en in pairs:
+            for original, english in ((keyword, keyword_en), (content, content_en)):
+                if original and english:
+                    seeded[self.make_key(original, "auto", "en")] = english
+        if seeded:
+            now = datetime.datetime.utcnow()
+            table = TranslationCacheEntry.__table__
+            stmt = sqlite_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.text_hash, table.c.source, table.c.target],
+                set_={"translated": stmt.excluded.translated, "last_used": stmt.excluded.last_used},
+            )
+            rows = [{"text_hash": h, "source": src, "target": tgt, "translated": english,
+                     "created_at": now, "last_used": now}
+                    for (h, src, tgt), english in seeded.items()]
+            with engine.begin() as conn:
+                conn.execute(stmt, rows)
+            for key, english in seeded.items():
+                self._remember(key, english)
+        print(f"[TranslationCache] Warmed {len(seeded)} translations from the lorebook")
+        return len(seeded)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+        with Session(engine) as session:
+            session.exec(delete(TranslationCacheEntry))
+            session.commit()
+
+    def snapshot(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            "memory_limit": self.memory_entries,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 3) if lookups else None,
+            "writes": self.writes,
+            "pruned": self.pruned,
+            "pending_touches": len(self._touched),
+        }
 
 class TranslatorService:
     def __init__(self):
-        # We will initialize the translator dynamically to support config changes
-        pass
+        self.cache = TranslationCache(config.translation.cache)
+        self.backends = build_chain(config.translation)
+        self._max_concurrency = None
+        self._semaphore = None
+        # Calls short-circuited because the text already was in the target language
+        self.skipped_same_language = 0
+
+    def _limit(self) -> asyncio.Semaphore:
+        # Rebuilt when the dashboard changes the limit
+        if self._max_concurrency != config.translation.max_concurrency:
+            self._max_concurrency = config.translation.max_concurrency
+            self._semaphore = asyncio.Semaphore(max(1, self._max_concurrency))
+        return self._semaphore
 
-    def translate(self, text: str, target_lang: str = "ja") -> str:
+    def configure(self):
+        """Picks up translation settings changed from the dashboard."""
+        self.cache.configure(config.translation.cache)
+        self.backends = build_chain(config.translation)
+
+    def translate(self, text: str, target_lang: str = "ja", persist: bool = True) -> str:
         """
         Translates text to the target language.
         Returns original text if translation fails or is disabled.
+        persist=False leaves the result out of the SQLite tier (one-off text).
         """
         if not text:
             return ""
-            
+
+        if detect_language(text) == normalize_lang(target_lang):
+            self.skipped_same_language += 1
+            return text
+
+        cached = self.cache.get(text, "auto", target_lang)
+        if cached is not None:
+            return cached
+
         try:
-            translator = GoogleTranslator(source='auto', target=target_lang)
-            return translator.translate(text)
+            translated, backend = self.backends.translate(text, "auto", target_lang)
         except Exception as e:
+            # The untranslated text is returned but never cached
             print(f"Translation failed: {e}")
             return text
+        # Only real translations are cached; stub and offline fallback results
+        # would otherwise be served from SQLite long after the backend recovers
+        if backend.cacheable:
+            self.cache.put(text, "auto", target_lang, translated, persist=persist)
+        return translated
+
+    def stats(self) -> dict:
+        return {
+            "detector": "script+langdetect" if HAS_LANGDETECT else "script",
+            "skipped_same_language": self.skipped_same_language,
+            "cache": self.cache.snapshot(),
+            **self.backends.status(),
+        }
+
+    async def atranslate(self, text: str, target_lang: str = "ja", persist: bool = True) -> str:
+        """translate() in a worker thread, so the HTTP round trip doesn't block the event loop."""
+        return (await self.translate_many([(text, target_lang)], persist=persist))[0]
+
+    async def translate_many(self, items: list[tuple[str, str]], persist: bool = True) -> list[str]:
+        """
+        Translates several (text, target_lang) pairs at once and returns the
+        results in the same order. Duplicate pairs are translated once, and
+        at most translation.max_concurrency requests run at a time.
+        """
+        unique = list(dict.fromkeys((text, target) for text, target in items if text))
+        limit = self._limit()
+
+        async def run(text: str, target: str) -> str:
+            async with limit:
+                return await asyncio.to_thread(self.translate, text, target, persist)
+
+        translated = await asyncio.gather(*(run(text, target) for text, target in unique))
+        results = dict(zip(unique, translated))
+        return [results.get((text, target), "") for text, target in items]
+
+    async def _translate_segment(self, segment: str, target_lang: str) -> str:
+        # Whitespace around the sentence is kept as-is, so segments join back up exactly
+        core = segment.strip()
+        if not core:
+            return segment
+        lead = segment[:len(segment) - len(segment.lstrip())]
+        trail = segment[len(segment.rstrip()):]
+        # Preview sentences rarely recur, so they'd only bloat (and churn) the SQLite tier
+        return lead + await self.atranslate(core, target_lang, persist=False) + trail
+
+    async def translate_stream(self, deltas, target_lang: str):
+        """
+        Consumes streamed model output and yields it translated, one sentence
+        at a time and in order. Each sentence is sent off as soon as it is
+        complete, while the model keeps generating the next ones.
+        Sentences are translated without the context of their neighbours, so
+        this is only the live preview; the reply that gets logged is the whole
+        response translated in one call (see main._finish_*_turn).
+        """
+        segmenter = SentenceSegmenter()
+        pending = deque()
+        try:
+            async for delta in deltas:
+                for segment in segmenter.feed(delta):
+                    pending.append(asyncio.ensure_future(self._translate_segment(segment, target_lang)))
+                while pending and pending[0].done():
+                    yield pending.popleft().result()
+            for segment in segmenter.flush():
+                pending.append(asyncio.ensure_future(self._translate_segment(segment, target_lang)))
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
 
 translator = TranslatorService()
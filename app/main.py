@@ -1,21 +1,34 @@
-from fastapi import FastAPI, HTTPException, Header, Depends, Query, UploadFile, File, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Header, Depends, Query, UploadFile, File, BackgroundTasks, Request
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Annotated
 import shutil
 import os
+import json
+import math
 from sqlmodel import Session
-from app.core.llm import llm_client
+from app.core.llm import llm_client, LLMUnavailableError
 from app.core.config import config, Config, save_config
 from app.core.translator import translator
-from app.core.database import create_db_and_tables, get_session, log_visit, get_relationship, ConversationLog, LoreEntry, CharacterCard
+from app.core.database import create_db_and_tables, get_session, log_visit, get_relationship, ConversationLog, LoreEntry, LoreEmbedding, CharacterCard
 
 from contextlib import asynccontextmanager
 from app.core.tunnel import start_tunnel
 from app.core.room_manager import room_manager
+from app.core.lore_index import lore_index, ALL_BOOKS
+from app.core.lore_embeddings import lore_embeddings
+from app.core.search import search_lore, search_logs, SearchUnavailable
+from app.core import lore_bulk
+from app.core.lore_io import (
+    WorldInfoParser, WorldInfoParseError, entry_from_world_info, upsert_entries,
+    export_world_info, translation_backfill, IMPORT_BATCH_SIZE
+)
 from app.core.discovery import get_discovery_client
 import uuid
+import datetime
+import time
+from urllib.parse import quote
 
 import asyncio
 
@@ -52,6 +65,10 @@ async def lifespan(app: FastAPI):
     os.makedirs("app/static/cards", exist_ok=True)
     
     create_db_and_tables()
+    # One batched upsert, but still off the startup path for big lorebooks
+    _spawn(asyncio.to_thread(translator.cache.warm_from_lore))
+    if config.lore.semantic:
+        lore_embeddings.available() # Warns if numpy is missing
     GLOBAL_PUBLIC_URL = start_tunnel(PORT)
     if GLOBAL_PUBLIC_URL:
         print(f"!!! RoomVerse Node is LIVE at: {GLOBAL_PUBLIC_URL} !!!")
@@ -60,10 +77,24 @@ async def lifespan(app: FastAPI):
     asyncio.create_task(announce_presence_task())
     
     yield
-    # Shutdown logic if needed
+    # Shutdown
+    translator.cache.flush() # Pending hit touches
 
 app = FastAPI(title="RoomVerse Node", version="0.1.0", lifespan=lifespan)
 
+@app.exception_handler(SearchUnavailable)
+async def search_unavailable_handler(request: Request, exc: SearchUnavailable):
+    return JSONResponse(status_code=501, content={"detail": str(exc)})
+
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailableError):
+    """Fail fast while the LLM circuit breaker is open instead of queueing behind a dead backend."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
 # Mount static files for Dashboard
 app.mount("/dashboard", StaticFiles(directory="app/static", html=True), name="static")
 
@@ -90,6 +121,7 @@ class VisitRequest(BaseModel):
     callback_url: str | None = None
     context: list[dict] = []
     model: str | None = None
+    no_cache: bool = False # Skip the LLM response cache for this turn
 
 class VisitResponse(BaseModel):
     host_name: str
@@ -100,6 +132,7 @@ class ChatRequest(BaseModel):
     session_id: str | None = None
     message: str
     model: str | None = None
+    no_cache: bool = False # Skip the LLM response cache for this turn
 
 class ChatResponse(BaseModel):
     session_id: str
@@ -136,6 +169,36 @@ async def detect_llms():
     results = await scanner.scan_all()
     return results
 
+@app.get("/api/llm/stats")
+async def get_llm_stats():
+    """
+    Prompt prefix stability, backend prompt-cache counters, pool status,
+    response cache counters, per-section token usage of recent prompts
+    and the circuit breaker state.
+    """
+    return {
+        "prefix": llm_client.prefix_stats.snapshot(),
+        "backends": llm_client.pool.status(),
+        "response_cache": llm_client.response_cache.snapshot(),
+        "prompt_budget": list(llm_client.budget_reports),
+        "breaker": llm_client.breaker.snapshot(),
+    }
+
+@app.get("/api/translation/stats")
+async def get_translation_stats():
+    """Translations skipped by language detection and hit/miss counters of the translation cache."""
+    return translator.stats()
+
+@app.post("/api/translation/cache/warm")
+async def warm_translation_cache():
+    """Seeds the translation cache from the English columns of the lorebook."""
+    return {"warmed": await asyncio.to_thread(translator.cache.warm_from_lore)}
+
+@app.delete("/api/translation/cache")
+async def clear_translation_cache():
+    translator.cache.clear()
+    return {"status": "cleared"}
+
 @app.get("/api/config")
 async def get_config():
     return config
@@ -144,9 +207,14 @@ async def get_config():
 async def update_config(new_config: Config):
     # Update global config object
     global config
+    if new_config.character.active_lorebook != config.character.active_lorebook:
+        # Free the book we're switching away from; the new one is built on first use
+        lore_index.invalidate([config.character.active_lorebook])
+        lore_embeddings.invalidate([config.character.active_lorebook])
     config.character = new_config.character
     config.llm = new_config.llm
     config.translation = new_config.translation
+    config.lore = new_config.lore
     config.room = new_config.room
     config.dashboard = new_config.dashboard
     config.security = new_config.security
@@ -154,8 +222,10 @@ async def update_config(new_config: Config):
     save_config(config)
     
     llm_client.character = config.character
-    llm_client.character = config.character
-    llm_client.model = config.llm.model
+    llm_client.reload()
+    llm_client.invalidate_prompt_cache()
+    room_manager.apply_config()
+    translator.configure()
     
     # Trigger Announcement if enabled and URL exists
     if config.room.auto_announce and GLOBAL_PUBLIC_URL:
@@ -176,9 +246,9 @@ async def update_config(new_config: Config):
 @app.get("/api/room/messages")
 async def get_room_messages(since: float = 0):
     """
-    Returns chat messages since the given timestamp.
+    Returns chat messages added or updated since the given timestamp.
     """
-    messages = [m for m in room_manager.chat_history if m["timestamp"] > since]
+    messages = [m for m in room_manager.chat_history if m["updated_at"] > since]
     return messages
 
 # ------------------
@@ -283,6 +353,16 @@ async def get_log_sessions():
     # Re-sort? They are already roughly sorted by Newest group first because we iterated Newest->Oldest.
     return sessions_list
 
+@app.get("/api/logs/search")
+async def search_log_messages(q: str, visitor_id: str | None = None, sender: str | None = None,
+                              order: str = "rank", limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0)):
+    """
+    Full-text search over conversation logs. order: "rank" (bm25) or "recent".
+    Snippets are HTML-escaped with the matches wrapped in <mark>.
+    """
+    total, results = await asyncio.to_thread(search_logs, q, visitor_id, sender, limit, offset, order)
+    return {"query": q, "total": total, "limit": limit, "offset": offset, "results": results}
+
 @app.get("/api/logs/messages/{session_id}")
 async def get_log_messages(session_id: str):
     from app.core import database
@@ -406,6 +486,107 @@ async def list_lore_books():
             books = ["Default"] + [b for b in books if b != "Default"]
         return sorted(list(set(books)))
 
+@app.get("/api/lore/search")
+async def search_lore_entries(q: str, book: str | None = None,
+                              limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0)):
+    """Full-text search over lore entries (keywords, aliases, content, translations), best matches first."""
+    total, results = await asyncio.to_thread(search_lore, q, None if book == ALL_BOOKS else book, limit, offset)
+    return {"query": q, "total": total, "limit": limit, "offset": offset, "results": results}
+
+@app.get("/api/lore/stats")
+async def get_lore_stats():
+    """Size and build counters of the per-book keyword indexes, plus recent lore selections."""
+    return {"index": lore_index.stats(), "embeddings": lore_embeddings.stats(), "backfill": translation_backfill.jobs}
+
+# Per-entry errors listed in an import report (the count is always complete)
+MAX_IMPORT_ERRORS = 100
+
+@app.post("/api/lore/import")
+async def import_lorebook(request: Request, book: str = "Imported"):
+    """
+    Imports a SillyTavern World Info JSON file, sent as the raw request body,
+    into a book. The file is parsed as it arrives and upserted in batches;
+    an existing keyword is overwritten even if it was in another book.
+    Missing English translations are filled in afterwards, in the background.
+    """
+    started = time.perf_counter()
+    parser = WorldInfoParser()
+    batch, errors = [], []
+    counts = {"imported": 0, "batches": 0, "bytes": 0, "errors": 0}
+    parse_error = None
+
+    def add_error(error: dict):
+        if len(errors) < MAX_IMPORT_ERRORS:
+            errors.append(error)
+
+    def collect(raw_entries: list):
+        first = parser.count - len(raw_entries)
+        for i, raw in enumerate(raw_entries, first):
+            try:
+                batch.append(entry_from_world_info(raw, book))
+            except ValueError as e:
+                counts["errors"] += 1
+                add_error({"index": i, "key": raw.get("key", raw.get("uid")), "error": str(e)})
+
+    async def flush():
+        rows = batch[:]
+        batch.clear()
+        try:
+            counts["imported"] += await asyncio.to_thread(upsert_entries, rows)
+            counts["batches"] += 1
+        except Exception as e:
+            counts["errors"] += len(rows)
+            add_error({"keys": [rows[0]["keyword"], rows[-1]["keyword"]], "error": f"batch failed: {e}"})
+
+    try:
+        async for chunk in request.stream():
+            counts["bytes"] += len(chunk)
+            collect(parser.feed(chunk))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await flush()
+        collect(parser.close())
+    except WorldInfoParseError as e:
+        parse_error = str(e)
+    if batch:
+        await flush()
+
+    if parse_error and not counts["imported"]:
+        raise HTTPException(status_code=400, detail=f"Could not import: {parse_error}")
+
+    # Keywords may have moved here from other books
+    _on_lore_changed()
+    backfill_queued = bool(counts["imported"]) and config.translation.enabled
+    if backfill_queued:
+        translation_backfill.start(book, translator, _on_lore_changed)
+
+    seconds = time.perf_counter() - started
+    print(f"[LoreIO] Imported {counts['imported']} entries into '{book}' in {seconds:.2f}s ({counts['errors']} errors)")
+    return {
+        "status": "partial" if parse_error else "imported",
+        "book": book,
+        "imported": counts["imported"],
+        "parsed": parser.count,
+        "batches": counts["batches"],
+        "bytes": counts["bytes"],
+        "seconds": round(seconds, 3),
+        "entries_per_second": round(counts["imported"] / seconds, 1) if seconds else None,
+        "error_count": counts["errors"],
+        "errors": errors,
+        "parse_error": parse_error,
+        "backfill_queued": backfill_queued,
+    }
+
+@app.get("/api/lore/export")
+async def export_lorebook(book: str | None = None):
+    """Streams a book (or every book) out as a SillyTavern World Info JSON file."""
+    target = None if not book or book == ALL_BOOKS else book
+    filename = quote(f"{target or 'lorebook'}.json")
+    return StreamingResponse(
+        export_world_info(target),
+        media_type="application/json",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"}
+    )
+
 class LoreEntryRequest(BaseModel):
     keyword: str
     content: str
@@ -417,6 +598,8 @@ class LoreEntryRequest(BaseModel):
     secondary_keys: str | None = None
     constant: bool = False
     enabled: bool = True
+    priority: int = 0
+    insertion_order: int = 0
 
 @app.post("/api/lore")
 async def save_lore_entry(entry: LoreEntryRequest):
@@ -427,18 +610,19 @@ async def save_lore_entry(entry: LoreEntryRequest):
     cnt_en = entry.content_en
     
     if config.translation.enabled:
-        if not kw_en and entry.keyword:
-             try:
-                 kw_en = translator.translate(entry.keyword, target_lang="en")
-             except: pass
-        if not cnt_en and entry.content:
-             try:
-                 cnt_en = translator.translate(entry.content, target_lang="en")
-             except: pass
+        # Both fields in one go; empty or already-given ones come back as ""
+        kw_new, cnt_new = await translator.translate_many([
+            (entry.keyword if not kw_en else "", "en"),
+            (entry.content if not cnt_en else "", "en"),
+        ])
+        kw_en = kw_en or kw_new or None
+        cnt_en = cnt_en or cnt_new or None
 
     with get_session_wrapper() as session:
         existing = session.get(LoreEntry, entry.keyword)
+        touched_books = {entry.book}
         if existing:
+            touched_books.add(existing.book) # Entry may be moving between books
             existing.content = entry.content
             existing.source = entry.source
             if kw_en: existing.keyword_en = kw_en
@@ -448,6 +632,8 @@ async def save_lore_entry(entry: LoreEntryRequest):
             existing.secondary_keys = entry.secondary_keys
             existing.constant = entry.constant
             existing.enabled = entry.enabled
+            existing.priority = entry.priority
+            existing.insertion_order = entry.insertion_order
             session.add(existing)
         else:
             new_entry = LoreEntry(
@@ -459,30 +645,74 @@ async def save_lore_entry(entry: LoreEntryRequest):
                 book=entry.book,
                 secondary_keys=entry.secondary_keys,
                 constant=entry.constant,
-                enabled=entry.enabled
+                enabled=entry.enabled,
+                priority=entry.priority,
+                insertion_order=entry.insertion_order
             )
             session.add(new_entry)
         session.commit()
+    _on_lore_changed(*touched_books)
     return {"status": "saved", "keyword": entry.keyword}
 
 @app.put("/api/lore/books/{old_name}")
 async def rename_lorebook(old_name: str, new_name: str):
-    """Rename a lorebook (update 'book' field for all entries)."""
-    with get_session_wrapper() as session:
-        # sqlmodel update not supported directly? Use statement
-        from sqlmodel import select
-        statement = select(LoreEntry).where(LoreEntry.book == old_name)
-        entries = session.exec(statement).all()
-        
-        count = 0
-        for entry in entries:
-            entry.book = new_name
-            session.add(entry)
-            count += 1
-        
-        session.commit()
+    """Rename a lorebook (one UPDATE of the 'book' field); renaming onto an existing book merges them."""
+    count = await asyncio.to_thread(lore_bulk.rename_book, old_name, new_name)
+    _on_lore_changed(old_name, new_name)
     return {"status": "renamed", "count": count, "old_name": old_name, "new_name": new_name}
 
+@app.post("/api/lore/books/{name}/copy")
+async def copy_lorebook(name: str, new_name: str, suffix: str | None = None):
+    """
+    Copy a lorebook. Keywords are unique across books, so copies are named
+    "keyword (new_name)" (or keyword + suffix) and keep the original keyword
+    as their first secondary key.
+    """
+    suffix = suffix if suffix else f" ({new_name})"
+    copied, skipped = await asyncio.to_thread(lore_bulk.copy_book, name, new_name, suffix)
+    _on_lore_changed(new_name)
+    return {"status": "copied", "count": copied, "skipped": skipped, "old_name": name, "new_name": new_name}
+
+class LoreMergeRequest(BaseModel):
+    sources: list[str]
+    target: str
+
+@app.post("/api/lore/books/merge")
+async def merge_lorebooks(request: LoreMergeRequest):
+    """Move every entry of the source books into the target book."""
+    count = await asyncio.to_thread(lore_bulk.merge_books, request.sources, request.target)
+    _on_lore_changed(request.target, *request.sources)
+    return {"status": "merged", "count": count, "target": request.target}
+
+class LoreEnableRequest(BaseModel):
+    enabled: bool
+    keywords: list[str] | None = None # None = the whole book
+
+@app.put("/api/lore/books/{name}/enabled")
+async def set_lorebook_enabled(name: str, request: LoreEnableRequest):
+    """Enable or disable a whole lorebook, or some of its entries."""
+    count = await asyncio.to_thread(lore_bulk.set_enabled, name, request.enabled, request.keywords)
+    _on_lore_changed(name)
+    return {"status": "enabled" if request.enabled else "disabled", "count": count, "book": name}
+
+@app.delete("/api/lore/books/{name}")
+async def delete_lorebook(name: str):
+    """Delete a lorebook and all of its entries."""
+    count = await asyncio.to_thread(lore_bulk.delete_book, name)
+    _on_lore_changed(name)
+    return {"status": "deleted", "count": count, "book": name}
+
+class LoreMoveRequest(BaseModel):
+    keywords: list[str]
+    target: str
+
+@app.post("/api/lore/move")
+async def move_lore_entries(request: LoreMoveRequest):
+    """Move entries (from whichever books they are in) to the target book."""
+    count, sources = await asyncio.to_thread(lore_bulk.move_entries, request.keywords, request.target)
+    _on_lore_changed(request.target, *sources)
+    return {"status": "moved", "count": count, "target": request.target}
+
 # --- Character Card API ---
 
 class CardCreate(BaseModel):
@@ -527,10 +757,12 @@ async def update_card(card_id: int, card_data: CardCreate):
         card_dict = card_data.model_dump(exclude_unset=True)
         for key, value in card_dict.items():
             setattr(card, key, value)
+        card.updated_at = datetime.datetime.utcnow()
             
         session.add(card)
         session.commit()
         session.refresh(card)
+        llm_client.invalidate_prompt_cache()
         return card
 
 @app.delete("/api/cards/{card_id}")
@@ -548,6 +780,7 @@ async def delete_card(card_id: int):
             
         session.delete(card)
         session.commit()
+        llm_client.invalidate_prompt_cache()
         return {"status": "deleted", "id": card_id}
 
 @app.post("/api/cards/{card_id}/activate")
@@ -565,6 +798,7 @@ async def activate_card(card_id: int):
         # For now, just link ID. Logic will use Card Name if linked.
         config.character.name = card.name 
         save_config(config)
+        llm_client.invalidate_prompt_cache()
         return {"status": "activated", "card": card}
 
 @app.post("/api/cards/deactivate")
@@ -572,6 +806,7 @@ async def deactivate_card():
     """Unset active card."""
     config.character.active_card_id = None
     save_config(config)
+    llm_client.invalidate_prompt_cache()
     return {"status": "deactivated"}
 
 @app.post("/api/cards/{card_id}/image")
@@ -611,8 +846,13 @@ async def delete_lore_entry(keyword: str):
     """Delete a lore entry."""
     from sqlmodel import delete
     with get_session_wrapper() as session:
+        existing = session.get(LoreEntry, keyword)
+        book = existing.book if existing else None
+        session.exec(delete(LoreEmbedding).where(LoreEmbedding.keyword == keyword))
         session.exec(delete(LoreEntry).where(LoreEntry.keyword == keyword))
         session.commit()
+    if book:
+        _on_lore_changed(book)
     return {"status": "deleted", "keyword": keyword}
 
 # Helper wrapper for session since dependency might not work in simple calls
@@ -620,79 +860,37 @@ def get_session_wrapper():
     from app.core.database import engine
     return Session(engine)
 
-def get_lore_context(session: Session, message: str, depth: int = 2) -> str:
+def _on_lore_changed(*books: str):
+    """
+    Drops everything derived from the lorebook. Call after any lore write,
+    with the books it touched (none = all books).
+    """
+    lore_index.invalidate(books or None)
+    lore_embeddings.invalidate(books or None)
+    translator.backends.invalidate() # Offline backend's glossary
+
+async def get_lore_context(message: str) -> str:
     """
     Recursively find lore entries matching keywords in the message.
-    Supports bilingual search (keyword or keyword_en).
+    Supports bilingual search (keyword, keyword_en and secondary keys).
+    Constant entries are always included, budget permitting (see BookIndex.select).
+    With lore.semantic on, entries similar to the message are added too.
+    Served from lore_index and lore_embeddings; both (re)build books off the
+    event loop, each with its own session.
     """
-    from sqlmodel import select
-    
-    found_entries = {} # keyword -> content_to_use
-    search_text = message.lower()
-    
-    # Get all lore for current book (or Default)
-    active_book = config.character.active_lorebook
-    # We fetch ALL enabled entries for the active book
-    query = select(LoreEntry).where(LoreEntry.enabled == True)
-    if active_book != "All": # option to have All? stick to specific for now
-        query = query.where(LoreEntry.book == active_book)
-        
-    all_lore = session.exec(query).all()
-    if not all_lore:
-        return ""
-        
-    # Check constants first
-    constants = [e.content for e in all_lore if e.constant]
-    
-    for _ in range(depth):
-        new_found = False
-        for entry in all_lore:
-            if entry.keyword in found_entries:
-                continue
-
-            # Check primary keyword
-            matched = False
-            keys = [entry.keyword.lower()]
-            
-            # Check secondary keys
-            if entry.secondary_keys:
-                keys.extend([k.strip().lower() for k in entry.secondary_keys.split(',')])
-            
-            # Check translation keyword
-            if entry.keyword_en:
-                 keys.append(entry.keyword_en.lower())
-
-            # Perform match
-            for k in keys:
-                if k and k in search_text:
-                    matched = True
-                    break
-            
-            if matched:
-                found_entries[entry.keyword] = entry.content # use translated content?
-                # Logic: if message is translated, response should be in...
-                # Actually LLM handles it. Just inject content.
-                search_text += " " + entry.content.lower()
-            if matched and entry.keyword not in found_entries:
-                # Use English content if available, else native
-                use_content = entry.content_en if entry.content_en else entry.content
-                found_entries[entry.keyword] = (entry.keyword_en, use_content)
-                
-                search_text += f" {use_content}".lower() # Append content to search for nested keywords
-                new_found = True
-        
-        if not new_found:
-            break
-            
-    if not found_entries:
+    book = config.character.active_lorebook
+    index = await lore_index.aget(book)
+    if not index.entry_count:
         return ""
-        
-    context_str = "[Lorebook Info]\n"
-    for k, (k_en, v) in found_entries.items():
-        label = f"{k} ({k_en})" if k_en else k
-        context_str += f"- {label}: {v}\n"
-    
-    return context_str
+
+    similar = await lore_embeddings.asearch(book, message, config.lore) if config.lore.semantic else []
+    keywords, report = index.select(
+        message, config.lore.scan_depth, config.lore.token_budget, llm_client.tokenizer,
+        semantic=[keyword for keyword, _ in similar]
+    )
+    report["similar"] = similar
+    lore_index.record_selection(report)
+    return index.render(keywords)
 
 # --- Public Endpoints ---
 
@@ -735,45 +933,249 @@ async def leave_room(request: dict):
         print(f"--- Visitor Left: {vid} ---")
     return {"status": "left"}
 
+def _wants_stream(http_request: Request) -> bool:
+    """Streaming is opt-in: either the /stream route or an SSE Accept header."""
+    if http_request.url.path.endswith("/stream"):
+        return True
+    return "text/event-stream" in http_request.headers.get("accept", "")
+
+def _scene_context() -> str | None:
+    """
+    Recent room conversation for the prompt, only when more than one visitor is present.
+    Read once the generation slot is held so it includes lines posted while queued.
+    """
+    visitor_count = room_manager.get_active_visitor_count()
+    if visitor_count > 1:
+        return f"[Scene Context - The room is active with {visitor_count} visitors]\n{room_manager.get_recent_context_text()}"
+    return None
+
+# How often a non-streaming request checks whether its client is still there
+DISCONNECT_POLL_SECONDS = 0.5
+
+class GenerationCancelled(Exception):
+    """The visitor left, expired or disconnected while their reply was being generated."""
+
+async def _run_generation(http_request: Request, visitor_id: str, coro):
+    """
+    Runs a generation (slot wait included) as a task tracked by room_manager,
+    so /leave and inactivity expiry can cancel it. Also cancels it as soon as
+    the client disconnects. Raises GenerationCancelled if it was cancelled.
+    """
+    task = asyncio.ensure_future(coro)
+    room_manager.track_generation(visitor_id, task)
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if not task.done() and await http_request.is_disconnected():
+                room_manager.cancel_generations(visitor_id, "disconnect", task)
+                await asyncio.wait({task})
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        room_manager.untrack_generation(visitor_id, task)
+    if task.cancelled():
+        raise GenerationCancelled()
+    return task.result()
+
+async def _stream_generation(visitor_id: str, deltas):
+    """
+    Streaming counterpart of _run_generation: the `deltas` async generator is
+    consumed by a tracked task and relayed through a queue. When the client
+    goes away Starlette cancels the response, which cancels the task too.
+    """
+    queue = asyncio.Queue()
+    end = object()
+
+    async def pump():
+        async for delta in deltas:
+            queue.put_nowait(delta)
+
+    task = asyncio.ensure_future(pump())
+    # Also fires if the task is cancelled before it ever ran
+    task.add_done_callback(lambda _: queue.put_nowait(end))
+    room_manager.track_generation(visitor_id, task)
+    try:
+        while (item := await queue.get()) is not end:
+            yield item
+    finally:
+        if not task.done():
+            room_manager.cancel_generations(visitor_id, "disconnect", task)
+        room_manager.untrack_generation(visitor_id, task)
+    if task.cancelled():
+        raise GenerationCancelled()
+    # Re-raises LLMUnavailableError etc.
+    task.result()
+
+# Fire-and-forget tasks; asyncio only keeps weak references to running tasks
+_background_tasks = set()
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def _translate_for_dashboard(text: str, room_message_id: str) -> asyncio.Task:
+    """
+    Translates a visitor message for the host's dashboard in the background,
+    so the visitor's turn doesn't wait on it. The room message is posted in
+    the original language and updated in place once the translation arrives.
+    """
+    async def run():
+        translated = await translator.atranslate(text, target_lang=config.translation.target_lang)
+        room_manager.update_message(room_message_id, room_manager.sanitize(translated))
+        return translated
+    return _spawn(run())
+
+def _log_dashboard_copy(log: ConversationLog, display_task: asyncio.Task | None):
+    """
+    Rewrites a committed ConversationLog row with the background translation
+    from _translate_for_dashboard once it is ready.
+    """
+    if display_task is None:
+        return
+    log_id = log.id
+
+    async def run():
+        translated = await display_task
+        with get_session_wrapper() as session:
+            row = session.get(ConversationLog, log_id)
+            if row:
+                row.message = room_manager.sanitize(translated)
+                session.add(row)
+                session.commit()
+    _spawn(run())
+
+def _visible_stream(visitor_id: str, deltas, translate: bool, raw: list):
+    """
+    Model output as the visitor should see it: translated sentence by sentence
+    while the model is still generating, when translation is on.
+    The untranslated deltas are collected in `raw`, for logging.
+    """
+    async def collect():
+        async for delta in _stream_generation(visitor_id, deltas):
+            raw.append(delta)
+            yield delta
+    if translate:
+        return translator.translate_stream(collect(), config.translation.target_lang)
+    return collect()
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _finish_visit_turn(request: VisitRequest, display_msg: str, response_text: str, display_task: asyncio.Task | None = None) -> str:
+    """
+    Translates the reply, posts it to the room and logs both sides of the turn.
+    The visitor's line is logged as-is if its dashboard translation (display_task)
+    is still running, and rewritten when it lands.
+    Returns the text to send back to the visitor.
+    """
+    if display_task and display_task.done() and not display_task.cancelled() and not display_task.exception():
+        display_msg = display_task.result()
+        display_task = None
+
+    # 5. Handle Response Translation for Dashboard AND Client
+    display_response = response_text
+    if config.translation.enabled:
+        display_response = await translator.atranslate(response_text, target_lang=config.translation.target_lang)
+
+    room_manager.add_message(config.instance_id, config.character.name, room_manager.sanitize(display_response))
+
+    # --- Log to DB (Visitor & Host) ---
+    # 1. Visitor Translated Message
+    # We use a temp session ID or just timestamp-based grouping later
+    temp_session_id = str(uuid.uuid4())
+
+    log_in = ConversationLog(
+        session_id=temp_session_id,
+        visitor_id=request.visitor_id,
+        sender="visitor",
+        message=room_manager.sanitize(display_msg) # Save TRANSLATED (or original if disabled)
+    )
+
+    # 2. Host Translated Response
+    log_out = ConversationLog(
+        session_id=temp_session_id,
+        visitor_id=request.visitor_id,
+        sender="ai",
+        message=room_manager.sanitize(display_response) # Save TRANSLATED
+    )
+    with get_session_wrapper() as session:
+        session.add(log_in)
+        session.add(log_out)
+        session.commit()
+        _log_dashboard_copy(log_in, display_task)
+    return display_response
+
+async def _finish_chat_turn(request: ChatRequest, session_id: str, response_text: str) -> str:
+    """
+    Translates the reply, logs it and posts it to the room.
+    Returns the text to send back to the visitor.
+    """
+    # Handle Response Translation for Dashboard AND Client
+    display_response = response_text
+    if config.translation.enabled:
+        display_response = await translator.atranslate(response_text, target_lang=config.translation.target_lang)
+
+    # Log Host Response to DB (Translated)
+    log_out = ConversationLog(
+        session_id=session_id,
+        visitor_id=request.visitor_id,
+        sender="host",
+        message=room_manager.sanitize(display_response)
+    )
+    with get_session_wrapper() as session:
+        session.add(log_out)
+        session.commit()
+
+    room_manager.add_message(config.instance_id, config.character.name, room_manager.sanitize(display_response))
+    return display_response
+
 @app.post("/visit", response_model=VisitResponse, dependencies=[Depends(verify_api_key)])
-@app.post("/visit", response_model=VisitResponse, dependencies=[Depends(verify_api_key)])
-async def visit(request: VisitRequest, session: Session = Depends(get_session)):
+@app.post("/visit/stream", response_model=VisitResponse, dependencies=[Depends(verify_api_key)])
+async def visit(request: VisitRequest, http_request: Request):
     """
     Endpoint for incoming visitors. Records the visit and starts a conversation.
+    Streams the reply as Server-Sent Events when requested (see _wants_stream).
     """
     visitor_msg_original = request.message
     
     # 1. Capacity Check & Security
     if not room_manager.can_accept_visitor(request.visitor_id):
         raise HTTPException(status_code=503, detail="Room is full")
+    llm_client.check_available()
         
     # Register & Sanitize
     room_manager.register_visitor(request.visitor_id, request.visitor_name, request.callback_url, request.model)
     
     # 2. Log Visit & Update Relationship
-    relation = log_visit(session, request.visitor_id, room_manager.sanitize(request.visitor_name), request.callback_url)
+    # Sessions here are opened per DB step and never held across an await: a pooled
+    # connection held there can't be handed to the next request, and once the pool
+    # runs dry that request blocks the event loop waiting for one.
+    # relation comes back refreshed, so it stays readable once its session is closed
+    with get_session_wrapper() as session:
+        relation = log_visit(session, request.visitor_id, room_manager.sanitize(request.visitor_name), request.callback_url)
     
     print(f"--- Incoming Visit ---")
     print(f"ID: {request.visitor_id}")
     print(f"Name: {request.visitor_name} (Affinity: {relation.affinity})")
     
-    # 3. Prepare Display Message (Translated)
+    # 3. Add to Dashboard (Sanitized); its translation only matters to the host, so it runs in the background
     display_msg = visitor_msg_original
+    room_msg_id = room_manager.add_message(request.visitor_id, request.visitor_name, room_manager.sanitize(display_msg), model=request.model)
+    display_task = None
     if config.translation.enabled:
-        # Translate for Dashboard View
-        display_msg = translator.translate(visitor_msg_original, target_lang=config.translation.target_lang)
-    
-    # Add to Dashboard (Sanitized)
-    room_manager.add_message(request.visitor_id, request.visitor_name, room_manager.sanitize(display_msg), model=request.model)
+        display_task = _translate_for_dashboard(visitor_msg_original, room_msg_id)
+
+    # Translate Input for LLM if enabled (Human -> English); this one the reply depends on
+    llm_input_msg = visitor_msg_original
+    if config.translation.enabled:
+        llm_input_msg = await translator.atranslate(visitor_msg_original, target_lang="en")
 
     print(f"Message (Original): {visitor_msg_original}")
 
     # 4. Generate Response with Relationship Context
-    
-    # Translate Input for LLM if enabled (Human -> English)
-    llm_input_msg = visitor_msg_original
-    if config.translation.enabled:
-        llm_input_msg = translator.translate(visitor_msg_original, target_lang="en")
 
     # --- Lorebook Logic (Command & Context) ---
     lore_context = ""
@@ -790,90 +1192,99 @@ async def visit(request: VisitRequest, session: Session = Depends(get_session)):
             kw_en = None
             cnt_en = None
             if config.translation.enabled:
-                try: kw_en = translator.translate(kw, target_lang="en")
-                except: pass
-                try: cnt_en = translator.translate(cnt, target_lang="en")
-                except: pass
+                kw_en, cnt_en = await translator.translate_many([(kw, "en"), (cnt, "en")])
 
             # Permission Check
             if not config.room.allow_guest_lore_updates:
                 return VisitResponse(host_name="System", response="Dictionary updates are disabled by the host.")
 
             # Save to DB
-            existing = session.get(LoreEntry, kw)
-            if existing:
-                 existing.content = cnt
-                 existing.source = "visitor"
-                 if kw_en: existing.keyword_en = kw_en
-                 if cnt_en: existing.content_en = cnt_en
-                 session.add(existing)
-            else:
-                 new_entry = LoreEntry(
-                     keyword=kw, 
-                     content=cnt, 
-                     source="visitor",
-                     keyword_en=kw_en,
-                     content_en=cnt_en
-                 )
-                 session.add(new_entry)
-            session.commit()
+            with get_session_wrapper() as session:
+                existing = session.get(LoreEntry, kw)
+                if existing:
+                     existing.content = cnt
+                     existing.source = "visitor"
+                     if kw_en: existing.keyword_en = kw_en
+                     if cnt_en: existing.content_en = cnt_en
+                     session.add(existing)
+                else:
+                     new_entry = LoreEntry(
+                         keyword=kw, 
+                         content=cnt, 
+                         source="visitor",
+                         keyword_en=kw_en,
+                         content_en=cnt_en
+                     )
+                     session.add(new_entry)
+                book = existing.book if existing else "Default"
+                session.commit()
+            _on_lore_changed(book)
             
             # System Response
             room_manager.add_message(config.instance_id, "System", f"Learned: {kw}")
             return VisitResponse(host_name="System", response=f"Allowed access to Lorebook. Registered '{kw}'.")
     
     # 2. Context Lookup
-    lore_context = get_lore_context(session, llm_input_msg)
+    lore_context = await get_lore_context(llm_input_msg)
     
     rel_context = f"Affinity Score: {relation.affinity}\n"
     if relation.memory_summary:
         rel_context += f"Memory of past interactions: {relation.memory_summary}\n"
+
+    if _wants_stream(http_request):
+        async def event_stream():
+            async def generation():
+                async with room_manager.scheduler.slot(request.visitor_id):
+                    async for delta in llm_client.astream_response(
+                        visitor_name=request.visitor_name,
+                        message=llm_input_msg,
+                        context=request.context,
+                        relationship_context=rel_context,
+                        lore_context=lore_context,
+                        scene_context=_scene_context(),
+                        use_cache=not request.no_cache
+                    ):
+                        yield delta
+
+            raw = []
+            try:
+                async for delta in _visible_stream(request.visitor_id, generation(), config.translation.enabled, raw):
+                    yield _sse("token", {"text": delta})
+            except LLMUnavailableError as e:
+                # Headers are already sent, so report it in-band
+                yield _sse("error", {"detail": str(e), "retry_after": math.ceil(e.retry_after)})
+                return
+            except GenerationCancelled:
+                yield _sse("error", {"detail": "Generation cancelled"})
+                return
+
+            # The streamed sentences were a preview; like a non-streamed reply, the
+            # logged (and final "done") text is the whole response translated at once
+            display_response = await _finish_visit_turn(request, display_msg, "".join(raw), display_task)
+
+            yield _sse("done", VisitResponse(host_name=config.character.name, response=display_response).model_dump())
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
     
-    if lore_context:
-        rel_context += f"\n{lore_context}\n"
-    
-    async with room_manager.processing_lock:
-        visitor_count = room_manager.get_active_visitor_count()
-        if visitor_count > 1:
-            scene_context = room_manager.get_recent_context_text()
-            rel_context += f"\n[Scene Context - The room is active with {visitor_count} visitors]\n{scene_context}\n"
-
-        response_text = llm_client.generate_response(
-            visitor_name=request.visitor_name,
-            message=llm_input_msg, 
-            context=request.context,
-            relationship_context=rel_context
-        )
-    
-        # 5. Handle Response Translation for Dashboard AND Client
-        display_response = response_text
-        if config.translation.enabled:
-            display_response = translator.translate(response_text, target_lang=config.translation.target_lang)
-        
-        room_manager.add_message(config.instance_id, config.character.name, room_manager.sanitize(display_response))
-        
-        # --- Log to DB (Visitor & Host) ---
-        # 1. Visitor Translated Message
-        # We use a temp session ID or just timestamp-based grouping later
-        temp_session_id = str(uuid.uuid4()) 
-        
-        log_in = database.ConversationLog(
-            session_id=temp_session_id, 
-            visitor_id=request.visitor_id, 
-            sender="visitor", 
-            message=room_manager.sanitize(display_msg) # Save TRANSLATED (or original if disabled)
-        )
-        session.add(log_in)
+    async def generation():
+        async with room_manager.scheduler.slot(request.visitor_id):
+            return await llm_client.agenerate_response(
+                visitor_name=request.visitor_name,
+                message=llm_input_msg, 
+                context=request.context,
+                relationship_context=rel_context,
+                lore_context=lore_context,
+                scene_context=_scene_context(),
+                use_cache=not request.no_cache
+            )
 
-        # 2. Host Translated Response
-        log_out = database.ConversationLog(
-            session_id=temp_session_id, 
-            visitor_id=request.visitor_id, 
-            sender="ai", 
-            message=room_manager.sanitize(display_response) # Save TRANSLATED
-        )
-        session.add(log_out)
-        session.commit()
+    try:
+        response_text = await _run_generation(http_request, request.visitor_id, generation())
+    except GenerationCancelled:
+        # 499 = client closed request (nginx convention); usually nobody is left to read it
+        raise HTTPException(status_code=499, detail="Generation cancelled")
+    
+    display_response = await _finish_visit_turn(request, display_msg, response_text, display_task)
     
     return VisitResponse(
         host_name=config.character.name,
@@ -881,32 +1292,46 @@ async def visit(request: VisitRequest, session: Session = Depends(get_session)):
     )
 
 @app.post("/chat", response_model=ChatResponse, dependencies=[Depends(verify_api_key)])
-async def chat(request: ChatRequest, session: Session = Depends(get_session)):
+@app.post("/chat/stream", response_model=ChatResponse, dependencies=[Depends(verify_api_key)])
+async def chat(request: ChatRequest, http_request: Request):
     """
     Endpoint for continuing a conversation.
+    Streams the reply as Server-Sent Events when requested (see _wants_stream).
     """
     session_id = request.session_id or str(uuid.uuid4())
+    llm_client.check_available()
+    room_manager.touch_visitor(request.visitor_id)
     
     # Get relationship first to get the Name
-    relation = get_relationship(session, request.visitor_id)
+    # (short-lived sessions per DB step, never across an await; see visit)
+    with get_session_wrapper() as session:
+        relation = get_relationship(session, request.visitor_id)
     visitor_name = relation.visitor_name if relation else "Unknown Visitor"
 
     # Prepare Display Message
     visitor_msg_original = request.message
     display_msg = visitor_msg_original
-    
+
+    # Log incoming message to Room Manager (Sanitized); translated for the dashboard in the background
+    room_msg_id = room_manager.add_message(request.visitor_id, visitor_name, room_manager.sanitize(display_msg), model=request.model)
+    display_task = None
     if config.translation.enabled:
-        display_msg = translator.translate(visitor_msg_original, target_lang=config.translation.target_lang)
+        display_task = _translate_for_dashboard(visitor_msg_original, room_msg_id)
 
-    # Log incoming message to Room Manager (Sanitized)
-    room_manager.add_message(request.visitor_id, visitor_name, room_manager.sanitize(display_msg), model=request.model)
+    # Translate Input for LLM if enabled (Human -> English)
+    llm_input_msg = visitor_msg_original
+    if config.translation.enabled:
+        llm_input_msg = await translator.atranslate(visitor_msg_original, target_lang="en")
 
-    # Log to DB (Save Translated Content) 
+    # Log to DB (original for now; rewritten once the dashboard translation lands)
     log_in = ConversationLog(
         session_id=session_id, visitor_id=request.visitor_id, 
         sender="visitor", message=room_manager.sanitize(display_msg)
     )
-    session.add(log_in)
+    with get_session_wrapper() as session:
+        session.add(log_in)
+        session.commit()
+        _log_dashboard_copy(log_in, display_task)
     
     rel_context = ""
     if relation:
@@ -914,11 +1339,6 @@ async def chat(request: ChatRequest, session: Session = Depends(get_session)):
          if relation.memory_summary:
             rel_context += f"Memory of past interactions: {relation.memory_summary}\n"
 
-    # Translate Input for LLM if enabled (Human -> English)
-    llm_input_msg = visitor_msg_original
-    if config.translation.enabled:
-        llm_input_msg = translator.translate(visitor_msg_original, target_lang="en")
-
     # --- Lorebook Logic (Command & Context) ---
     lore_context = ""
     
@@ -933,85 +1353,91 @@ async def chat(request: ChatRequest, session: Session = Depends(get_session)):
             kw_en = None
             cnt_en = None
             if config.translation.enabled:
-                try: kw_en = translator.translate(kw, target_lang="en")
-                except: pass
-                try: cnt_en = translator.translate(cnt, target_lang="en")
-                except: pass
+                kw_en, cnt_en = await translator.translate_many([(kw, "en"), (cnt, "en")])
             
             # Permission Check
             if not config.room.allow_guest_lore_updates:
                  return ChatResponse(session_id=session_id, response="Dictionary updates are disabled by the host.")
             
-            existing = session.get(LoreEntry, kw)
-            if existing:
-                 existing.content = cnt
-                 existing.source = "visitor"
-                 if kw_en: existing.keyword_en = kw_en
-                 if cnt_en: existing.content_en = cnt_en
-                 session.add(existing)
-            else:
-                 new_entry = LoreEntry(
-                     keyword=kw, 
-                     content=cnt, 
-                     source="visitor",
-                     keyword_en=kw_en,
-                     content_en=cnt_en
-                 )
-                 session.add(new_entry)
-            session.commit()
+            with get_session_wrapper() as session:
+                existing = session.get(LoreEntry, kw)
+                if existing:
+                     existing.content = cnt
+                     existing.source = "visitor"
+                     if kw_en: existing.keyword_en = kw_en
+                     if cnt_en: existing.content_en = cnt_en
+                     session.add(existing)
+                else:
+                     new_entry = LoreEntry(
+                         keyword=kw, 
+                         content=cnt, 
+                         source="visitor",
+                         keyword_en=kw_en,
+                         content_en=cnt_en
+                     )
+                     session.add(new_entry)
+                book = existing.book if existing else "Default"
+                session.commit()
+            _on_lore_changed(book)
             
             room_manager.add_message(config.instance_id, "System", f"Learned: {kw}")
             return ChatResponse(session_id=session_id, response=f"Learned: {kw}")
 
     # 2. Context Lookup
-    lore_context = get_lore_context(session, llm_input_msg)
-
-    async with room_manager.processing_lock:
-        visitor_count = room_manager.get_active_visitor_count()
-        scene_context = ""
-        # If more than 1 visitor (or just to be safe, if > 0 and we want shared context), inject history
-        if visitor_count > 1:
-            scene_context = room_manager.get_recent_context_text()
-            rel_context += f"\n[Scene Context - The room is active with {visitor_count} visitors]\n{scene_context}\n"
-        
-        if lore_context:
-            rel_context += f"\n{lore_context}\n"
-
-        # Generate Response (English Logic)
-        response_text = llm_client.generate_response(
-            visitor_name=visitor_name,
-            message=llm_input_msg,
-            context=[], 
-            relationship_context=rel_context
-        )
-    
-        # Handle Response Translation for Dashboard AND Client
-        display_response = response_text
-        if config.translation.enabled:
-            display_response = translator.translate(response_text, target_lang=config.translation.target_lang)
-            
-        # Log Host Response to DB (Translated)
-        log_out = ConversationLog(
-            session_id=session_id, 
-            visitor_id=request.visitor_id, 
-            sender="host", 
-            message=room_manager.sanitize(display_response)
-        )
-        session.add(log_out)
-        session.commit()
-        display_response = response_text
-        if config.translation.enabled:
-            display_response = translator.translate(response_text, target_lang=config.translation.target_lang)
+    lore_context = await get_lore_context(llm_input_msg)
+
+    if _wants_stream(http_request):
+        async def event_stream():
+            async def generation():
+                async with room_manager.scheduler.slot(request.visitor_id):
+                    async for delta in llm_client.astream_response(
+                        visitor_name=visitor_name,
+                        message=llm_input_msg,
+                        context=[],
+                        relationship_context=rel_context,
+                        lore_context=lore_context,
+                        scene_context=_scene_context(),
+                        use_cache=not request.no_cache
+                    ):
+                        yield delta
+
+            raw = []
+            try:
+                async for delta in _visible_stream(request.visitor_id, generation(), config.translation.enabled, raw):
+                    yield _sse("token", {"text": delta})
+            except LLMUnavailableError as e:
+                # Headers are already sent, so report it in-band
+                yield _sse("error", {"detail": str(e), "retry_after": math.ceil(e.retry_after)})
+                return
+            except GenerationCancelled:
+                yield _sse("error", {"detail": "Generation cancelled"})
+                return
+
+            display_response = await _finish_chat_turn(request, session_id, "".join(raw))
+
+            yield _sse("done", ChatResponse(session_id=session_id, response=display_response).model_dump())
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    async def generation():
+        async with room_manager.scheduler.slot(request.visitor_id):
+            # Generate Response (English Logic)
+            return await llm_client.agenerate_response(
+                visitor_name=visitor_name,
+                message=llm_input_msg,
+                context=[], 
+                relationship_context=rel_context,
+                lore_context=lore_context,
+                scene_context=_scene_context(),
+                use_cache=not request.no_cache
+            )
 
-        room_manager.add_message(config.instance_id, config.character.name, room_manager.sanitize(display_response))
-        
-        # Log response to DB
-        log_out = ConversationLog(
-            session_id=session_id, visitor_id=request.visitor_id,
-            sender="host", message=room_manager.sanitize(response_text)
-        )
-        session.add(log_out)
-        session.commit()
+    try:
+        response_text = await _run_generation(http_request, request.visitor_id, generation())
+    except GenerationCancelled:
+        raise HTTPException(status_code=499, detail="Generation cancelled")
+    
+    display_response = await _finish_chat_turn(request, session_id, response_text)
     
     return ChatResponse(session_id=session_id, response=display_response)
 
@@ -1047,7 +1473,9 @@ async def get_room_status():
     return {
         "is_open": room_manager.is_open, 
         "active_visitors": room_manager.get_active_visitor_count(),
-        "public_url": GLOBAL_PUBLIC_URL
+        "public_url": GLOBAL_PUBLIC_URL,
+        "generation_queue": room_manager.scheduler.stats(),
+        "generations": room_manager.generation_stats()
     }
 
 @app.post("/api/host/chat")
@@ -1074,7 +1502,7 @@ async def host_chat(request: HostChatRequest, background_tasks: BackgroundTasks,
     
     return {"status": "sent", "message": safe_msg}
 
-def process_host_reply(message: str):
+async def process_host_reply(message: str):
     """
     Background task to generate AI response for Host.
     """
@@ -1093,20 +1521,21 @@ def process_host_reply(message: str):
                 continue 
             llm_context.append({"role": role, "content": msg["content"]})
 
-        # 2. Generate Response
-        reply = llm_client.generate_response(
-            visitor_name="Host",
-            message=message,
-            context=llm_context, 
-            relationship_context="You are speaking with the Host (Owner) of this room."
-        )
+        # 2. Generate Response (Host goes ahead of queued visitors)
+        async with room_manager.scheduler.slot("HOST", priority=room_manager.scheduler.PRIORITY_HOST):
+            reply = await llm_client.agenerate_response(
+                visitor_name="Host",
+                message=message,
+                context=llm_context, 
+                relationship_context="You are speaking with the Host (Owner) of this room."
+            )
         
         # 3. Translate if enabled
         final_reply = reply
         if config.translation and config.translation.enabled:
              # Just translate the output for now as per user request (Auto-translation ON -> Japanese)
              target = config.translation.target_lang or "ja"
-             final_reply = translator.translate(reply, target)
+             final_reply = await translator.atranslate(reply, target)
         
         # 4. Post to Room (Ephemerally)
         room_manager.add_message(config.instance_id, config.character.name, final_reply, model=config.llm.model)
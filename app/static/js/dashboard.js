@@ -102,17 +102,27 @@ const i18n = {
         lore_new_entry: "New Entry",
         lore_edit_title: "Edit Entry",
         lore_enabled: "Enabled",
+        lore_disabled: "Disabled",
         lore_constant: "Constant",
         lore_keyword_label: "Primary Keyword (ID)",
         lore_secondary_label: "Secondary Keys (CSV)",
+        lore_priority_label: "Priority (higher first)",
+        lore_order_label: "Insertion Order",
         lore_content_label: "Content",
         lore_select_hint: "Select an entry to view/edit",
         delete: "Delete",
         save_btn: "Save",
         lore_rename_confirm: "Renaming entry from '{old}' to '{new}'. This will delete the old entry. Continue?",
-        lore_import_confirm: "Import {n} entries to new book '{book}'?",
+        lore_import_confirm: "Import '{file}' into book '{book}'?",
+        lore_import_errors: "{n} entries were skipped (details in the console).",
         lore_import_success: "Imported {n} entries into '{book}'.",
         lore_rename_success: "Renamed {n} entries.",
+        lore_copy_prompt: "Copy '{book}' to a new book named:",
+        lore_copy_success: "Copied {n} entries ({skipped} already existed).",
+        lore_delete_book_confirm: "Delete the book '{book}' and all of its entries?",
+        lore_delete_book_success: "Deleted {n} entries.",
+        lore_toggle_confirm: "Set all entries of '{book}' to {state}?",
+        lore_toggle_success: "Updated {n} entries.",
         lore_no_entries: "No entries found in JSON.",
         lore_rename_fail: "Rename failed.",
         keyword_required: "Keyword is required",
@@ -243,17 +253,27 @@ const i18n = {
         lore_new_entry: "新規エントリ",
         lore_edit_title: "エントリ編集",
         lore_enabled: "有効",
+        lore_disabled: "無効",
         lore_constant: "常時有効",
         lore_keyword_label: "キーワード (必須)",
         lore_secondary_label: "追加キーワード (カンマ区切り)",
+        lore_priority_label: "優先度 (大きいほど優先)",
+        lore_order_label: "挿入順",
         lore_content_label: "内容",
         lore_select_hint: "エントリを選択または作成してください",
         delete: "削除",
         save_btn: "保存",
         lore_rename_confirm: "エントリー名を '{old}' から '{new}' に変更しようとしています。\n古いエントリーは削除され、新しい名前で保存されますがよろしいですか？",
-        lore_import_confirm: "{n} 件のエントリーを新しい辞書 '{book}' にインポートしますか？",
+        lore_import_confirm: "'{file}' を辞書 '{book}' にインポートしますか？",
+        lore_import_errors: "{n} 件のエントリーをスキップしました（詳細はコンソール）。",
         lore_import_success: "'{book}' に {n} 件のエントリーをインポートしました。",
         lore_rename_success: "{n} 件のエントリー名を変更しました。",
+        lore_copy_prompt: "'{book}' のコピー先の辞書名:",
+        lore_copy_success: "{n} 件をコピーしました（既存 {skipped} 件はスキップ）。",
+        lore_delete_book_confirm: "辞書 '{book}' とそのすべてのエントリーを削除しますか？",
+        lore_delete_book_success: "{n} 件のエントリーを削除しました。",
+        lore_toggle_confirm: "'{book}' の全エントリーを {state} にしますか？",
+        lore_toggle_success: "{n} 件のエントリーを更新しました。",
         lore_no_entries: "JSONにエントリーが見つかりません。",
         lore_rename_fail: "名前の変更に失敗しました。",
         keyword_required: "キーワードは必須です",
@@ -388,6 +408,57 @@ function renameLorebook() {
         .catch(e => console.error(e));
 }
 
+// Whole-book operations run server-side as single statements
+function copyLorebook() {
+    const texts = i18n[state.lang];
+    const current = document.getElementById('lorebook-select').value;
+    const newName = prompt(texts.lore_copy_prompt.replace('{book}', current), `${current} copy`);
+    if (!newName || newName === current) return;
+
+    fetch(`/api/lore/books/${encodeURIComponent(current)}/copy?new_name=${encodeURIComponent(newName)}`, { method: 'POST' })
+        .then(res => res.json())
+        .then(data => {
+            alert(texts.lore_copy_success.replace('{n}', data.count).replace('{skipped}', data.skipped));
+            loreState.currentBook = newName;
+            loadLorebookBooks();
+        })
+        .catch(e => console.error(e));
+}
+
+function deleteLorebook() {
+    const texts = i18n[state.lang];
+    const current = document.getElementById('lorebook-select').value;
+    if (!current || !confirm(texts.lore_delete_book_confirm.replace('{book}', current))) return;
+
+    fetch(`/api/lore/books/${encodeURIComponent(current)}`, { method: 'DELETE' })
+        .then(res => res.json())
+        .then(data => {
+            alert(texts.lore_delete_book_success.replace('{n}', data.count));
+            loreState.currentBook = "Default";
+            loadLorebookBooks();
+        })
+        .catch(e => console.error(e));
+}
+
+function setLorebookEnabled(enabled) {
+    const texts = i18n[state.lang];
+    const current = document.getElementById('lorebook-select').value;
+    const stateLabel = enabled ? texts.lore_enabled : texts.lore_disabled;
+    if (!current || !confirm(texts.lore_toggle_confirm.replace('{book}', current).replace('{state}', stateLabel))) return;
+
+    fetch(`/api/lore/books/${encodeURIComponent(current)}/enabled`, {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ enabled })
+    })
+        .then(res => res.json())
+        .then(data => {
+            alert(texts.lore_toggle_success.replace('{n}', data.count));
+            loadLorebookEntries();
+        })
+        .catch(e => console.error(e));
+}
+
 function importLorebook() {
     document.getElementById('lore-import-file').click();
 }
@@ -396,90 +467,53 @@ function handleLorefileSelect(event) {
     const texts = i18n[state.lang];
     const file = event.target.files[0];
     if (!file) return;
+    const bookName = file.name.replace(/\.[^/.]+$/, "") || "Imported";
+    event.target.value = ""; // Reset input
 
-    const reader = new FileReader();
-    reader.onload = async (e) => {
-        try {
-            const json = JSON.parse(e.target.result);
-            const bookName = file.name.replace(/\.[^/.]+$/, "") || "Imported";
-
-            // Standardize format: ST exports usually have 'entries' (V2/V3) or 'data' (V1)
-            let entries = [];
-            if (Array.isArray(json)) {
-                entries = json;
-            } else if (json.entries) {
-                // V2/V3: entries is dict or list
-                if (Array.isArray(json.entries)) entries = json.entries;
-                else entries = Object.values(json.entries);
-            } else if (json.data) {
-                // V1
-                entries = Object.values(json.data);
-            }
+    if (!confirm(texts.lore_import_confirm.replace('{file}', file.name).replace('{book}', bookName))) return;
 
-            if (!entries.length) {
+    // The server parses the file as it uploads and translates in the background,
+    // so large World Info files go up in one request
+    fetch(`/api/lore/import?book=${encodeURIComponent(bookName)}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: file
+    })
+        .then(async res => {
+            const data = await res.json();
+            if (!res.ok) throw new Error(data.detail || res.statusText);
+            if (data.imported === 0 && data.error_count === 0) {
                 alert(texts.lore_no_entries);
                 return;
             }
-
-            if (!confirm(texts.lore_import_confirm.replace('{n}', entries.length).replace('{book}', bookName))) return;
-
-            let successCount = 0;
-            // Batch process? Or simple loop. Loop is fine for <100 entries.
-            // For larger, chunking would be better, but keep simple.
-            // Using saveLoreEntryV2 logic but direct API call
-            for (const entry of entries) {
-                // Map ST fields to Our fields
-                /*
-                   ST: key, keysecondary, content, constant, enabled, comment
-                */
-                // Handle different key naming
-                let keys = entry.keys || entry.key || entry.uid || "entry_" + Math.random().toString(36).substr(2, 5);
-                // keys might be array in ST V3?
-                if (Array.isArray(keys)) keys = keys[0]; // take first as PK
-
-                // extract secondary
-                let secondary = entry.secondary_keys || entry.keysecondary || "";
-                if (Array.isArray(secondary)) secondary = secondary.join(",");
-
-                const payload = {
-                    keyword: String(keys).trim(),
-                    content: entry.content || "",
-                    book: bookName,
-                    secondary_keys: String(secondary),
-                    constant: entry.constant === true || entry.constant === "true",
-                    enabled: entry.enabled !== false, // Default true
-                    keyword_en: null, // Let server translate
-                    content_en: null
-                };
-
-                if (!payload.keyword) continue;
-
-                await fetch('/api/lore', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(payload)
-                });
-                successCount++;
+            let msg = texts.lore_import_success.replace('{n}', data.imported).replace('{book}', bookName);
+            if (data.error_count) {
+                console.warn("Lore import errors", data.errors, data.parse_error);
+                msg += "\n" + texts.lore_import_errors.replace('{n}', data.error_count);
             }
-
-            alert(texts.lore_import_success.replace('{n}', successCount).replace('{book}', bookName));
+            alert(msg);
             loreState.currentBook = bookName;
             loadLorebookBooks();
-
-        } catch (ex) {
+        })
+        .catch(ex => {
             console.error(ex);
-            alert("Error parsing JSON: " + ex.message);
-        }
-        // Reset input
-        event.target.value = "";
-    };
-    reader.readAsText(file);
+            alert("Error importing JSON: " + ex.message);
+        });
+}
+
+function exportLorebook() {
+    window.location = `/api/lore/export?book=${encodeURIComponent(loreState.currentBook)}`;
 }
 
 // --- Exports ---
 window.renameLorebook = renameLorebook;
 window.importLorebook = importLorebook;
 window.handleLorefileSelect = handleLorefileSelect;
+window.exportLorebook = exportLorebook;
+window.searchLoreEntries = searchLoreEntries;
+window.copyLorebook = copyLorebook;
+window.deleteLorebook = deleteLorebook;
+window.setLorebookEnabled = setLorebookEnabled;
 window.state = state; // Re-export just in case
 window.i18n = i18n;
 window.updateTexts = updateTexts;
@@ -567,9 +601,22 @@ async function fetchRoomStatus() {
         const res = await fetch('/api/room/status');
         const data = await res.json();
         updateRoomStatusUI(data.is_open, data.public_url);
+        updateRoomLoadUI(data);
     } catch (e) { console.error(e); }
 }
 
+function updateRoomLoadUI(data) {
+    const countEl = document.getElementById('visitor-count');
+    if (countEl) countEl.innerText = data.active_visitors;
+
+    const queueEl = document.getElementById('generation-queue');
+    const queue = data.generation_queue;
+    if (queueEl && queue) {
+        queueEl.innerText = `${queue.active}/${queue.max_concurrent}`
+            + (queue.queue_depth ? ` (+${queue.queue_depth} waiting, ${queue.oldest_wait_seconds.toFixed(1)}s)` : '');
+    }
+}
+
 async function toggleRoom() {
     try {
         const res = await fetch('/api/room/toggle', { method: 'POST' });
@@ -896,7 +943,7 @@ function renderMessage(msg) {
     const timeStr = new Date(msg.timestamp * 1000).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
 
     const html = `
-        <div class="flex ${alignClass} mb-4 anime-fade-in">
+        <div class="flex ${alignClass} mb-4 anime-fade-in" data-message-id="${msg.id}">
             <div class="max-w-[70%]">
                 <div class="flex items-end gap-2 ${isHost ? 'flex-row-reverse' : ''}">
                     <div class="w-8 h-8 rounded-full bg-gradient-to-tr from-gray-400 to-gray-600 flex items-center justify-center text-xs font-bold text-white shrink-0">
@@ -907,7 +954,7 @@ function renderMessage(msg) {
                             ${msg.sender_name}
                             ${msg.model ? `<span class="text-[10px] bg-white/10 px-1 rounded border border-white/20 font-mono">${msg.model}</span>` : ''}
                         </span>
-                        <div class="${bubbleClass} px-4 py-2 rounded-2xl shadow-md text-sm leading-relaxed">
+                        <div class="message-content ${bubbleClass} px-4 py-2 rounded-2xl shadow-md text-sm leading-relaxed">
                             ${msg.content}
                         </div>
                         <span class="text-[10px] text-slate-500 mt-1 px-1">${timeStr}</span>
@@ -933,10 +980,14 @@ async function pollMessages() {
         msgs.sort((a, b) => a.timestamp - b.timestamp);
 
         msgs.forEach(msg => {
-            if (msg.timestamp > state.lastMessageTimestamp) {
+            // Messages are also returned when edited later (e.g. translation finished)
+            const existing = document.querySelector(`[data-message-id="${msg.id}"]`);
+            if (existing) {
+                existing.querySelector('.message-content').innerHTML = msg.content;
+            } else {
                 renderMessage(msg);
-                state.lastMessageTimestamp = msg.timestamp;
             }
+            state.lastMessageTimestamp = Math.max(state.lastMessageTimestamp, msg.updated_at || msg.timestamp);
         });
     } catch (e) { console.error("Poll error", e); }
 }
@@ -944,7 +995,11 @@ async function pollMessages() {
 function startChatPolling() {
     if (state.pollingInterval) return;
     pollMessages(); // Initial fetch
-    state.pollingInterval = setInterval(pollMessages, 3000);
+    fetchRoomStatus();
+    state.pollingInterval = setInterval(() => {
+        pollMessages();
+        fetchRoomStatus(); // Visitor count & generation queue
+    }, 3000);
 }
 
 function stopChatPolling() {
@@ -1114,6 +1169,34 @@ function renderLoreManagerList() {
     `).join('');
 }
 
+let loreSearchTimer = null;
+
+function searchLoreEntries() {
+    clearTimeout(loreSearchTimer);
+    loreSearchTimer = setTimeout(async () => {
+        const q = document.getElementById('lore-search').value.trim();
+        if (!q) return renderLoreManagerList();
+        try {
+            const res = await fetch(`/api/lore/search?q=${encodeURIComponent(q)}&book=${encodeURIComponent(loreState.currentBook)}&limit=50`);
+            if (!res.ok) return renderLoreManagerList(); // No FTS5 in this SQLite build
+            const data = await res.json();
+            const list = document.getElementById('lore-manager-list');
+            if (data.results.length === 0) {
+                list.innerHTML = '<div class="text-center text-slate-400 text-xs mt-4">No entries.</div>';
+                return;
+            }
+            // Snippets come HTML-escaped from the server, with matches in <mark>
+            list.innerHTML = data.results.map(r => `
+                <div onclick="openLoreEntryEditor('${r.keyword}')"
+                     class="p-2 border-b border-slate-200 dark:border-slate-700 hover:bg-slate-100 dark:hover:bg-slate-700 cursor-pointer">
+                    <div class="text-sm font-bold text-slate-700 dark:text-slate-200 truncate">${r.keyword}</div>
+                    <div class="text-[10px] text-slate-500 truncate">${r.snippet}</div>
+                </div>
+            `).join('');
+        } catch (e) { console.error(e); }
+    }, 250);
+}
+
 function openLoreEntryEditor(keyword) {
     const container = document.getElementById('lore-editor-container');
     const placeholder = document.getElementById('lore-editor-placeholder');
@@ -1133,6 +1216,8 @@ function openLoreEntryEditor(keyword) {
         document.getElementById('lore-edit-content').value = entry.content;
         document.getElementById('lore-edit-enabled').checked = entry.enabled !== false;
         document.getElementById('lore-edit-constant').checked = entry.constant === true;
+        document.getElementById('lore-edit-priority').value = entry.priority || 0;
+        document.getElementById('lore-edit-order').value = entry.insertion_order || 0;
     } else {
         // New
         loreState.editingEntry = null;
@@ -1142,6 +1227,8 @@ function openLoreEntryEditor(keyword) {
         document.getElementById('lore-edit-content').value = "";
         document.getElementById('lore-edit-enabled').checked = true;
         document.getElementById('lore-edit-constant').checked = false;
+        document.getElementById('lore-edit-priority').value = 0;
+        document.getElementById('lore-edit-order').value = 0;
     }
 }
 
@@ -1156,6 +1243,8 @@ async function saveLoreEntryV2() {
         secondary_keys: document.getElementById('lore-edit-secondary').value,
         enabled: document.getElementById('lore-edit-enabled').checked,
         constant: document.getElementById('lore-edit-constant').checked,
+        priority: parseInt(document.getElementById('lore-edit-priority').value) || 0,
+        insertion_order: parseInt(document.getElementById('lore-edit-order').value) || 0,
         book: loreState.currentBook
     };
 
@@ -0,0 +1,348 @@
+"""
+Lorebook matching benchmark.
+
+Builds synthetic lorebooks (mixed Japanese/Latin keywords, aliases, entries
+that reference each other) in a throwaway SQLite file, replays synthetic
+visitor messages through each lore lookup implementation and prints the
+results as JSON:
+
+    python bench_lore.py --sizes 100,1000,10000 --turns 200 > bench.json
+    python bench_lore.py --baseline bench.json     # adds p50/p95 ratios vs an earlier run
+
+Per implementation and size: cold (first lookup) time, per-turn latency
+percentiles, SQLite statements/time per turn (execute and fetch, via a
+timing sqlite3 cursor) and peak memory allocated per turn (tracemalloc, in
+a separate pass so it doesn't skew the timings). New implementations go in IMPLEMENTATIONS.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, insert
+from sqlmodel import Session, SQLModel, select
+
+from app.core.database import LoreEntry, LoreEmbedding
+from app.core.lore_index import LoreIndex
+from app.core.prompt_budget import HeuristicTokenizer
+
+BOOK = "Bench"
+
+# --- Synthetic data ---
+
+KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわん"
+KANJI = "竜王城森火水風山海星月剣盾魔法師騎士姫神殿塔門花鳥雪雷影光闇鬼龍"
+SYLLABLES = ["ka", "ri", "to", "mel", "dor", "an", "vel", "ith", "gar", "ul", "sha", "bren", "or", "tas", "quin", "ze"]
+FILLER_EN = "the a of and to in is you that it was for on are with as his they be at one have this from".split()
+FILLER_JA = ["こんにちは", "今日は", "いい天気", "ですね", "について", "教えて", "ください", "どう思う", "昨日", "行きました"]
+
+def _latin_word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+def _cjk_word(rng: random.Random) -> str:
+    return "".join(rng.choice(KANJI if rng.random() < 0.7 else KANA) for _ in range(rng.randint(2, 4)))
+
+def make_corpus(size: int, rng: random.Random) -> list:
+    """Lore rows as dicts; keywords are unique, ~half CJK with an English keyword_en."""
+    keywords = set()
+    while len(keywords) < size:
+        keywords.add(_cjk_word(rng) + str(len(keywords)) if rng.random() < 0.5 else _latin_word(rng) + str(len(keywords)))
+    keywords = list(keywords)
+    rows = []
+    for i, keyword in enumerate(keywords):
+        cjk = not keyword[0].isascii()
+        aliases = [_latin_word(rng) + str(i) + "x" for _ in range(rng.choice([0, 0, 1, 2, 3]))]
+        words = [rng.choice(FILLER_JA if cjk else FILLER_EN) for _ in range(rng.randint(15, 60))]
+        # Some entries mention other entries, so recursive matching has work to do
+        for _ in range(rng.choice([0, 0, 0, 1, 2])):
+            words.insert(rng.randrange(len(words)), rng.choice(keywords))
+        content = ("" if cjk else " ").join(words)
+        rows.append({
+            "keyword": keyword,
+            "keyword_en": _latin_word(rng) + str(i) + "en" if cjk else None,
+            "content": content,
+            "content_en": " ".join(rng.choice(FILLER_EN) for _ in range(20)) if cjk else None,
+            "book": BOOK,
+            "secondary_keys": ",".join(aliases) or None,
+            "constant": rng.random() < 0.005,
+            "enabled": rng.random() > 0.02,
+            "priority": rng.choice([0, 0, 0, 1, 5]),
+            "insertion_order": rng.randint(0, 100),
+            "source": "host",
+        })
+    return rows
+
+def make_messages(rows: list, count: int, rng: random.Random) -> list:
+    """Visitor messages with 0-3 lore keys in them (keyword, alias or English keyword)."""
+    messages = []
+    for _ in range(count):
+        ja = rng.random() < 0.4
+        words = [rng.choice(FILLER_JA if ja else FILLER_EN) for _ in range(rng.randint(5, 25))]
+        for _ in range(rng.choice([0, 1, 1, 2, 3])):
+            row = rng.choice(rows)
+            keys = [row["keyword"], row["keyword_en"]] + (row["secondary_keys"] or "").split(",")
+            words.insert(rng.randrange(len(words) + 1), rng.choice([k for k in keys if k]))
+        messages.append(("" if ja else " ").join(words))
+    return messages
+
+# --- Implementations ---
+
+def legacy_lookup(session: Session, message: str, params) -> str:
+    """The original approach: load every enabled entry of the book and substring-scan them each turn."""
+    entries = session.exec(select(LoreEntry).where(LoreEntry.enabled == True, LoreEntry.book == BOOK)).all()
+    found = {}
+    for entry in entries:
+        if entry.constant:
+            found[entry.keyword] = (entry.keyword_en, entry.content_en or entry.content)
+    search_text = message.lower()
+    for _ in range(params.scan_depth):
+        new_text = ""
+        for entry in entries:
+            if entry.keyword in found:
+                continue
+            keys = [entry.keyword, entry.keyword_en] + (entry.secondary_keys or "").split(",")
+            if any(k and k.strip().lower() in search_text for k in keys):
+                found[entry.keyword] = (entry.keyword_en, entry.content_en or entry.content)
+                new_text += f" {entry.content} {entry.content_en or ''}".lower()
+        if not new_text:
+            break
+        search_text = new_text
+    if not found:
+        return ""
+    return "[Lorebook Info]\n" + "".join(f"- {k} ({k_en}): {v}\n" if k_en else f"- {k}: {v}\n" for k, (k_en, v) in found.items())
+
+def make_indexed_lookup(semantic: bool = False):
+    """What get_lore_context does today: cached per-book index, ranked and budgeted."""
+    caches = {}
+    tokenizer = HeuristicTokenizer()
+
+    def lookup(session: Session, message: str, params) -> str:
+        if "index" not in caches:
+            # Opens its own sessions; point it at the benchmark database
+            caches["index"] = LoreIndex(session.get_bind())
+        index = caches["index"].get(BOOK)
+        if not index.entry_count:
+            return ""
+        similar = []
+        if semantic:
+            if "embeddings" not in caches:
+                from app.core.lore_embeddings import LoreEmbeddings
+                caches["embeddings"] = LoreEmbeddings(session.get_bind())
+            similar = caches["embeddings"].search(BOOK, message, params)
+        keywords, _ = index.select(message, params.scan_depth, params.token_budget, tokenizer,
+                                   semantic=[k for k, _ in similar])
+        return index.render(keywords)
+    return lookup
+
+def _has_numpy() -> bool:
+    try:
+        import numpy # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+IMPLEMENTATIONS = {
+    "legacy": lambda: legacy_lookup,
+    "indexed": make_indexed_lookup,
+    "semantic": lambda: make_indexed_lookup(semantic=True),
+}
+
+# --- Measurement ---
+
+class SQLTimer:
+    """
+    Time spent inside SQLite, fetches included (rows are produced as they
+    are fetched, so timing execute() alone would miss most of it).
+    Installed as the sqlite3 connection factory of the benchmark engine.
+    """
+    statements = 0
+    seconds = 0.0
+
+    @classmethod
+    def reset(cls):
+        cls.statements = 0
+        cls.seconds = 0.0
+
+class _TimedCursor(sqlite3.Cursor):
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            SQLTimer.seconds += time.perf_counter() - started
+
+    def execute(self, *args):
+        SQLTimer.statements += 1
+        return self._timed(super().execute, *args)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+class _TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    pos = (len(ordered) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+def bench_case(name: str, engine, messages: list, params, max_seconds: float) -> dict:
+    lookup = IMPLEMENTATIONS[name]()
+    with Session(engine) as session:
+        started = time.perf_counter()
+        lookup(session, messages[0], params)
+        cold = time.perf_counter() - started
+
+        # Timed pass
+        SQLTimer.reset()
+        latencies, context_chars = [], 0
+        deadline = time.perf_counter() + max_seconds
+        for message in messages:
+            started = time.perf_counter()
+            context = lookup(session, message, params)
+            latencies.append(time.perf_counter() - started)
+            context_chars += len(context)
+            if time.perf_counter() > deadline:
+                break
+        turns = len(latencies)
+        sql_statements, sql_seconds = SQLTimer.statements, SQLTimer.seconds
+
+        # Allocation pass, on a slice of the same messages: peak memory each lookup takes
+        peaks = []
+        tracemalloc.start()
+        for message in messages[:max(1, min(turns, 50))]:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            lookup(session, message, params)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        tracemalloc.stop()
+
+    return {
+        "impl": name,
+        "turns": turns,
+        "truncated": turns < len(messages),
+        "cold_ms": _ms(cold),
+        "latency_ms": {
+            "mean": _ms(statistics.fmean(latencies)),
+            "p50": _ms(percentile(latencies, 0.50)),
+            "p90": _ms(percentile(latencies, 0.90)),
+            "p95": _ms(percentile(latencies, 0.95)),
+            "p99": _ms(percentile(latencies, 0.99)),
+            "max": _ms(max(latencies)),
+        },
+        "sqlite": {
+            "statements_per_turn": round(sql_statements / turns, 3),
+            "ms_per_turn": _ms(sql_seconds / turns),
+        },
+        "memory": {
+            "peak_kb_mean": round(statistics.fmean(peaks) / 1024, 2),
+            "peak_kb_max": round(max(peaks) / 1024, 2),
+        },
+        "context_chars_avg": round(context_chars / turns, 1),
+    }
+
+def build_db(path: str, rows: list):
+    engine = create_engine("sqlite://", creator=lambda: sqlite3.connect(path, factory=_TimedConnection, check_same_thread=False))
+    SQLModel.metadata.create_all(engine, tables=[LoreEntry.__table__, LoreEmbedding.__table__])
+    with engine.begin() as conn:
+        for i in range(0, len(rows), 5000):
+            conn.execute(insert(LoreEntry.__table__), rows[i:i + 5000])
+    return engine
+
+def compare(results: list, baseline_path: str):
+    """Adds latency ratios against a previous run (ratio > 1 = slower now)."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["impl"], r["entries"]): r for r in json.load(f)["results"]}
+    for result in results:
+        old = baseline.get((result["impl"], result["entries"]))
+        if not old:
+            continue
+        result["vs_baseline"] = {
+            key: round(result["latency_ms"][key] / old["latency_ms"][key], 3) if old["latency_ms"][key] else None
+            for key in ("p50", "p95")
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated lorebook sizes (up to 100000)")
+    parser.add_argument("--turns", type=int, default=200, help="Messages per case")
+    parser.add_argument("--impls", default="legacy,indexed" + (",semantic" if _has_numpy() else ""),
+                        help=f"Comma-separated, from: {', '.join(IMPLEMENTATIONS)}")
+    parser.add_argument("--depth", type=int, default=2, help="lore.scan_depth")
+    parser.add_argument("--budget", type=int, default=1024, help="lore.token_budget (0 = unlimited)")
+    parser.add_argument("--max-seconds", type=float, default=30.0, help="Cap per case; slow cases run fewer turns")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--baseline", help="Earlier JSON output to compare latencies against")
+    parser.add_argument("--out", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    params = SimpleNamespace(
+        scan_depth=args.depth, token_budget=args.budget,
+        semantic_top_k=3, semantic_min_score=0.25, embedding_dim=512
+    )
+    impls = [name.strip() for name in args.impls.split(",") if name.strip()]
+    for name in impls:
+        if name not in IMPLEMENTATIONS:
+            parser.error(f"unknown implementation '{name}'")
+
+    results = []
+    # The app modules log with print(); keep stdout for the JSON
+    with contextlib.redirect_stdout(sys.stderr), tempfile.TemporaryDirectory(prefix="bench_lore_") as tmp:
+        for size in (int(s) for s in args.sizes.split(",")):
+            rng = random.Random(args.seed + size)
+            rows = make_corpus(size, rng)
+            messages = make_messages(rows, args.turns, rng)
+            path = os.path.join(tmp, f"lore_{size}.sqlite")
+            engine = build_db(path, rows)
+            for name in impls:
+                print(f"[Bench] {name} @ {size} entries...", file=sys.stderr)
+                result = bench_case(name, engine, messages, params, args.max_seconds)
+                result["entries"] = size
+                results.append(result)
+            engine.dispose()
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    text = json.dumps(output, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
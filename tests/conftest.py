@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+from sqlmodel import SQLModel, create_engine
+
+# app.core.config and the database open app/config.json and logs.sqlite
+# relative to the working directory, so tests run from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def db_engine(tmp_path):
+    """A scratch SQLite database with the app's tables, instead of logs.sqlite."""
+    import app.core.database # Registers the tables
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.sqlite'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,169 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import config
+
+if config is None:
+    pytest.skip("needs app/config.json (see app/config.json.sample)", allow_module_level=True)
+
+from app import main
+from app.core.llm_pool import BackendPool, LLMBackend
+from app.core.room_manager import RoomManager
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self) -> bool:
+        return self.disconnected
+
+
+@pytest.fixture
+def room(monkeypatch):
+    room = RoomManager()
+    room.scheduler.set_max_concurrent(1)
+    monkeypatch.setattr(main, "room_manager", room)
+    monkeypatch.setattr(main, "DISCONNECT_POLL_SECONDS", 0.01)
+    return room
+
+
+@pytest.fixture
+def backend():
+    return LLMBackend("http://a/v1", "key", "a", max_concurrency=1)
+
+
+def _generation(room, pool, visitor_id, started):
+    """Holds a scheduler slot and a backend lease like agenerate_response, then hangs upstream."""
+    async def generation():
+        async with room.scheduler.slot(visitor_id):
+            async with pool.lease():
+                started.set()
+                await asyncio.Event().wait()
+    return generation()
+
+
+def _streamed_generation(room, pool, visitor_id, started):
+    async def deltas():
+        async with room.scheduler.slot(visitor_id):
+            async with pool.lease():
+                yield "Hello"
+                started.set()
+                await asyncio.Event().wait()
+    return deltas()
+
+
+def _assert_released(room, backend):
+    assert room.scheduler.active == 0
+    assert backend.in_flight == 0
+    # Cancellation is not an outage
+    assert backend.consecutive_failures == 0 and backend.healthy
+    assert room.generation_tasks == {}
+
+
+def _cancel_run(room, backend, cancel, request=None):
+    pool = BackendPool([backend])
+
+    async def main_():
+        started = asyncio.Event()
+        run = asyncio.create_task(main._run_generation(request or FakeRequest(), "v1", _generation(room, pool, "v1", started)))
+        await started.wait()
+        assert (room.scheduler.active, backend.in_flight) == (1, 1)
+        cancel()
+        with pytest.raises(main.GenerationCancelled):
+            await run
+
+    asyncio.run(main_())
+    _assert_released(room, backend)
+
+
+def test_leaving_cancels_a_generation_and_frees_its_slot_and_lease(room, backend):
+    room.register_visitor("v1", "Alice")
+    _cancel_run(room, backend, lambda: room.remove_visitor("v1"))
+    assert room.cancelled_generations == {"leave": 1}
+    assert "v1" not in room.active_visitors
+
+
+def test_expiry_cancels_a_generation(room, backend):
+    room.register_visitor("v1", "Alice")
+
+    def expire():
+        room.active_visitors["v1"]["last_seen"] = time.time() - 601
+        room._cleanup_inactive()
+
+    _cancel_run(room, backend, expire)
+    assert room.cancelled_generations == {"expired": 1}
+
+
+def test_disconnecting_cancels_a_generation(room, backend):
+    request = FakeRequest()
+    _cancel_run(room, backend, lambda: setattr(request, "disconnected", True), request)
+    assert room.cancelled_generations == {"disconnect": 1}
+
+
+def test_a_cancelled_generation_hands_its_slot_to_the_next_visitor(room, backend):
+    pool = BackendPool([backend])
+
+    async def second():
+        async with room.scheduler.slot("v2"):
+            async with pool.lease():
+                return "served"
+
+    async def main_():
+        started = asyncio.Event()
+        first = asyncio.create_task(main._run_generation(FakeRequest(), "v1", _generation(room, pool, "v1", started)))
+        await started.wait()
+        waiting = asyncio.create_task(main._run_generation(FakeRequest(), "v2", second()))
+        await asyncio.sleep(0.05)
+        assert room.scheduler.queue_depth() == 1
+        room.remove_visitor("v1")
+        with pytest.raises(main.GenerationCancelled):
+            await first
+        return await waiting
+
+    assert asyncio.run(main_()) == "served"
+    _assert_released(room, backend)
+    assert room.cancelled_generations == {"leave": 1}
+
+
+def test_leaving_cancels_a_streamed_generation(room, backend):
+    pool = BackendPool([backend])
+    received = []
+
+    async def main_():
+        started = asyncio.Event()
+
+        async def consume():
+            async for delta in main._stream_generation("v1", _streamed_generation(room, pool, "v1", started)):
+                received.append(delta)
+
+        stream = asyncio.create_task(consume())
+        await started.wait()
+        room.remove_visitor("v1")
+        room.remove_visitor("v1") # Already cancelled: not counted twice
+        with pytest.raises(main.GenerationCancelled):
+            await stream
+
+    asyncio.run(main_())
+    assert received == ["Hello"]
+    _assert_released(room, backend)
+    assert room.cancelled_generations == {"leave": 1}
+
+
+def test_closing_a_stream_counts_as_a_disconnect(room, backend):
+    pool = BackendPool([backend])
+
+    async def main_():
+        started = asyncio.Event()
+        stream = main._stream_generation("v1", _streamed_generation(room, pool, "v1", started))
+        assert await stream.__anext__() == "Hello"
+        await started.wait()
+        # What Starlette does when the client goes away mid-response
+        await stream.aclose()
+        await asyncio.sleep(0)
+
+    asyncio.run(main_())
+    _assert_released(room, backend)
+    assert room.cancelled_generations == {"disconnect": 1}
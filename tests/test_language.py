@@ -0,0 +1,43 @@
+import pytest
+
+from app.core.language import detect_language, normalize_lang
+
+
+@pytest.mark.parametrize("text, lang", [
+    ("こんにちは、元気ですか？", "ja"),
+    ("東京タワーに行きました", "ja"),
+    ("안녕하세요, 반갑습니다", "ko"),
+    ("สวัสดีครับ", "th"),
+    ("Hello, how are you today?", "en"),
+    ("Thanks!", "en"),
+    ("I think that is what they said about the weather.", "en"),
+    ("Sakura-san is here with the cake", "en"),
+])
+def test_detects_by_script_and_function_words(text, lang):
+    assert detect_language(text) == lang
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "   ",
+    "12345",
+    "我们今天去公园", # Han only: Chinese or kanji-only Japanese
+    "Où est la gare ?", # Accented letters rule out English
+    # Two English function words, but under a quarter of the words
+    "Hola amigo, the fiesta is muy grande hoy para todos nosotros y ellos",
+    "Ich habe heute keine Zeit, aber morgen vielleicht, and you",
+    "Me gusta la música de mi hermano",
+])
+def test_unsure_returns_none(text):
+    assert detect_language(text) is None
+
+
+def test_japanese_name_in_english_stays_english():
+    assert detect_language("My friend 山田 said hello to you") == "en"
+
+
+def test_normalize_lang():
+    assert normalize_lang("zh-CN") == "zh"
+    assert normalize_lang("EN") == "en"
+    assert normalize_lang("pt_BR") == "pt"
+    assert normalize_lang(None) == ""
@@ -0,0 +1,129 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from app.core.llm_pool import BackendPool, LLMBackend, is_outage
+
+REQUEST = httpx.Request("POST", "http://backend/v1/chat/completions")
+
+
+def _status_error(status: int) -> openai.APIStatusError:
+    cls = {400: openai.BadRequestError, 429: openai.RateLimitError, 500: openai.InternalServerError}.get(status, openai.APIStatusError)
+    return cls(f"HTTP {status}", response=httpx.Response(status, request=REQUEST), body=None)
+
+
+def _backend(name: str, max_concurrency: int = 1) -> LLMBackend:
+    return LLMBackend(f"http://{name}/v1", "key", name, max_concurrency)
+
+
+def test_outage_classification():
+    assert is_outage(openai.APIConnectionError(request=REQUEST))
+    assert is_outage(openai.APITimeoutError(request=REQUEST))
+    assert is_outage(_status_error(429))
+    assert is_outage(_status_error(500))
+    assert is_outage(_status_error(503))
+    assert not is_outage(_status_error(400))
+    assert not is_outage(_status_error(404))
+    assert not is_outage(ValueError("bad prompt"))
+
+
+def test_picks_the_backend_with_the_fewest_in_flight():
+    a, b = _backend("a", 4), _backend("b", 4)
+    pool = BackendPool([a, b])
+
+    async def main():
+        return [(await pool.acquire()).model for _ in range(4)]
+
+    assert asyncio.run(main()) == ["a", "b", "a", "b"]
+    assert (a.in_flight, b.in_flight) == (2, 2)
+
+
+def test_acquire_waits_for_capacity_and_wakes_on_release():
+    a = _backend("a", 1)
+    pool = BackendPool([a])
+
+    async def main():
+        first = await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.05)
+        assert not waiter.done() # Capped at one
+        pool.release(first, ok=True)
+        # Woken by the release, not by the 1s re-check
+        return await asyncio.wait_for(waiter, timeout=0.5)
+
+    assert asyncio.run(main()) is a
+    assert a.in_flight == 1
+
+
+def test_outages_eject_after_n_failures():
+    a, b = _backend("a"), _backend("b")
+    pool = BackendPool([a, b], eject_after_failures=3, eject_seconds=30)
+
+    async def fail_on(target, error):
+        with pytest.raises(type(error)):
+            async with pool.lease() as backend:
+                assert backend is target
+                raise error
+
+    async def main():
+        for _ in range(3):
+            await fail_on(a, openai.APIConnectionError(request=REQUEST))
+        assert not a.healthy and b.healthy
+        assert (await pool.acquire()) is b
+
+    asyncio.run(main())
+    assert (a.total_failures, a.consecutive_failures) == (3, 3)
+
+
+def test_request_errors_and_cancellation_do_not_count():
+    a = _backend("a")
+    pool = BackendPool([a], eject_after_failures=1)
+
+    async def main():
+        for error in (_status_error(400), ValueError("context too long")):
+            with pytest.raises(type(error)):
+                async with pool.lease():
+                    raise error
+
+        async def cancelled():
+            async with pool.lease():
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(cancelled())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert a.healthy
+    assert (a.total_failures, a.in_flight) == (0, 0)
+
+
+def test_success_resets_the_failure_count():
+    a = _backend("a")
+    pool = BackendPool([a], eject_after_failures=2)
+
+    async def main():
+        pool.release(await pool.acquire(), ok=False)
+        pool.release(await pool.acquire(), ok=True)
+        pool.release(await pool.acquire(), ok=False)
+
+    asyncio.run(main())
+    assert a.healthy
+    assert a.consecutive_failures == 1
+
+
+def test_all_ejected_falls_back_to_the_first_to_recover():
+    a, b = _backend("a"), _backend("b")
+    pool = BackendPool([a, b], eject_after_failures=1, eject_seconds=30)
+
+    async def main():
+        pool.release(await pool.acquire(), ok=False) # a
+        pool.release(await pool.acquire(), ok=False) # b, ejected later than a
+        assert not a.healthy and not b.healthy
+        return await pool.acquire()
+
+    assert asyncio.run(main()) is a
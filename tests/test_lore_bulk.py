@@ -0,0 +1,81 @@
+import pytest
+from sqlmodel import Session, select
+
+from app.core import lore_bulk
+from app.core.database import LoreEmbedding, LoreEntry
+
+
+@pytest.fixture
+def lore(db_engine, monkeypatch):
+    monkeypatch.setattr(lore_bulk, "engine", db_engine)
+    with Session(db_engine) as session:
+        session.add(LoreEntry(keyword="castle", content="Old.", book="Places", secondary_keys="fort,keep", priority=2))
+        session.add(LoreEntry(keyword="moat", content="Water.", book="Places", keyword_en="Moat", content_en="Water."))
+        session.add(LoreEntry(keyword="dragon", content="Big.", book="Beasts"))
+        session.add(LoreEntry(keyword="wolf", content="Grey.", book="Beasts", enabled=False))
+        session.add(LoreEntry(keyword="moon", content="Round.", book="Sky"))
+        session.commit()
+    return db_engine
+
+
+def _entries(engine):
+    with Session(engine) as session:
+        return {e.keyword: e for e in session.exec(select(LoreEntry)).all()}
+
+
+def test_copy_book_suffixes_keywords_and_keeps_the_original_as_a_key(lore):
+    assert lore_bulk.copy_book("Places", "Places (copy)", " (copy)") == (2, 0)
+    entries = _entries(lore)
+    castle = entries["castle (copy)"]
+    assert castle.book == "Places (copy)"
+    assert castle.secondary_keys == "castle,fort,keep"
+    assert castle.priority == 2 and castle.content == "Old."
+    moat = entries["moat (copy)"]
+    assert moat.secondary_keys == "moat"
+    assert (moat.keyword_en, moat.content_en) == ("Moat", "Water.")
+    # The originals are untouched
+    assert entries["castle"].book == "Places"
+
+
+def test_copy_book_skips_copies_that_already_exist(lore):
+    lore_bulk.copy_book("Places", "Places (copy)", " (copy)")
+    with Session(lore) as session:
+        session.delete(session.get(LoreEntry, "moat (copy)"))
+        session.commit()
+    assert lore_bulk.copy_book("Places", "Places (copy)", " (copy)") == (1, 1)
+    assert lore_bulk.copy_book("Nowhere", "X", " (copy)") == (0, 0)
+
+
+def test_merge_books(lore):
+    assert lore_bulk.merge_books(["Beasts", "Sky", "Places"], "Places") == 3
+    assert {e.book for e in _entries(lore).values()} == {"Places"}
+    assert lore_bulk.merge_books(["Places"], "Places") == 0
+
+
+def test_move_entries_returns_the_source_books(lore):
+    moved, sources = lore_bulk.move_entries(["castle", "dragon", "unknown"], "Misc")
+    assert (moved, sources) == (2, {"Places", "Beasts"})
+    entries = _entries(lore)
+    assert entries["castle"].book == entries["dragon"].book == "Misc"
+    assert entries["moat"].book == "Places"
+    assert lore_bulk.move_entries([], "Misc") == (0, set())
+
+
+def test_set_enabled_for_a_book_or_a_subset(lore):
+    assert lore_bulk.set_enabled("Beasts", False, ["dragon", "moon"]) == 1 # moon is in another book
+    entries = _entries(lore)
+    assert not entries["dragon"].enabled and entries["moon"].enabled
+    assert lore_bulk.set_enabled("Beasts", True) == 2
+    assert all(e.enabled for e in _entries(lore).values() if e.book == "Beasts")
+
+
+def test_rename_and_delete_book(lore):
+    with Session(lore) as session:
+        session.add(LoreEmbedding(keyword="dragon", encoder="e", text_hash="h", vector=b""))
+        session.add(LoreEmbedding(keyword="moon", encoder="e", text_hash="h", vector=b""))
+        session.commit()
+    assert lore_bulk.rename_book("Beasts", "Sky") == 2
+    assert lore_bulk.delete_book("Sky") == 3
+    assert set(_entries(lore)) == {"castle", "moat"}
+    with Session(lore) as session:
+        assert session.exec(select(LoreEmbedding)).all() == []
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+from sqlmodel import Session
+
+from app.core.database import LoreEntry
+from app.core.lore_index import ALL_BOOKS, BookIndex, LoreIndex
+
+
+def _add(engine, *entries):
+    with Session(engine) as session:
+        for entry in entries:
+            session.merge(entry)
+        session.commit()
+
+
+def test_books_are_built_once_and_rebuilt_after_invalidation(db_engine):
+    _add(db_engine, LoreEntry(keyword="castle", content="Old."), LoreEntry(keyword="moon", content="Round.", book="Sky"))
+    cache = LoreIndex(db_engine)
+    assert cache.get("Default").match("the castle") == {"castle"}
+    cache.get("Default")
+    assert (cache.builds, cache.hits) == (1, 1)
+
+    _add(db_engine, LoreEntry(keyword="tower", content="Tall."))
+    # Still the cached index until the book is invalidated
+    assert cache.get("Default").match("tower") == set()
+    cache.invalidate(["Default"])
+    assert cache.get("Default").match("tower") == {"tower"}
+    assert cache.builds == 2
+
+
+def test_invalidating_a_book_keeps_the_others(db_engine):
+    _add(db_engine, LoreEntry(keyword="castle", content="Old."), LoreEntry(keyword="moon", content="Round.", book="Sky"))
+    cache = LoreIndex(db_engine)
+    cache.get("Default")
+    cache.get("Sky")
+    assert cache.get(ALL_BOOKS).match("castle moon") == {"castle", "moon"}
+    cache.invalidate(["Sky"])
+    assert cache.stats()["dirty"] == [ALL_BOOKS, "Sky"] # "All" depends on every book
+    cache.invalidate()
+    assert cache.stats()["dirty"] == [ALL_BOOKS, "Default", "Sky"]
+    cache.get("Default")
+    assert cache.stats()["dirty"] == [ALL_BOOKS, "Sky"]
+
+
+def test_disabled_entries_are_left_out(db_engine):
+    _add(db_engine, LoreEntry(keyword="castle", content="Old.", enabled=False), LoreEntry(keyword="moon", content="Round."))
+    index = LoreIndex(db_engine).get("Default")
+    assert index.entry_count == 1
+    assert index.match("castle moon") == {"moon"}
+
+
+def test_aget_serves_the_previous_index_while_rebuilding(db_engine, monkeypatch):
+    _add(db_engine, LoreEntry(keyword="castle", content="Old."))
+    cache = LoreIndex(db_engine)
+    release = threading.Event()
+    original_init = BookIndex.__init__
+
+    def slow_init(self, book, rows):
+        assert release.wait(5)
+        original_init(self, book, rows)
+
+    async def main():
+        release.set()
+        first = await cache.aget("Default") # Nothing to serve yet: waited for
+        assert first.match("castle") == {"castle"}
+
+        release.clear()
+        monkeypatch.setattr(BookIndex, "__init__", slow_init)
+        _add(db_engine, LoreEntry(keyword="tower", content="Tall."))
+        cache.invalidate(["Default"])
+        # The rebuild is stuck, yet lookups don't wait for it and only one is started
+        assert await cache.aget("Default") is first
+        assert await cache.aget("Default") is first
+        assert cache.stale_hits == 2
+        assert len(cache._refreshing) == 1
+
+        release.set()
+        await asyncio.gather(*cache._refreshing.values())
+        return await cache.aget("Default")
+
+    rebuilt = asyncio.run(main())
+    assert rebuilt.match("castle tower") == {"castle", "tower"}
+    assert cache.builds == 2
+    assert cache.stats()["dirty"] == []
+
+
+def test_write_during_a_build_leaves_the_book_dirty(db_engine, monkeypatch):
+    _add(db_engine, LoreEntry(keyword="castle", content="Old."))
+    cache = LoreIndex(db_engine)
+    original_init = BookIndex.__init__
+
+    def init_then_write(self, book, rows):
+        original_init(self, book, rows)
+        # Lands after the rows were read
+        _add(db_engine, LoreEntry(keyword="tower", content="Tall."))
+        cache.invalidate(["Default"])
+
+    monkeypatch.setattr(BookIndex, "__init__", init_then_write)
+    assert cache.get("Default").match("tower") == set()
+    monkeypatch.setattr(BookIndex, "__init__", original_init)
+    assert cache.stats()["dirty"] == ["Default"]
+    assert cache.get("Default").match("tower") == {"tower"}
@@ -0,0 +1,97 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from sqlmodel import Session, select
+
+from app.core.database import LoreEmbedding, LoreEntry
+from app.core.lore_embeddings import BookEmbeddings, HashedNgramEncoder, LoreEmbeddings
+
+DIM = 256
+
+
+def _add(engine, *entries):
+    with Session(engine) as session:
+        for entry in entries:
+            session.merge(entry)
+        session.commit()
+
+
+def _stored(engine):
+    with Session(engine) as session:
+        return {e.keyword: e.text_hash for e in session.exec(select(LoreEmbedding)).all()}
+
+
+def test_sync_only_reembeds_changed_entries(db_engine):
+    _add(db_engine,
+         LoreEntry(keyword="castle", content="An old stone castle."),
+         LoreEntry(keyword="moat", content="Dark water."),
+         LoreEntry(keyword="moon", content="Round.", book="Sky"))
+    cache = LoreEmbeddings(db_engine)
+    assert cache.get("Default", DIM).keywords == ["castle", "moat"]
+    assert (cache.embedded, cache.loaded) == (2, 0)
+    before = _stored(db_engine)
+    assert set(before) == {"castle", "moat"}
+
+    # A fresh cache (a restart) reads the vectors back instead of embedding them
+    cache = LoreEmbeddings(db_engine)
+    cache.get("Default", DIM)
+    assert (cache.embedded, cache.loaded) == (0, 2)
+
+    _add(db_engine, LoreEntry(keyword="moat", content="Dark, cold water."))
+    cache.invalidate(["Default"])
+    cache.get("Default", DIM)
+    assert (cache.embedded, cache.loaded) == (1, 3)
+    after = _stored(db_engine)
+    assert after["castle"] == before["castle"] and after["moat"] != before["moat"]
+
+
+def test_vectors_from_another_encoder_setup_are_recomputed(db_engine):
+    _add(db_engine, LoreEntry(keyword="castle", content="Old."))
+    LoreEmbeddings(db_engine).get("Default", DIM)
+    cache = LoreEmbeddings(db_engine)
+    cache.get("Default", DIM * 2)
+    assert (cache.embedded, cache.loaded) == (1, 0)
+
+
+def test_a_build_that_races_invalidate_is_not_kept(db_engine, monkeypatch):
+    _add(db_engine, LoreEntry(keyword="castle", content="Old."))
+    cache = LoreEmbeddings(db_engine)
+    original_sync = cache._sync
+
+    def sync_then_write(book, encoder):
+        embeddings = original_sync(book, encoder)
+        # A lore write lands after the rows were read
+        cache.invalidate(["Default"])
+        return embeddings
+
+    monkeypatch.setattr(cache, "_sync", sync_then_write)
+    assert cache.get("Default", DIM).keywords == ["castle"] # Still served to this caller
+    assert not cache.ready("Default", DIM)
+    monkeypatch.setattr(cache, "_sync", original_sync)
+    cache.get("Default", DIM)
+    assert cache.ready("Default", DIM)
+
+
+def test_search_respects_top_k_and_min_score():
+    encoder = HashedNgramEncoder(DIM)
+    texts = {
+        "castle": "castle tower walls",
+        "castles": "castle towers and walls",
+        "fortress": "castle fortress",
+        "moon": "the pale moon",
+    }
+    book = BookEmbeddings("Default", list(texts), [encoder.encode(t) for t in texts.values()], DIM)
+    query = encoder.encode("castle tower walls")
+
+    results = book.search(query, top_k=3, min_score=0.0)
+    assert len(results) == 3
+    assert results[0] == ("castle", 1.0)
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+    assert "moon" not in dict(results)
+
+    strict = book.search(query, top_k=10, min_score=0.5)
+    assert strict and all(score >= 0.5 for _, score in strict)
+    assert len(strict) < len(texts)
+    assert book.search(query, top_k=0, min_score=0.0) == []
+    assert BookEmbeddings("Empty", [], [], DIM).search(query, top_k=3, min_score=0.0) == []
@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.config import config
+
+if config is None:
+    pytest.skip("needs app/config.json (see app/config.json.sample)", allow_module_level=True)
+
+from app import main
+
+
+class UploadRequest:
+    """Streams the body in small chunks like an upload, so batches are flushed as entries come in."""
+    def __init__(self, body: bytes, chunk_size: int = 16):
+        self.body = body
+        self.chunk_size = chunk_size
+
+    async def stream(self):
+        for i in range(0, len(self.body), self.chunk_size):
+            yield self.body[i:i + self.chunk_size]
+
+
+def _world_info(count: int, invalid: int = 0) -> bytes:
+    entries = {str(i): {"uid": i, "key": f"key{i}", "content": f"Entry {i}."} for i in range(count)}
+    entries.update({str(count + i): {"uid": count + i, "key": "", "content": "No key."} for i in range(invalid)})
+    return json.dumps({"entries": entries}).encode("utf-8")
+
+
+def _import(body: bytes) -> dict:
+    return asyncio.run(main.import_lorebook(UploadRequest(body), book="Test"))
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(main, "MAX_IMPORT_ERRORS", 3)
+    monkeypatch.setattr(main, "IMPORT_BATCH_SIZE", 2)
+    monkeypatch.setattr(main, "_on_lore_changed", lambda *args: None)
+    monkeypatch.setattr(main.translation_backfill, "start", lambda *args: None)
+
+
+def test_batch_failures_are_capped_in_the_report(monkeypatch):
+    def fail(rows):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(main, "upsert_entries", fail)
+    report = _import(_world_info(10))
+    assert report["imported"] == 0
+    assert report["error_count"] == 10 # Complete, even though the list is cut short
+    assert len(report["errors"]) == 3
+    assert report["errors"][0] == {"keys": ["key0", "key1"], "error": "batch failed: database is locked"}
+
+
+def test_entry_and_batch_errors_share_the_cap(monkeypatch):
+    monkeypatch.setattr(main, "upsert_entries", lambda rows: len(rows))
+    report = _import(_world_info(2, invalid=5))
+    assert (report["imported"], report["error_count"], len(report["errors"])) == (2, 5, 3)
@@ -0,0 +1,103 @@
+import random
+
+from app.core.lore_index import AhoCorasick, BookIndex
+
+
+def _row(keyword, content="", keyword_en=None, secondary_keys=None, constant=False, content_en=None, priority=0, insertion_order=0):
+    return (keyword, keyword_en, secondary_keys, constant, content, content_en, priority, insertion_order)
+
+
+def test_aho_corasick_finds_overlapping_and_nested_patterns():
+    matcher = AhoCorasick({"he": {"he"}, "she": {"she"}, "his": {"his"}, "hers": {"hers"}})
+    assert matcher.find("ushers") == {"she", "he", "hers"}
+    assert matcher.find("this") == {"his"}
+    assert matcher.find("nothing") == set()
+
+
+def test_aho_corasick_matches_naive_search():
+    rng = random.Random(0)
+    words = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(30)]
+    matcher = AhoCorasick({w: {w} for w in words})
+    for _ in range(50):
+        text = "".join(rng.choice("abcd") for _ in range(40))
+        assert matcher.find(text) == {w for w in words if w in text}
+
+
+def test_aho_corasick_cjk_patterns():
+    matcher = AhoCorasick({"東京": {"Tokyo"}, "京都": {"Kyoto"}})
+    assert matcher.find("東京都に住む") == {"Tokyo", "Kyoto"}
+
+
+def test_book_index_matches_all_keys_case_insensitively():
+    index = BookIndex("Default", [
+        _row("りんご", "赤い果物", keyword_en="Apple", secondary_keys="fruit, ringo"),
+        _row("Castle", "An old castle."),
+    ])
+    assert index.match("I like APPLES") == {"りんご"}
+    assert index.match("Ringo in the castle") == {"りんご", "Castle"}
+    assert index.match("りんごジュース") == {"りんご"}
+    assert index.line("りんご") == "- りんご (Apple): 赤い果物\n"
+
+
+def test_book_index_prefers_english_content_but_searches_both():
+    index = BookIndex("Default", [_row("猫", "犬が好き", content_en="Likes dogs"), _row("犬", "Loyal")])
+    assert index.entry("猫") == (None, "Likes dogs")
+    assert index.search_text("猫") == "Likes dogs 犬が好き"
+
+
+class WordTokenizer:
+    name = "words"
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+def _tiers_book():
+    return BookIndex("Default", [
+        _row("rule", "Always polite.", constant=True),
+        _row("castle", "Home of the dragon."),
+        _row("garden", "Full of roses."),
+        _row("dragon", "Guards the treasure."),
+        _row("treasure", "Gold coins."),
+        _row("rose", "A red flower."),
+    ])
+
+
+def test_select_orders_tiers_and_follows_nested_keywords():
+    index = _tiers_book()
+    keywords, report = index.select("Tell me about the castle", depth=3, budget=0, tokenizer=WordTokenizer())
+    # Constants, direct hits, then entries found in the content of included ones
+    assert keywords == ["rule", "castle", "dragon", "treasure"]
+    assert report["included"] == 4
+    assert report["dropped_count"] == 0
+
+
+def test_select_depth_limits_recursion():
+    keywords, _ = _tiers_book().select("castle", depth=1, budget=0, tokenizer=WordTokenizer())
+    assert keywords == ["rule", "castle"]
+
+
+def test_select_semantic_matches_come_after_direct_hits():
+    keywords, _ = _tiers_book().select("the castle", depth=1, budget=0, tokenizer=WordTokenizer(), semantic=["rose", "castle", "unknown"])
+    assert keywords == ["rule", "castle", "rose"]
+
+
+def test_select_ranks_by_priority_then_insertion_order():
+    index = BookIndex("Default", [
+        _row("alpha", "a", priority=0, insertion_order=0),
+        _row("beta", "b", priority=5, insertion_order=9),
+        _row("gamma", "c", priority=5, insertion_order=1),
+    ])
+    keywords, _ = index.select("alpha beta gamma", depth=1, budget=0, tokenizer=WordTokenizer())
+    assert keywords == ["gamma", "beta", "alpha"]
+
+
+def test_select_drops_what_does_not_fit_the_budget():
+    index = _tiers_book()
+    tokenizer = WordTokenizer()
+    # Header (2) + rule (4) + castle (6) leave 1 token, too few for garden or dragon (5 each)
+    keywords, report = index.select("castle and garden", depth=3, budget=13, tokenizer=tokenizer)
+    assert keywords == ["rule", "castle"]
+    # Dropped entries aren't scanned, so rose and treasure never come up
+    assert [(d["keyword"], d["tier"]) for d in report["dropped"]] == [("garden", "direct"), ("dragon", "recursive")]
+    assert report["tokens"] == tokenizer.count(index.render(keywords)) <= 13
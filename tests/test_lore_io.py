@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from app.core import lore_io
+from app.core.lore_io import WorldInfoParseError, WorldInfoParser, entry_from_world_info, export_world_info, upsert_entries
+
+
+def _parse(data: bytes, chunk_size: int):
+    parser = WorldInfoParser()
+    entries = []
+    for i in range(0, len(data), chunk_size):
+        entries += parser.feed(data[i:i + chunk_size])
+    return entries + parser.close()
+
+
+SILLYTAVERN = {
+    "name": "Test book",
+    "entries": {
+        "0": {"uid": 0, "key": ["城", "castle"], "keysecondary": ["fort"], "content": "古い城。", "constant": True, "order": 3},
+        "1": {"uid": 1, "key": "moon, luna", "content": "Round.", "disable": True, "extensions": {"priority": 2}},
+    },
+    "description": "after the entries",
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 64, 100000])
+def test_parser_yields_the_same_entries_for_any_chunking(chunk_size):
+    data = json.dumps(SILLYTAVERN, ensure_ascii=False).encode("utf-8")
+    assert _parse(data, chunk_size) == list(SILLYTAVERN["entries"].values())
+
+
+def test_parser_accepts_lists_and_v1_data_and_bom():
+    entries = [{"key": ["a"], "content": "x"}, {"key": ["b"], "content": 1.5}]
+    assert _parse(json.dumps(entries).encode(), 3) == entries
+    assert _parse(b"\xef\xbb\xbf" + json.dumps({"data": entries}).encode(), 3) == entries
+
+
+def test_parser_reports_non_object_entries_and_truncation():
+    assert _parse(b'{"entries": [1, {"key": "a"}]}', 4) == [{"_invalid": "entry 0 is not an object"}, {"key": "a"}]
+    parser = WorldInfoParser()
+    assert parser.feed(b'{"entries": {"0": {"key": "a"}, "1": {"key"') == [{"key": "a"}]
+    with pytest.raises(WorldInfoParseError):
+        parser.close()
+    with pytest.raises(WorldInfoParseError):
+        _parse(b'"just a string"', 4)
+
+
+def test_entry_mapping():
+    first, second = (entry_from_world_info(raw, "Book") for raw in SILLYTAVERN["entries"].values())
+    assert first["keyword"] == "城"
+    assert first["secondary_keys"] == "castle,fort"
+    assert first["constant"] and first["enabled"]
+    assert first["insertion_order"] == 3
+    assert second["keyword"] == "moon" and second["secondary_keys"] == "luna"
+    assert not second["enabled"]
+    assert second["priority"] == 2
+    with pytest.raises(ValueError):
+        entry_from_world_info({"content": "no key"}, "Book")
+
+
+def test_export_round_trips_through_the_parser(db_engine, monkeypatch):
+    monkeypatch.setattr(lore_io, "engine", db_engine)
+    monkeypatch.setattr(lore_io, "EXPORT_PAGE_SIZE", 2) # Several pages
+    rows = [entry_from_world_info(raw, "Book") for raw in SILLYTAVERN["entries"].values()]
+    rows += [
+        {**entry_from_world_info({"key": f"key{i}", "content": f"Entry {i} \"quoted\"\n"}, "Book"), "keyword_en": f"en{i}"}
+        for i in range(5)
+    ]
+    rows.append(entry_from_world_info({"key": "elsewhere", "content": "Other book."}, "Other"))
+    assert upsert_entries([dict(row) for row in rows]) == len(rows)
+
+    exported = "".join(export_world_info("Book")).encode("utf-8")
+    reimported = [entry_from_world_info(raw, "Book") for raw in _parse(exported, 7)]
+    expected = sorted((row for row in rows if row["book"] == "Book"), key=lambda row: row["keyword"])
+    assert reimported == expected
+    assert len(json.loads(exported)["entries"]) == len(expected)
@@ -0,0 +1,70 @@
+from app.core.prompt_budget import ContextBudget, HeuristicTokenizer, MESSAGE_OVERHEAD_TOKENS
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word, so budgets are easy to reason about."""
+    name = "words"
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+def _history(n: int):
+    return [{"role": "user", "content": f"message number {i}"} for i in range(n)]
+
+
+def test_everything_fits_untouched():
+    budget = ContextBudget(1000, WordTokenizer())
+    message, sections, history, report = budget.fit(
+        "system prompt", "hello there", [("lore", "[Lore]\n- a: b", "start")], _history(3)
+    )
+    assert message == "hello there"
+    assert sections == {"lore": "[Lore]\n- a: b"}
+    assert len(history) == 3
+    assert not any(s["trimmed"] for s in report["sections"].values())
+    assert report["total"] <= report["budget"]
+
+
+def test_history_keeps_the_newest_messages():
+    # system 2+4, message 1+4; each history message is 3+4
+    budget = ContextBudget(11 + 7 * 2, WordTokenizer())
+    _, _, history, report = budget.fit("system prompt", "hi", [], _history(5))
+    assert [m["content"] for m in history] == ["message number 3", "message number 4"]
+    assert report["sections"]["history"]["messages_dropped"] == 3
+    assert report["total"] == 25
+
+
+def test_sections_trim_by_lines_and_keep_their_header():
+    tokenizer = WordTokenizer()
+    lore = "[Lore]\none\ntwo\nthree\nfour\nfive\nsix"
+    memory = "[Memory]\nold\nnewer\nnewest"
+    # 11 for system + message, then 6 for the sections (trimming counts a line's words + 1)
+    budget = ContextBudget(11 + 6, tokenizer)
+    _, sections, _, report = budget.fit("system prompt", "hi", [("lore", lore, "start"), ("memory", memory, "end")], [])
+    # Lore comes first and keeps its first lines; memory gets what is left, newest lines
+    assert sections["lore"] == "[Lore]\none\ntwo"
+    assert sections["memory"] == "[Memory]\nnewest"
+    assert report["sections"]["lore"]["trimmed"]
+
+
+def test_section_without_room_is_dropped():
+    budget = ContextBudget(11, WordTokenizer())
+    _, sections, _, report = budget.fit("system prompt", "hi", [("lore", "[Lore]\n- one", "start")], [])
+    assert sections == {}
+    assert report["sections"]["lore"]["tokens"] == 0
+
+
+def test_oversized_message_is_cut_to_fit():
+    tokenizer = HeuristicTokenizer()
+    budget = ContextBudget(100, tokenizer)
+    message, _, _, report = budget.fit("system", "x" * 4000, [], [])
+    assert 0 < len(message) < 4000
+    assert tokenizer.count(message) + MESSAGE_OVERHEAD_TOKENS + report["sections"]["system"]["tokens"] <= 100
+    assert report["sections"]["message"]["trimmed"]
+
+
+def test_heuristic_counts_cjk_per_character():
+    tokenizer = HeuristicTokenizer()
+    assert tokenizer.count("こんにちは") == 5
+    assert tokenizer.count("abcdefgh") == 2
+    assert tokenizer.count("") == 0
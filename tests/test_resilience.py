@@ -0,0 +1,71 @@
+import pytest
+
+from app.core import resilience
+from app.core.resilience import CircuitBreaker, CircuitOpenError, backoff_delay
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_backoff_is_jittered_within_the_capped_exponential(monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    assert [backoff_delay(attempt, 0.5) for attempt in range(6)] == [0.5, 1.0, 2.0, 4.0, 8.0, 10.0]
+    assert backoff_delay(10, 0.5, cap=3.0) == 3.0
+    monkeypatch.undo()
+    assert all(0 <= backoff_delay(3, 0.5) <= 4.0 for _ in range(100))
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("llm", failure_threshold=3, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success() # Resets the count
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.before_call()
+    assert e.value.retry_after == 30
+    assert breaker.rejected == 1
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker("llm", failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.check() # Doesn't use up the trial
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_trial_reopens(clock):
+    breaker = CircuitBreaker("llm", failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock[0] += 30
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 1
+    clock[0] += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_abandoned_trial_expires(clock):
+    breaker = CircuitBreaker("llm", failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock[0] += 30
+    breaker.before_call() # Never reports back
+    clock[0] += 30
+    breaker.before_call()
@@ -0,0 +1,56 @@
+import pytest
+
+from app.core.config import config, ResponseCacheConfig
+
+if config is None:
+    pytest.skip("needs app/config.json (see app/config.json.sample)", allow_module_level=True)
+
+from app.core.llm import ResponseCache
+
+MESSAGES = [{"role": "system", "content": "You are a host."}, {"role": "user", "content": "Hello"}]
+
+
+def test_key_is_stable_and_covers_its_inputs():
+    key = ResponseCache.make_key(MESSAGES, ("model-a",), 0.7)
+    assert key == ResponseCache.make_key([dict(m) for m in MESSAGES], ("model-a",), 0.7)
+    assert key != ResponseCache.make_key(MESSAGES[:1], ("model-a",), 0.7)
+    assert key != ResponseCache.make_key(MESSAGES, ("model-b",), 0.7)
+    assert key != ResponseCache.make_key(MESSAGES, ("model-a", "model-b"), 0.7)
+    assert key != ResponseCache.make_key(MESSAGES, ("model-a",), 0.8)
+
+
+def test_key_ignores_dict_key_order():
+    reordered = [{"content": m["content"], "role": m["role"]} for m in MESSAGES]
+    assert ResponseCache.make_key(reordered, ("m",), 0.7) == ResponseCache.make_key(MESSAGES, ("m",), 0.7)
+
+
+def test_get_put_and_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.core.llm.time.monotonic", lambda: now[0])
+    cache = ResponseCache(ResponseCacheConfig(enabled=True, ttl_seconds=10))
+    cache.put("k", "reply")
+    assert cache.get("k") == "reply"
+    now[0] += 10
+    assert cache.get("k") is None
+    assert cache.snapshot()["entries"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used_by_size():
+    # Each entry is len(key) + len(text) = 1 + 9 bytes
+    cache = ResponseCache(ResponseCacheConfig(enabled=True, max_bytes=25))
+    cache.put("a", "x" * 9)
+    cache.put("b", "x" * 9)
+    cache.get("a")
+    cache.put("c", "x" * 9)
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.bytes == 20
+    assert cache.evictions == 1
+
+
+def test_oversized_reply_is_not_stored():
+    cache = ResponseCache(ResponseCacheConfig(enabled=True, max_bytes=8))
+    cache.put("k", "x" * 100)
+    assert cache.get("k") is None
+    assert cache.bytes == 0
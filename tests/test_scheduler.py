@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from app.core.config import config
+
+if config is None:
+    pytest.skip("needs app/config.json (see app/config.json.sample)", allow_module_level=True)
+
+from app.core.room_manager import GenerationScheduler
+
+
+async def _run_order(scheduler: GenerationScheduler, requests):
+    """Queues (visitor_id, priority) requests behind a held slot and returns the order they were served in."""
+    served = []
+    hold = asyncio.Event()
+
+    async def holder():
+        async with scheduler.slot("holder"):
+            await hold.wait()
+
+    async def request(visitor_id, priority):
+        async with scheduler.slot(visitor_id, priority):
+            served.append(visitor_id)
+
+    holding = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    tasks = []
+    for visitor_id, priority in requests:
+        tasks.append(asyncio.create_task(request(visitor_id, priority)))
+        await asyncio.sleep(0) # Enqueue in this order
+    assert scheduler.queue_depth() == len(requests)
+    hold.set()
+    await asyncio.gather(holding, *tasks)
+    return served
+
+
+def test_visitors_are_served_round_robin():
+    scheduler = GenerationScheduler(max_concurrent=1)
+    visitor = GenerationScheduler.PRIORITY_VISITOR
+    served = asyncio.run(_run_order(scheduler, [("a", visitor), ("a", visitor), ("a", visitor), ("b", visitor), ("c", visitor)]))
+    assert served == ["a", "b", "c", "a", "a"]
+
+
+def test_host_jumps_the_queue():
+    scheduler = GenerationScheduler(max_concurrent=1)
+    visitor, host = GenerationScheduler.PRIORITY_VISITOR, GenerationScheduler.PRIORITY_HOST
+    served = asyncio.run(_run_order(scheduler, [("a", visitor), ("b", visitor), ("host", host)]))
+    assert served == ["host", "a", "b"]
+
+
+def test_concurrency_limit():
+    scheduler = GenerationScheduler(max_concurrent=2)
+    peak = 0
+
+    async def request(visitor_id):
+        nonlocal peak
+        async with scheduler.slot(visitor_id):
+            peak = max(peak, scheduler.active)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(request(f"v{i}") for i in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert scheduler.active == 0
+    assert scheduler.admitted == 6
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    scheduler = GenerationScheduler(max_concurrent=1)
+
+    async def main():
+        served = []
+        hold = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("holder"):
+                await hold.wait()
+
+        async def request(visitor_id):
+            async with scheduler.slot(visitor_id):
+                served.append(visitor_id)
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        leaving = asyncio.create_task(request("a"))
+        staying = asyncio.create_task(request("b"))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth() == 1
+        hold.set()
+        await asyncio.gather(holding, staying)
+        return served
+
+    assert asyncio.run(main()) == ["b"]
+    assert scheduler.active == 0
@@ -0,0 +1,121 @@
+import html
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.core import database
+from app.core.database import ConversationLog, LoreEntry
+from app.core.search import _like, highlight, parse_query, search_logs, search_lore
+
+
+def test_terms_become_quoted_phrases():
+    assert parse_query("dragon castle") == ('"dragon" "castle"', [])
+
+
+def test_operator_syntax_is_taken_literally():
+    expression, short = parse_query('NOT dragon* "quoted" a OR b')
+    assert expression == '"NOT" "dragon*" """quoted"""'
+    assert short == ["a", "OR", "b"]
+
+
+def test_short_terms_fall_back_to_like():
+    assert parse_query("城 に 東京") == ("", ["城", "に", "東京"])
+    assert parse_query("   ") == ("", [])
+
+
+def test_like_pattern_escapes_wildcards():
+    assert _like("100%_a\\b") == "%100\\%\\_a\\\\b%"
+
+
+def test_highlight_escapes_html_around_the_markers():
+    assert highlight("<b>\x02dragon\x03</b>") == "&lt;b&gt;<mark>dragon</mark>&lt;/b&gt;"
+    assert highlight(None) == ""
+
+
+@pytest.fixture
+def fts_engine(db_engine, monkeypatch):
+    monkeypatch.setattr(database, "engine", db_engine)
+    monkeypatch.setattr(database, "fts_available", False)
+    database._create_search_tables()
+    if not database.fts_available:
+        pytest.skip("SQLite without FTS5 trigram support")
+    return db_engine
+
+
+def _log(session, message, sender="visitor", visitor_id="v1"):
+    # Stored the way the handlers store it (room_manager.sanitize)
+    row = ConversationLog(session_id="s1", visitor_id=visitor_id, sender=sender, message=html.escape(message))
+    session.add(row)
+    session.commit()
+    return row.id
+
+
+def test_log_search_matches_and_snippets_unescaped_text(fts_engine):
+    with Session(fts_engine) as session:
+        _log(session, 'Tom & Jerry said "don\'t" <b>')
+        _log(session, "Nothing to see", sender="host")
+    total, results = search_logs("don't")
+    assert total == 1
+    # Escaped once, for the dashboard (the snippet is a window of SNIPPET_TOKENS trigrams)
+    assert results[0]["snippet"].endswith("said &quot;<mark>don&#x27;t</mark>&quot; &lt;b&gt;")
+    # Entity names aren't part of the indexed text
+    assert search_logs("amp")[0] == 0
+    assert search_logs("quot")[0] == 0
+    # Short terms (LIKE) see the unescaped text too
+    assert search_logs("&")[0] == 1
+    assert search_logs("see", sender="visitor")[0] == 0
+
+
+def test_log_index_follows_updates_and_deletes(fts_engine):
+    with Session(fts_engine) as session:
+        log_id = _log(session, "original words")
+        row = session.get(ConversationLog, log_id)
+        row.message = html.escape("rewritten & translated")
+        session.add(row)
+        session.commit()
+        assert search_logs("original")[0] == 0
+        assert search_logs("translated")[0] == 1
+        session.delete(row)
+        session.commit()
+    assert search_logs("translated")[0] == 0
+    with fts_engine.connect() as conn:
+        # The index itself is consistent with its content view
+        conn.execute(text("INSERT INTO log_fts(log_fts, rank) VALUES ('integrity-check', 1)"))
+
+
+def test_lore_search_ranks_keyword_hits_first(fts_engine):
+    with Session(fts_engine) as session:
+        session.add(LoreEntry(keyword="dragon", content="A large beast.", book="Beasts"))
+        session.add(LoreEntry(keyword="castle", content="Where the dragon sleeps.", book="Places"))
+        session.add(LoreEntry(keyword="moat", content="Water.", secondary_keys="dragonfly pond", book="Places"))
+        # bm25 needs documents without the term to give it any weight
+        for i in range(10):
+            session.add(LoreEntry(keyword=f"filler{i}", content="Nothing relevant.", book="Other"))
+        session.commit()
+    total, results = search_lore("dragon")
+    assert total == 3
+    assert [r["keyword"] for r in results] == ["dragon", "moat", "castle"]
+    assert results[0]["score"] > results[-1]["score"]
+    assert search_lore("dragon", book="Places")[0] == 2
+
+    with Session(fts_engine) as session:
+        session.delete(session.get(LoreEntry, "dragon"))
+        entry = session.get(LoreEntry, "castle")
+        entry.content = "Empty now."
+        session.add(entry)
+        session.commit()
+    assert [r["keyword"] for r in search_lore("dragon")[1]] == ["moat"]
+
+
+def test_existing_escaped_index_is_rebuilt_over_the_view(db_engine, monkeypatch):
+    monkeypatch.setattr(database, "engine", db_engine)
+    with db_engine.begin() as conn:
+        # How the first version created it: straight over the escaped column
+        conn.exec_driver_sql(
+            "CREATE VIRTUAL TABLE log_fts USING fts5(message, content='conversationlog', content_rowid='id', tokenize='trigram')"
+        )
+    with Session(db_engine) as session:
+        _log(session, "don't stop")
+    database._create_search_tables()
+    assert search_logs("don't")[0] == 1
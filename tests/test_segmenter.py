@@ -0,0 +1,55 @@
+import pytest
+
+from app.core.segmenter import SentenceSegmenter, split_sentences
+
+
+def _stream(text: str, size: int):
+    segmenter = SentenceSegmenter()
+    segments = []
+    for i in range(0, len(text), size):
+        segments += segmenter.feed(text[i:i + size])
+    return segments + segmenter.flush()
+
+
+def test_splits_on_terminators_followed_by_space():
+    assert split_sentences("Hello there. How are you? Fine!") == ["Hello there. ", "How are you? ", "Fine!"]
+
+
+def test_cjk_terminators_need_no_space():
+    assert split_sentences("こんにちは。元気ですか？はい！") == ["こんにちは。", "元気ですか？", "はい！"]
+
+
+def test_closing_quotes_stay_with_their_sentence():
+    assert split_sentences("「行こう。」と言った。") == ["「行こう。」", "と言った。"]
+    assert split_sentences('He said "stop." Then left.') == ['He said "stop." ', "Then left."]
+
+
+def test_abbreviations_and_numbers_do_not_end_sentences():
+    assert split_sentences("Dr. Smith paid 3.14 dollars, e.g. coins. Done.") == [
+        "Dr. Smith paid 3.14 dollars, e.g. coins. ", "Done."
+    ]
+
+
+def test_newline_ends_a_sentence():
+    assert split_sentences("first line\nsecond line") == ["first line\n", "second line"]
+
+
+def test_runs_of_punctuation_stay_together():
+    assert split_sentences("Really?! Yes... ok") == ["Really?! ", "Yes... ", "ok"]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_streamed_cuts_match_whole_text(size):
+    text = "Mr. Tanaka arrived.  「こんにちは！」と言った。\nIt's 3.5 km away... Right? Yes."
+    assert _stream(text, size) == split_sentences(text)
+    assert "".join(_stream(text, size)) == text
+
+
+def test_feed_waits_for_what_follows_a_terminator():
+    segmenter = SentenceSegmenter()
+    assert segmenter.feed("Hello.") == []
+    assert segmenter.feed(" ") == []
+    assert segmenter.feed("Next") == ["Hello. "]
+    assert segmenter.flush() == ["Next"]
+    # Reusable after a flush
+    assert segmenter.feed("終わり。次") == ["終わり。"]
@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.core.config import config
+
+if config is None:
+    pytest.skip("needs app/config.json (see app/config.json.sample)", allow_module_level=True)
+
+from app.core import database
+from app.core.database import CharacterCard
+from app.core.llm import LLMClient
+
+
+@pytest.fixture
+def client(db_engine, monkeypatch):
+    monkeypatch.setattr(database, "engine", db_engine)
+    with Session(db_engine) as session:
+        card = CharacterCard(name="Mika", description="A librarian.", personality="Calm", scenario="Library", mes_example="")
+        session.add(card)
+        session.commit()
+        card_id = card.id
+    client = LLMClient()
+    client.character = config.character.model_copy(update={"active_card_id": card_id})
+    return client
+
+
+def _count_queries(engine):
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+    return queries
+
+
+def test_warm_cache_does_not_touch_the_db(client, db_engine):
+    prompt = client.compile_system_prompt()
+    assert "You are Mika." in prompt
+    queries = _count_queries(db_engine)
+    for _ in range(3):
+        assert client.compile_system_prompt() == prompt
+    assert queries == []
+
+
+def test_invalidation_and_config_edits_recompile(client, db_engine):
+    client.compile_system_prompt()
+    with Session(db_engine) as session:
+        card = session.get(CharacterCard, client.character.active_card_id)
+        card.description = "A retired librarian."
+        session.add(card)
+        session.commit()
+    # Served from the cache until someone invalidates it
+    assert "A retired librarian." not in client.compile_system_prompt()
+    client.invalidate_prompt_cache()
+    assert "A retired librarian." in client.compile_system_prompt()
+
+    client.character = client.character.model_copy(update={"persona": "Whispers."})
+    assert "Whispers." in client.compile_system_prompt()
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from sqlmodel import Session, select
+
+from app.core.config import config, TranslationBackendConfig, TranslationCacheConfig
+
+if config is None:
+    pytest.skip("needs app/config.json (see app/config.json.sample)", allow_module_level=True)
+
+from app.core import translator as translator_module
+from app.core.database import TranslationCacheEntry
+from app.core.translation_backends import BackendChain, GuardedBackend, OfflineBackend, StubBackend, TranslationBackend
+from app.core.translator import TranslationCache, TranslatorService
+
+
+class BrokenBackend(TranslationBackend):
+    name = "broken"
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        raise ConnectionError("offline")
+
+
+class EchoBackend(TranslationBackend):
+    name = "echo"
+
+    def __init__(self):
+        self.calls = 0
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        self.calls += 1
+        return f"<{text}>"
+
+
+def _guard(backend, **settings):
+    return GuardedBackend(backend, TranslationBackendConfig(name=backend.name, **settings))
+
+
+@pytest.fixture
+def service(db_engine, monkeypatch):
+    monkeypatch.setattr(translator_module, "engine", db_engine)
+    service = TranslatorService()
+    service.cache = TranslationCache(TranslationCacheConfig())
+    return service
+
+
+def _offline(glossary):
+    backend = OfflineBackend()
+    backend._glossary = glossary
+    return backend
+
+
+def test_fails_over_to_the_next_backend():
+    echo = EchoBackend()
+    chain = BackendChain([_guard(BrokenBackend()), _guard(echo)])
+    assert chain.translate("猫", "auto", "en") == ("<猫>", echo)
+    assert chain.backends[0].failures == 1
+
+
+def test_breaker_skips_a_failing_backend():
+    broken = _guard(BrokenBackend(), breaker_failure_threshold=2)
+    chain = BackendChain([broken, _guard(EchoBackend())])
+    for _ in range(4):
+        chain.translate("猫", "auto", "en")
+    assert broken.calls == 2
+    assert broken.breaker.state == "open"
+
+
+def test_real_translations_are_cached(service):
+    echo = EchoBackend()
+    service.backends = BackendChain([_guard(echo)])
+    assert service.translate("猫", target_lang="en") == "<猫>"
+    assert service.translate("猫", target_lang="en") == "<猫>"
+    assert echo.calls == 1
+
+
+@pytest.mark.parametrize("fallback", [_offline({"猫": "cat"}), StubBackend()])
+def test_fallback_results_are_not_cached(service, fallback):
+    service.backends = BackendChain([_guard(BrokenBackend()), _guard(fallback)])
+    translated = service.translate("猫", target_lang="en")
+    assert translated in ("cat", "[en] 猫")
+    assert service.cache.get("猫", "auto", "en") is None
+    # Once the real backend answers again, its translation is used and cached
+    service.backends = BackendChain([_guard(EchoBackend())])
+    assert service.translate("猫", target_lang="en") == "<猫>"
+    assert service.cache.get("猫", "auto", "en") == "<猫>"
+
+
+def test_untranslatable_text_comes_back_unchanged_and_uncached(service):
+    service.backends = BackendChain([_guard(BrokenBackend())])
+    assert service.translate("猫", target_lang="en") == "猫"
+    assert service.cache.get("猫", "auto", "en") is None
+
+
+def test_streamed_preview_sentences_stay_out_of_the_database(service, db_engine):
+    service.backends = BackendChain([_guard(EchoBackend())])
+
+    async def deltas():
+        for delta in ["猫です。", "犬", "です。"]:
+            yield delta
+
+    async def main():
+        return [segment async for segment in service.translate_stream(deltas(), "en")]
+
+    assert "".join(asyncio.run(main())) == "<猫です。><犬です。>"
+    assert service.cache.snapshot()["writes"] == 0
+    with Session(db_engine) as session:
+        assert session.exec(select(TranslationCacheEntry)).all() == []
+    # Still served from memory within this process
+    assert service.cache.get("猫です。", "auto", "en") == "<猫です。>"
+    # Whole replies are still persisted
+    assert service.translate("鳥です。", target_lang="en") == "<鳥です。>"
+    with Session(db_engine) as session:
+        assert len(session.exec(select(TranslationCacheEntry)).all()) == 1
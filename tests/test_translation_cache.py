@@ -0,0 +1,71 @@
+import pytest
+from sqlmodel import Session, select
+
+from app.core.config import config, TranslationCacheConfig
+
+if config is None:
+    pytest.skip("needs app/config.json (see app/config.json.sample)", allow_module_level=True)
+
+from app.core import translator as translator_module
+from app.core.database import LoreEntry, TranslationCacheEntry
+from app.core.translator import TranslationCache
+
+
+@pytest.fixture
+def cache(db_engine, monkeypatch):
+    monkeypatch.setattr(translator_module, "engine", db_engine)
+    return TranslationCache(TranslationCacheConfig(memory_entries=2))
+
+
+def _last_used(engine):
+    with Session(engine) as session:
+        return session.exec(select(TranslationCacheEntry.last_used)).one()
+
+
+def test_database_tier_survives_the_memory_tier(cache):
+    cache.put("猫", "auto", "en", "cat")
+    cache.put("犬", "auto", "en", "dog")
+    cache.put("鳥", "auto", "en", "bird") # Evicts 猫 from memory
+    assert cache.get("猫", "auto", "en") == "cat"
+    assert cache.get("猫", "auto", "ja") is None
+    snapshot = cache.snapshot()
+    assert (snapshot["db_hits"], snapshot["misses"], snapshot["memory_entries"]) == (1, 1, 2)
+
+
+def test_hits_are_flushed_in_batches(cache, db_engine):
+    cache.put("猫", "auto", "en", "cat")
+    written = _last_used(db_engine)
+    for _ in range(10):
+        assert cache.get("猫", "auto", "en") == "cat"
+    # Recorded in memory only
+    assert _last_used(db_engine) == written
+    assert cache.snapshot()["pending_touches"] == 1
+    assert cache.flush() == 1
+    assert _last_used(db_engine) > written
+    assert cache.flush() == 0
+
+
+def test_flush_happens_once_enough_keys_were_hit(cache, monkeypatch):
+    monkeypatch.setattr(TranslationCache, "FLUSH_EVERY_TOUCHES", 3)
+    for word in ("a", "b", "c"):
+        cache.put(word, "auto", "ja", word.upper())
+    cache.get("a", "auto", "ja")
+    cache.get("b", "auto", "ja")
+    assert cache.snapshot()["pending_touches"] == 2
+    cache.get("c", "auto", "ja")
+    assert cache.snapshot()["pending_touches"] == 0
+
+
+def test_warm_from_lore_upserts_in_one_go(cache, db_engine):
+    with Session(db_engine) as session:
+        session.add(LoreEntry(keyword="城", keyword_en="Castle", content="古い城", content_en="An old castle"))
+        session.add(LoreEntry(keyword="月", content="丸い")) # Nothing translated yet
+        session.commit()
+    cache.put("城", "auto", "en", "Fortress") # Replaced by the lore translation
+    assert cache.warm_from_lore() == 2
+    assert cache.warm_from_lore() == 2 # Idempotent
+    cache.configure(TranslationCacheConfig(memory_entries=0)) # Only the table is left
+    assert cache.get("城", "auto", "en") == "Castle"
+    assert cache.get("古い城", "auto", "en") == "An old castle"
+    with Session(db_engine) as session:
+        assert len(session.exec(select(TranslationCacheEntry)).all()) == 2